@@ -0,0 +1,162 @@
+"""
+内存预算准入控制模块
+每个需要全分辨率解码或变换的请求按探测到的图片尺寸估算内存占用，
+在加权信号量上预留相应的字节数后才能提交给图像处理引擎；预算用尽时排队等待，
+等待超时返回 503。小图在预算允许时可以越过排队中的大图直接执行，不会被无谓地限流
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List
+
+from executors import ExecutorBusy
+
+
+# 队首请求等待超过该时间（秒）后不再允许后面的小请求插队，避免大图饿死
+HEAD_OF_LINE_GRACE = 2.0
+# 默认最长排队时间（秒），超时返回 503
+DEFAULT_MAX_WAIT = 30.0
+
+
+def default_memory_budget() -> int:
+    """默认内存预算：物理内存的 1/4，最多 4GB；无法获取物理内存时为 2GB"""
+    try:
+        physical = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 2 * 1024 ** 3
+    return min(4 * 1024 ** 3, physical // 4)
+
+
+def estimate_image_bytes(width: int, height: int, channels: int = 3) -> int:
+    """解码后 8 位图像占用的字节数"""
+    return width * height * channels
+
+
+def estimate_warp_bytes(source_width: int, source_height: int, output_width: int, output_height: int) -> int:
+    """
+    估算一次 解码 -> 透视变换 -> 编码 的峰值内存
+
+    包括解码后的原图、变换输出，以及编码缓冲区（按输出大小的一半预留）。
+    """
+    output = estimate_image_bytes(output_width, output_height)
+    return estimate_image_bytes(source_width, source_height) + output + output // 2
+
+
+def estimate_regions_bytes(source_width: int, source_height: int, output_sizes) -> int:
+    """估算从同一张原图裁剪多个区域的峰值内存：原图只解码一次，各区域可能同时变换"""
+    return estimate_image_bytes(source_width, source_height) + sum(
+        estimate_warp_bytes(0, 0, width, height) for width, height in output_sizes
+    )
+
+
+class _Waiter:
+    __slots__ = ("nbytes", "future", "enqueued_at")
+
+    def __init__(self, nbytes: int, future: asyncio.Future):
+        self.nbytes = nbytes
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class MemoryAdmission:
+    """
+    按字节加权的异步信号量
+
+    单个请求的估算超过总预算时按总预算计，即在没有其他请求占用时单独执行。
+    只能在事件循环线程中使用。
+    """
+
+    def __init__(self, budget: int, max_wait: float = DEFAULT_MAX_WAIT):
+        """
+        Args:
+            budget: 内存预算（字节）
+            max_wait: 最长排队时间（秒）
+        """
+        self.budget = budget
+        self.max_wait = max_wait
+        self.in_use = 0
+        self._waiters: List[_Waiter] = []
+        self.admitted = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        """
+        预留 nbytes 字节，退出时释放
+
+        Raises:
+            ExecutorBusy: 排队超过 max_wait
+        """
+        nbytes = min(max(0, nbytes), self.budget)
+        await self._acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.in_use -= nbytes
+            self._dispatch()
+
+    def stats(self) -> dict:
+        """准入统计信息"""
+        return {
+            "budget": self.budget,
+            "in_use": self.in_use,
+            "queue_depth": len(self._waiters),
+            "queued_bytes": sum(waiter.nbytes for waiter in self._waiters),
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait": self.max_observed_wait,
+        }
+
+    async def _acquire(self, nbytes: int):
+        if not self._waiters and self.in_use + nbytes <= self.budget:
+            self.in_use += nbytes
+            self._record_wait(0.0)
+            return
+
+        waiter = _Waiter(nbytes, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # 超时的同时已被放行
+                return
+            self._waiters.remove(waiter)
+            self.timeouts += 1
+            self._dispatch()
+            raise ExecutorBusy("memory")
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                # 已经预留的字节需要归还
+                self.in_use -= nbytes
+            else:
+                self._waiters.remove(waiter)
+            self._dispatch()
+            raise
+
+    def _dispatch(self):
+        """按顺序放行能放下的请求；队首等待不久时，后面放得下的小请求可以先执行"""
+        now = time.monotonic()
+        index = 0
+        while index < len(self._waiters):
+            waiter = self._waiters[index]
+            if self.in_use + waiter.nbytes <= self.budget:
+                self._waiters.pop(index)
+                self.in_use += waiter.nbytes
+                self._record_wait(now - waiter.enqueued_at)
+                waiter.future.set_result(None)
+                continue
+            if index == 0 and now - waiter.enqueued_at > HEAD_OF_LINE_GRACE:
+                # 队首已等待较久，后面的请求不再插队，让出的内存留给队首
+                break
+            index += 1
+
+    def _record_wait(self, wait: float):
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_observed_wait = max(self.max_observed_wait, wait)
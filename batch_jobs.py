@@ -0,0 +1,179 @@
+"""
+批量裁剪任务模块
+固定机位拍摄的连续帧（例如三脚架录制的课件）使用同一组模板角点，
+一次请求提交整批文件，由后台任务按有限并发逐帧交给图像处理引擎，
+通过任务状态接口和 SSE 事件报告进度
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from executors import ExecutorBusy
+
+
+# 内存中最多保留的任务数，超出时丢弃最早结束的任务
+MAX_BATCH_JOBS = 50
+# 引擎繁忙时单帧最多重试的次数
+MAX_BUSY_RETRIES = 30
+
+
+class FrameSkipped(Exception):
+    """帧不满足处理条件（文件不存在、被其他操作员领取等），跳过而不计为失败"""
+
+
+class BatchJob:
+    """批量裁剪任务状态"""
+
+    def __init__(self, files: List[str]):
+        self.id = uuid.uuid4().hex
+        self.files = files
+        self.state = "queued"  # queued / running / done / cancelled / failed
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.outputs: List[dict] = []
+        self.errors: Dict[str, str] = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "cancelled", "failed")
+
+    def snapshot(self, details: bool = True) -> dict:
+        """
+        任务状态快照
+
+        Args:
+            details: 是否包含每帧的输出和错误（SSE 事件中不包含）
+        """
+        processed = self.completed + self.failed + self.skipped
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        data = {
+            "job_id": self.id,
+            "state": self.state,
+            "total": len(self.files),
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "progress": processed / len(self.files) * 100 if self.files else 100,
+            "elapsed": elapsed,
+            "frames_per_second": self.completed / elapsed if elapsed > 0 else 0.0,
+        }
+        if details:
+            data["outputs"] = self.outputs
+            data["errors"] = self.errors
+        return data
+
+
+class BatchJobManager:
+    """
+    批量任务管理
+
+    任务只保存在当前进程内存中；多 worker 部署时，状态需要向创建任务的 worker 查询。
+    """
+
+    def __init__(self, max_jobs: int = MAX_BATCH_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+
+    def create(self, files: List[str]) -> BatchJob:
+        """创建任务，并丢弃超出数量上限的已结束任务"""
+        job = BatchJob(files)
+        self._jobs[job.id] = job
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self._jobs.get(job_id)
+
+    def start(self, job: BatchJob, process: Callable[[str], Awaitable[dict]], concurrency: int,
+              on_progress: Optional[Callable[[BatchJob], None]] = None):
+        """
+        在事件循环中启动任务
+
+        Args:
+            job: 任务
+            process: 处理单帧的协程函数，返回该帧的输出信息；抛出 FrameSkipped 表示跳过
+            concurrency: 同时处理的帧数（通常等于引擎进程数）
+            on_progress: 每处理完一帧后调用
+        """
+        job._task = asyncio.create_task(self._run(job, process, concurrency, on_progress))
+
+    def cancel(self, job_id: str) -> Optional[BatchJob]:
+        """取消任务：正在处理的帧完成后停止，未开始的帧保持待处理"""
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel_requested = True
+        return job
+
+    async def stop(self):
+        """取消所有未结束的任务（服务关闭时）"""
+        tasks = [job._task for job in self._jobs.values() if job._task is not None and not job.finished]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: BatchJob, process, concurrency: int, on_progress):
+        job.state = "running"
+        job.started_at = time.time()
+        pending = iter(job.files)
+
+        async def worker():
+            # 各协程从同一个迭代器取帧，帧按提交顺序流过引擎
+            for filename in pending:
+                if job.cancel_requested:
+                    return
+                await self._process_frame(job, filename, process)
+                if on_progress is not None:
+                    on_progress(job)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(job.files))))))
+            job.state = "cancelled" if job.cancel_requested else "done"
+        except asyncio.CancelledError:
+            # 服务关闭
+            job.state = "cancelled"
+        except Exception as e:
+            # 单帧异常已在 _process_frame 中处理，这里只兜底（例如进度回调出错），任务不能停在 running
+            job.state = "failed"
+            job.errors["*"] = str(e)
+        finally:
+            job.finished_at = time.time()
+            if on_progress is not None:
+                on_progress(job)
+
+    async def _process_frame(self, job: BatchJob, filename: str, process):
+        for attempt in range(MAX_BUSY_RETRIES + 1):
+            try:
+                output = await process(filename)
+            except ExecutorBusy as e:
+                # 交互请求优先，批量任务等待后重试
+                if attempt == MAX_BUSY_RETRIES:
+                    job.failed += 1
+                    job.errors[filename] = str(e)
+                    return
+                await asyncio.sleep(e.retry_after)
+                continue
+            except FrameSkipped as e:
+                job.skipped += 1
+                job.errors[filename] = str(e)
+                return
+            except Exception as e:
+                # 任何其他异常都只计为该帧失败，不中断整个任务
+                job.failed += 1
+                job.errors[filename] = str(e) or type(e).__name__
+                return
+            job.completed += 1
+            job.outputs.append(output)
+            return
@@ -0,0 +1,99 @@
+"""
+有界执行器模块
+OpenCV / PIL 计算和文件读写不能直接在事件循环中执行：一次 2 秒的裁剪会让同一 worker 上
+所有请求（健康检查、列表、缩略图）一起卡住。计算和 I/O 分别交给独立的有界线程池，
+排队已满时立即拒绝，由接口返回 503 + Retry-After，而不是让延迟无限增长
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+# 默认计算线程数：OpenCV 解码、变换和编码会释放 GIL，线程可以并行占满多个核
+DEFAULT_CPU_WORKERS = os.cpu_count() or 2
+# 默认 I/O 线程数：文件写入和移动大多在等待磁盘
+DEFAULT_IO_WORKERS = 8
+
+
+class ExecutorBusy(Exception):
+    """执行器的运行和排队名额已满"""
+
+    def __init__(self, name: str, retry_after: int = 1):
+        super().__init__(f"{name} 执行器繁忙")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    带排队上限的线程池
+
+    同时存在的任务（运行中 + 排队中）不超过 workers + max_queue，超出时 submit 立即抛出
+    ExecutorBusy，不在事件循环中等待。
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int, retry_after: int = 1):
+        """
+        Args:
+            name: 执行器名称（用于线程名和统计）
+            workers: 线程数
+            max_queue: 最多排队的任务数
+            retry_after: 拒绝时建议客户端重试的秒数
+        """
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-executor")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        在线程池中执行 func 并等待结果
+
+        Raises:
+            ExecutorBusy: 运行和排队名额已满
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy(self.name, self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        # 请求被取消时线程中的任务仍会执行完，名额在任务结束时才释放
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """执行器统计信息"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+    def _release(self, future: Optional[object]):
+        with self._lock:
+            self._in_flight -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
@@ -0,0 +1,674 @@
+"""
+文件元数据索引模块
+使用 SQLite 持久化 source / processed / output 目录中图片的元数据，
+通过 scandir + mtime 增量同步，列表接口直接查询索引而不再逐个 stat 和探测文件
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from image_probe import probe_image
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# 目录 mtime 不变时，最长多久强制做一次完整同步（原地覆盖文件不会改变目录 mtime）
+RECONCILE_MAX_AGE = 30.0
+
+# 同步时每批写入并提交的记录数：探测在锁外进行，写入分小批提交，列表查询和上传不必等待整个目录同步完成
+RECONCILE_BATCH_SIZE = 200
+
+# 变更日志保留的条数，过旧的同步令牌会要求客户端全量刷新
+CHANGE_LOG_RETENTION = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    directory TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    orientation INTEGER NOT NULL DEFAULT 1,
+    probe_method TEXT,
+    thumbnail_state TEXT NOT NULL DEFAULT 'none',
+    ingest_state TEXT NOT NULL DEFAULT 'none',
+    corners TEXT,
+    confidence REAL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (directory, filename)
+);
+CREATE INDEX IF NOT EXISTS idx_files_ctime ON files (directory, ctime_ns DESC, filename);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    change_type TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    to_directory TEXT,
+    to_filename TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS directory_state (
+    directory TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+"""
+
+# 旧版本数据库中可能缺失的列：(列名, 列定义)
+MIGRATION_COLUMNS = [
+    ("ingest_state", "TEXT NOT NULL DEFAULT 'none'"),
+]
+
+# 可通过 update_fields 更新的派生字段
+DERIVED_FIELDS = ("thumbnail_state", "ingest_state", "corners", "confidence")
+
+# 目录角色对应的处理状态
+DIRECTORY_STATUS = {
+    "source": "pending",
+    "processed": "processed",
+    "output": "output",
+}
+
+
+def is_image_file(filename):
+    """判断文件名是否为支持的图片格式"""
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def encode_cursor(record) -> str:
+    """
+    将记录的排序键 (ctime_ns, filename) 编码为不透明的分页游标
+
+    Args:
+        record: 当前页最后一条索引记录
+
+    Returns:
+        str: URL 安全的游标字符串
+    """
+    payload = json.dumps([record["ctime_ns"], record["filename"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    解析分页游标
+
+    Returns:
+        tuple: (ctime_ns, filename)
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ctime_ns, filename = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        return int(ctime_ns), str(filename)
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+class FileIndex:
+    """
+    图片目录的持久化元数据索引
+
+    目录以角色名（source / processed / output）区分，每个角色对应一个磁盘目录。
+    所有公开方法都是线程安全的；多个 worker 进程可以共享同一个数据库文件（WAL 模式）。
+    """
+
+    def __init__(self, db_path: str, directories: Dict[str, str]):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            directories: 目录角色到磁盘路径的映射
+        """
+        self.db_path = db_path
+        self.directories = directories
+        self._lock = threading.RLock()
+        # 同一目录同一时间只做一次同步：后到的调用等待前一次完成后通常直接跳过，不重复探测
+        self._reconcile_locks = {directory: threading.Lock() for directory in directories}
+        self._listeners = []
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            self._conn.commit()
+
+    def _migrate(self):
+        """为旧版本数据库补充新增的列"""
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for column, definition in MIGRATION_COLUMNS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {definition}")
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _build_record(self, directory, filename, stat_result, previous=None):
+        """
+        根据 stat 结果构建索引记录；文件未变化时沿用已有的探测结果和缓存
+
+        Returns:
+            dict: 待写入的记录
+        """
+        unchanged = (
+            previous is not None
+            and previous["size"] == stat_result.st_size
+            and previous["mtime_ns"] == stat_result.st_mtime_ns
+            and previous["inode"] == stat_result.st_ino
+        )
+
+        record = {
+            "directory": directory,
+            "filename": filename,
+            "size": stat_result.st_size,
+            "mtime_ns": stat_result.st_mtime_ns,
+            "ctime_ns": stat_result.st_ctime_ns,
+            "inode": stat_result.st_ino,
+            "status": DIRECTORY_STATUS.get(directory, directory),
+        }
+
+        if unchanged:
+            for key in ("width", "height", "format", "orientation", "probe_method",
+                        "thumbnail_state", "ingest_state", "corners", "confidence"):
+                record[key] = previous[key]
+            return record
+
+        path = os.path.join(self.directories[directory], filename)
+        metadata = probe_image(path)
+        record.update({
+            "width": metadata.width if metadata else None,
+            "height": metadata.height if metadata else None,
+            "format": metadata.format if metadata else None,
+            "orientation": metadata.orientation if metadata else 1,
+            "probe_method": metadata.probe_method if metadata else None,
+            # 文件内容变化后缩略图、代理图和自动检测结果都需要重新生成
+            "thumbnail_state": "none",
+            "ingest_state": "none",
+            "corners": None,
+            "confidence": None,
+        })
+        return record
+
+    @staticmethod
+    def _version(row):
+        """记录对应的文件版本 (size, mtime_ns, inode)，记录不存在时为 None"""
+        return None if row is None else (row["size"], row["mtime_ns"], row["inode"])
+
+    def _select_record(self, directory, filename):
+        return self._conn.execute(
+            "SELECT * FROM files WHERE directory = ? AND filename = ?", (directory, filename)
+        ).fetchone()
+
+    def _write_record(self, record):
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO files (
+                directory, filename, size, mtime_ns, ctime_ns, inode, width, height, format,
+                orientation, probe_method, thumbnail_state, ingest_state, corners, confidence, status
+            ) VALUES (
+                :directory, :filename, :size, :mtime_ns, :ctime_ns, :inode, :width, :height, :format,
+                :orientation, :probe_method, :thumbnail_state, :ingest_state, :corners, :confidence, :status
+            )
+            """,
+            record,
+        )
+
+    def add_listener(self, callback):
+        """
+        注册变更监听器，每写入一条变更日志都会以该条变更调用 callback
+
+        监听器在持有索引锁的线程中同步调用，应当只做轻量的通知工作。
+        """
+        self._listeners.append(callback)
+
+    def _log_change(self, change_type, directory, filename, to_directory=None, to_filename=None):
+        """
+        追加一条变更日志（调用方需持有锁并负责提交）
+
+        Args:
+            change_type: added / removed / modified / moved
+        """
+        cursor = self._conn.execute(
+            """
+            INSERT INTO changes (change_type, directory, filename, to_directory, to_filename, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (change_type, directory, filename, to_directory, to_filename, time.time()),
+        )
+        seq = cursor.lastrowid
+        # 定期裁剪过旧的日志
+        if seq % 1000 == 0:
+            self._conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGE_LOG_RETENTION,))
+
+        change = {
+            "seq": seq,
+            "change_type": change_type,
+            "directory": directory,
+            "filename": filename,
+            "to_directory": to_directory,
+            "to_filename": to_filename,
+        }
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                print(f"变更监听器执行失败: {e}")
+
+    def _delete_record(self, directory, filename):
+        """删除记录（调用方需持有锁并负责提交），返回记录是否存在"""
+        cursor = self._conn.execute(
+            "DELETE FROM files WHERE directory = ? AND filename = ?", (directory, filename)
+        )
+        return cursor.rowcount > 0
+
+    def reconcile(self, directory: str, force: bool = False) -> Dict[str, int]:
+        """
+        增量同步目录与索引：只探测新增或变化的文件，删除已不存在的记录
+
+        目录 mtime 未变化且距上次同步不超过 RECONCILE_MAX_AGE 秒时直接跳过。
+
+        Args:
+            directory: 目录角色
+            force: 是否忽略 mtime 检查强制扫描
+
+        Returns:
+            dict: 同步统计 {"added": n, "updated": n, "removed": n, "skipped": 0/1}
+        """
+        with self._reconcile_locks[directory]:
+            stats = self._reconcile(directory, force)
+
+        if stats["added"] or stats["updated"] or stats["removed"]:
+            print(f"索引同步 {directory}: 新增 {stats['added']}, 更新 {stats['updated']}, 删除 {stats['removed']}")
+        return stats
+
+    def _reconcile(self, directory: str, force: bool) -> Dict[str, int]:
+        """
+        reconcile 的实现（调用方持有该目录的同步锁）
+
+        索引锁只在读取已有记录和写入批次时短暂持有：scandir、stat 和探测都在锁外进行，
+        结果按 RECONCILE_BATCH_SIZE 分批写入并立即提交，不会有长时间打开的写事务。
+        探测期间其他线程或进程可能已经更新了同一条记录（上传、裁剪移动），
+        写入前与读取时的记录比较，不一致时以对方的写入为准并跳过该文件。
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "skipped": 0}
+        dir_path = self.directories[directory]
+
+        try:
+            dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime_ns = 0
+
+        with self._lock:
+            state = self._conn.execute(
+                "SELECT mtime_ns, scanned_at FROM directory_state WHERE directory = ?", (directory,)
+            ).fetchone()
+            if (not force and state is not None and state["mtime_ns"] == dir_mtime_ns
+                    and time.time() - state["scanned_at"] < RECONCILE_MAX_AGE):
+                stats["skipped"] = 1
+                return stats
+
+            existing = {
+                row["filename"]: row
+                for row in self._conn.execute("SELECT * FROM files WHERE directory = ?", (directory,))
+            }
+
+        seen = set()
+        try:
+            entries = list(os.scandir(dir_path))
+        except FileNotFoundError:
+            entries = []
+
+        batch = []
+        for entry in entries:
+            if not is_image_file(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat_result = entry.stat()
+            except OSError:
+                continue
+
+            seen.add(entry.name)
+            previous = existing.get(entry.name)
+            if self._version(previous) == (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino):
+                continue
+            batch.append((previous, self._build_record(directory, entry.name, stat_result, previous)))
+            if len(batch) >= RECONCILE_BATCH_SIZE:
+                self._write_reconciled(directory, batch, stats)
+                batch = []
+        self._write_reconciled(directory, batch, stats)
+
+        removed = [existing[name] for name in existing if name not in seen]
+        for start in range(0, len(removed), RECONCILE_BATCH_SIZE):
+            with self._lock:
+                for previous in removed[start:start + RECONCILE_BATCH_SIZE]:
+                    current = self._select_record(directory, previous["filename"])
+                    if self._version(current) != self._version(previous):
+                        continue
+                    self._delete_record(directory, previous["filename"])
+                    self._log_change("removed", directory, previous["filename"])
+                    stats["removed"] += 1
+                self._conn.commit()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO directory_state (directory, mtime_ns, scanned_at) VALUES (?, ?, ?)",
+                (directory, dir_mtime_ns, time.time()),
+            )
+            self._conn.commit()
+        return stats
+
+    def _write_reconciled(self, directory, batch, stats):
+        """写入并提交一批同步结果，跳过探测期间已被其他写入更新的记录"""
+        if not batch:
+            return
+        with self._lock:
+            for previous, record in batch:
+                current = self._select_record(directory, record["filename"])
+                if self._version(current) != self._version(previous):
+                    continue
+                if previous is None:
+                    stats["added"] += 1
+                    self._log_change("added", directory, record["filename"])
+                else:
+                    stats["updated"] += 1
+                    self._log_change("modified", directory, record["filename"])
+                self._write_record(record)
+            self._conn.commit()
+
+    def reconcile_all(self, force: bool = False):
+        """同步所有已配置的目录"""
+        for directory in self.directories:
+            self.reconcile(directory, force=force)
+
+    def upsert_file(self, directory: str, filename: str):
+        """
+        新增或刷新单个文件的索引记录（用于上传等已知变更）
+
+        Returns:
+            sqlite3.Row: 最新记录，文件不存在时返回 None
+        """
+        path = os.path.join(self.directories[directory], filename)
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            self.remove_file(directory, filename)
+            return None
+
+        with self._lock:
+            previous = self._select_record(directory, filename)
+        # 文件变化时需要探测尺寸，在锁外进行
+        record = self._build_record(directory, filename, stat_result, previous)
+
+        with self._lock:
+            # 探测期间记录被其他写入更新时以对方为准
+            if self._version(self._select_record(directory, filename)) == self._version(previous):
+                if previous is None:
+                    self._log_change("added", directory, filename)
+                elif self._version(record) != self._version(previous):
+                    self._log_change("modified", directory, filename)
+                self._write_record(record)
+                self._conn.commit()
+        return self.get_file(directory, filename)
+
+    def remove_file(self, directory: str, filename: str):
+        """删除单个文件的索引记录"""
+        with self._lock:
+            if self._delete_record(directory, filename):
+                self._log_change("removed", directory, filename)
+            self._conn.commit()
+
+    def move_file(self, src_directory: str, filename: str, dst_directory: str, new_filename: Optional[str] = None):
+        """
+        记录文件在目录间的移动（例如裁剪后 source -> processed）
+
+        Returns:
+            sqlite3.Row: 目标目录中的新记录
+        """
+        new_filename = new_filename or filename
+        path = os.path.join(self.directories[dst_directory], new_filename)
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            self.remove_file(src_directory, filename)
+            return None
+
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT * FROM files WHERE directory = ? AND filename = ?", (src_directory, filename)
+            ).fetchone()
+            self._delete_record(src_directory, filename)
+            self._delete_record(dst_directory, new_filename)
+            # 移动不改变文件内容，沿用原记录的探测结果
+            record = self._build_record(dst_directory, new_filename, stat_result, previous)
+            self._write_record(record)
+            self._log_change("moved", src_directory, filename, dst_directory, new_filename)
+            self._conn.commit()
+        return self.get_file(dst_directory, new_filename)
+
+    def get_file(self, directory: str, filename: str, refresh: bool = False):
+        """
+        获取单个文件的索引记录
+
+        Args:
+            directory: 目录角色
+            filename: 文件名
+            refresh: 是否先 stat 文件，确保记录与磁盘一致
+
+        Returns:
+            sqlite3.Row: 索引记录，不存在时返回 None
+        """
+        if refresh:
+            return self.upsert_file(directory, filename)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM files WHERE directory = ? AND filename = ?", (directory, filename)
+            ).fetchone()
+
+    def list_files(self, directory: str, limit: Optional[int] = None, offset: int = 0,
+                   readable_only: bool = True) -> List[sqlite3.Row]:
+        """
+        按创建时间倒序列出目录中的文件
+
+        Args:
+            directory: 目录角色
+            limit: 最多返回的条数，None 表示全部
+            offset: 跳过的条数
+            readable_only: 是否排除无法读取尺寸的文件
+
+        Returns:
+            list: 索引记录列表
+        """
+        query = "SELECT * FROM files WHERE directory = ?"
+        if readable_only:
+            query += " AND width IS NOT NULL"
+        query += " ORDER BY ctime_ns DESC, filename"
+        params = [directory]
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def list_files_after(self, directory: str, cursor: Optional[str], limit: int,
+                         readable_only: bool = True):
+        """
+        基于游标的分页查询（keyset 分页），按 (ctime_ns DESC, filename) 排序
+
+        直接利用 (directory, ctime_ns, filename) 索引定位，第 N 页与第 1 页代价相同，
+        且翻页过程中有新文件加入也不会导致页面内容错位。
+
+        Args:
+            directory: 目录角色
+            cursor: 上一页返回的游标，None 表示第一页
+            limit: 每页条数
+            readable_only: 是否排除无法读取尺寸的文件
+
+        Returns:
+            tuple: (记录列表, 下一页游标或 None)
+        """
+        query = "SELECT * FROM files WHERE directory = ?"
+        params = [directory]
+        if readable_only:
+            query += " AND width IS NOT NULL"
+        if cursor:
+            ctime_ns, filename = decode_cursor(cursor)
+            query += " AND (ctime_ns < ? OR (ctime_ns = ? AND filename > ?))"
+            params += [ctime_ns, ctime_ns, filename]
+        query += " ORDER BY ctime_ns DESC, filename LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def list_filenames(self, directory: str) -> List[str]:
+        """按文件名顺序列出目录中的所有文件名"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename FROM files WHERE directory = ? ORDER BY filename", (directory,)
+            ).fetchall()
+        return [row["filename"] for row in rows]
+
+    def list_missing_thumbnails(self, directory: str) -> List[str]:
+        """列出尚未生成缩略图的可读文件（按创建时间倒序，与列表页顺序一致）"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT filename FROM files
+                WHERE directory = ? AND width IS NOT NULL AND thumbnail_state IN ('none', 'pending')
+                ORDER BY ctime_ns DESC, filename
+                """,
+                (directory,),
+            ).fetchall()
+        return [row["filename"] for row in rows]
+
+    def count(self, directory: str, readable_only: bool = False) -> int:
+        """统计目录中的文件数"""
+        query = "SELECT COUNT(*) FROM files WHERE directory = ?"
+        if readable_only:
+            query += " AND width IS NOT NULL"
+        with self._lock:
+            return self._conn.execute(query, (directory,)).fetchone()[0]
+
+    def first_filename(self, directory: str, exclude: Optional[str] = None) -> Optional[str]:
+        """按文件名顺序返回第一个文件（可排除指定文件）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM files WHERE directory = ? AND filename != ? ORDER BY filename LIMIT 1",
+                (directory, exclude or ""),
+            ).fetchone()
+        return row["filename"] if row else None
+
+    def current_token(self) -> int:
+        """返回当前最新的变更序号，作为增量同步令牌"""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) FROM changes").fetchone()
+        return row[0] or 0
+
+    def get_changes(self, since: int, limit: int = 500):
+        """
+        获取指定序号之后的变更
+
+        Args:
+            since: 客户端持有的同步令牌（上次返回的变更序号）
+            limit: 最多返回的条数
+
+        Returns:
+            tuple: (变更记录列表, 新令牌, 是否需要全量刷新)
+                   令牌早于日志保留范围时返回空列表并要求全量刷新
+        """
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            latest = self._conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+            if since > latest or (oldest is not None and since < oldest - 1):
+                return [], latest, True
+
+            rows = self._conn.execute(
+                "SELECT * FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit)
+            ).fetchall()
+
+        token = rows[-1]["seq"] if rows else since
+        return rows, token, False
+
+    def set_thumbnail_state(self, directory: str, filename: str, state: str):
+        """更新缩略图状态（none / pending / ready / failed）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET thumbnail_state = ? WHERE directory = ? AND filename = ?",
+                (state, directory, filename),
+            )
+            self._conn.commit()
+
+    def set_detection(self, directory: str, filename: str, corners: List[List[float]], confidence: float):
+        """缓存自动检测的角点结果"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET corners = ?, confidence = ? WHERE directory = ? AND filename = ?",
+                (json.dumps([[float(x), float(y)] for x, y in corners]), float(confidence), directory, filename),
+            )
+            self._conn.commit()
+
+    def update_fields(self, directory: str, filename: str, mtime_ns: Optional[int] = None, **fields):
+        """
+        一次性更新多个派生字段（缩略图状态、导入状态、检测结果）
+
+        Args:
+            directory: 目录角色
+            filename: 文件名
+            mtime_ns: 生成派生数据时源文件的 mtime_ns；指定时只在记录仍对应该版本时更新，
+                      避免文件在处理期间被替换后写入过期结果
+            **fields: 字段名到新值的映射，corners 会被序列化为 JSON
+
+        Returns:
+            bool: 是否有记录被更新
+        """
+        unknown = set(fields) - set(DERIVED_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持更新的字段: {', '.join(sorted(unknown))}")
+        if not fields:
+            return False
+
+        if fields.get("corners") is not None:
+            fields["corners"] = json.dumps([[float(x), float(y)] for x, y in fields["corners"]])
+        if fields.get("confidence") is not None:
+            fields["confidence"] = float(fields["confidence"])
+
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        query = f"UPDATE files SET {assignments} WHERE directory = :directory AND filename = :filename"
+        if mtime_ns is not None:
+            query += " AND mtime_ns = :mtime_ns"
+        with self._lock:
+            cursor = self._conn.execute(
+                query, {**fields, "directory": directory, "filename": filename, "mtime_ns": mtime_ns}
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def get_detection(row):
+        """
+        读取记录中缓存的自动检测结果
+
+        Returns:
+            tuple: (corners, confidence)，未缓存时返回 (None, None)
+        """
+        if row is None or row["corners"] is None:
+            return None, None
+        return json.loads(row["corners"]), row["confidence"]
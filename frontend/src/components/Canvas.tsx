@@ -1,10 +1,12 @@
-import { useRef, useEffect, useMemo } from 'react';
+import { useRef, useEffect, useMemo, useState } from 'react';
 import { ZoomIn, ZoomOut, RotateCcw, Grid3X3 } from 'lucide-react';
 import { useAppStore } from '../store/useAppStore';
 import { useCanvasInteraction } from '../hooks/useCanvasInteraction';
-import { loadImage, drawCropArea } from '../utils/imageProcessing';
+import { loadImage, drawCropArea, getImageLevelUrl } from '../utils/imageProcessing';
 import { createDefaultCropArea } from '../utils/geometry';
 import { Magnifier } from './Magnifier';
+import { TileSource } from '../utils/tileSource';
+import { apiService } from '../services/api';
 
 interface CanvasProps {
   className?: string;
@@ -32,6 +34,29 @@ export function Canvas({ className, onCanvasResize }: CanvasProps) {
     isDraggingCorner 
   } = useCanvasInteraction(canvasRef as React.RefObject<HTMLCanvasElement>);
 
+  // 超大图片的瓦片源：放大到 editor 级别分辨率不够时，只加载视口内的瓦片
+  const [tileSource, setTileSource] = useState<TileSource | null>(null);
+  const [tileTick, setTileTick] = useState(0);
+  const currentFilename = currentImage?.originalUrl.includes('/api/image/') ? currentImage.originalName : null;
+
+  useEffect(() => {
+    setTileSource(null);
+    if (!currentFilename) return;
+
+    let cancelled = false;
+    apiService.getTileInfo(currentFilename)
+      .then((info) => {
+        if (!cancelled) {
+          setTileSource(new TileSource(currentFilename, info, () => setTileTick((tick) => tick + 1)));
+        }
+      })
+      .catch((error) => console.warn('Tile info unavailable:', error));
+
+    return () => {
+      cancelled = true;
+    };
+  }, [currentFilename]);
+
   // 使用useMemo优化渲染条件判断
   const shouldRender = useMemo(() => {
     // 只要有currentImage就应该尝试渲染，canvasRef会在组件挂载后变为可用
@@ -173,7 +198,8 @@ export function Canvas({ className, onCanvasResize }: CanvasProps) {
         
         // Load and draw image
         let img: HTMLImageElement;
-        const imageUrl = currentImage!.originalUrl;
+        // 编辑器只需要 editor 级别（最大边 1600px），不加载原图
+        const imageUrl = getImageLevelUrl(currentImage!.originalUrl, 'editor');
         console.log('=== IMAGE LOADING START ===');
         console.log('Loading image URL:', imageUrl);
         console.log('Image cache has this URL:', imageCache.current.has(imageUrl));
@@ -264,6 +290,23 @@ export function Canvas({ className, onCanvasResize }: CanvasProps) {
         
         ctx.drawImage(img, imgX, imgY, imgWidth, imgHeight);
         
+        // 当前缩放下 editor 级别分辨率不足时，在其上叠加视口内的高分辨率瓦片
+        if (tileSource) {
+          const scalePerPixel = imgWidth / tileSource.info.width;
+          const level = tileSource.levelForScale(scalePerPixel * viewState.zoom);
+          if (tileSource.levelSize(level) > Math.max(img.width, img.height)) {
+            const toImageX = (canvasX: number) => ((canvasX - viewState.offset.x) / viewState.zoom - imgX) / scalePerPixel;
+            const toImageY = (canvasY: number) => ((canvasY - viewState.offset.y) / viewState.zoom - imgY) / scalePerPixel;
+            const visible = {
+              x: toImageX(0),
+              y: toImageY(0),
+              width: toImageX(displayWidth) - toImageX(0),
+              height: toImageY(displayHeight) - toImageY(0),
+            };
+            tileSource.draw(ctx, level, visible, { x: imgX, y: imgY }, scalePerPixel);
+          }
+        }
+        
         console.log('=== drawImage call completed ===');
         
         ctx.restore();
@@ -344,7 +387,7 @@ export function Canvas({ className, onCanvasResize }: CanvasProps) {
     return () => {
       clearTimeout(timeoutId);
     };
-  }, [shouldRender, currentImage, viewState, scheduledRender]);
+  }, [shouldRender, currentImage, viewState, scheduledRender, tileSource, tileTick]);
 
   // Handle window resize to adjust canvas size
   useEffect(() => {
@@ -458,7 +501,8 @@ export function Canvas({ className, onCanvasResize }: CanvasProps) {
         isVisible={isDraggingCorner && viewState.selectedCorner !== null}
         mousePosition={mousePosition}
         canvasPosition={canvasPosition}
-        imageUrl={currentImage.originalUrl}
+        imageUrl={getImageLevelUrl(currentImage.originalUrl, 'editor')}
+        tileSource={tileSource}
         selectedCorner={viewState.selectedCorner}
         cropArea={currentImage.cropArea}
         zoom={viewState.zoom}
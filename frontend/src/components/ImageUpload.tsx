@@ -1,8 +1,10 @@
-import { useRef, useState, useEffect } from 'react';
+import { useRef, useState, useEffect, useCallback } from 'react';
 import { Upload, Image as ImageIcon, X, Check, AlertCircle, RefreshCw } from 'lucide-react';
-import { useAppStore } from '../store/useAppStore';
+import { useAppStore, API_BASE } from '../store/useAppStore';
 import { isValidImageFile } from '../utils/imageProcessing';
 import { ProgressBar } from './ProgressBar';
+import { useProgressStream } from '../hooks/useProgressStream';
+import type { ThumbnailReadyEvent } from '../services/api';
 
 interface ImageUploadProps {
   className?: string;
@@ -170,7 +172,9 @@ export function ImageList({ className }: ImageListProps) {
     currentImage, 
     setCurrentImage, 
     removeImage, 
+    updateImage,
     refreshFromServer,
+    syncChanges,
     loadPage,
     isLoading, 
     paginatedData,
@@ -185,6 +189,26 @@ export function ImageList({ className }: ImageListProps) {
     refreshFromServer();
   }, [refreshFromServer]);
 
+  // 服务器推送的进度；文件状态变化时立即拉取增量变更
+  const handleFileState = useCallback(() => {
+    syncChanges();
+  }, [syncChanges]);
+  // 后台缩略图生成完成后替换占位图
+  const handleThumbnailReady = useCallback((event: ThumbnailReadyEvent) => {
+    if (event.directory === 'source') {
+      updateImage(event.filename, { thumbnailUrl: `${API_BASE}${event.thumbnail_url}` });
+    }
+  }, [updateImage]);
+  const progress = useProgressStream(handleFileState, handleThumbnailReady);
+
+  // 兜底的增量同步轮询，代价只取决于变更量而不是文件夹大小
+  useEffect(() => {
+    const timer = window.setInterval(() => {
+      syncChanges();
+    }, 30000);
+    return () => window.clearInterval(timer);
+  }, [syncChanges]);
+
   const handleRefresh = async () => {
     setIsRefreshing(true);
     try {
@@ -214,6 +238,11 @@ export function ImageList({ className }: ImageListProps) {
   // Display pending images by default
   const displayImages = images;
   const totalImages = images.length + processedImages.length;
+  const totalFiles = progress?.total_files ?? paginatedData?.total_files ?? totalImages;
+  const completionRate = progress?.completion_rate
+    ?? paginatedData?.completion_rate
+    ?? (totalImages > 0 ? processedImages.length / totalImages * 100 : 100);
+  const completedFiles = progress?.processed_count ?? paginatedData?.processed_count ?? processedImages.length;
 
   if (isLoading && totalImages === 0) {
     return (
@@ -247,19 +276,19 @@ export function ImageList({ className }: ImageListProps) {
     <div className={`image-list ${className || ''}`}>
       <div className="list-header">
         <div className="list-title">
-          <h3>图像 ({paginatedData?.total_files || totalImages})</h3>
+          <h3>图像 ({totalFiles})</h3>
           
           {/* 添加进度条 */}
-          {(paginatedData || totalImages > 0) && (
+          {(progress || paginatedData || totalImages > 0) && (
             <ProgressBar
-              value={paginatedData?.completion_rate || (processedImages.length / totalImages * 100)}
-              totalFiles={paginatedData?.total_files || totalImages}
-              completedFiles={processedImages.length}
+              value={completionRate}
+              totalFiles={totalFiles}
+              completedFiles={completedFiles}
               processingFiles={processingImages.size}
               errorFiles={errorImages.size}
               showDetails={true}
               theme={
-                (paginatedData?.completion_rate || (processedImages.length / totalImages * 100)) === 100 
+                completionRate === 100 
                   ? 'success' 
                   : errorImages.size > 0
                   ? 'error'
@@ -309,19 +338,24 @@ export function ImageList({ className }: ImageListProps) {
             }}
           >
             <div className="image-thumbnail-container">
-              <img
-                src={image.thumbnailUrl || image.originalUrl}
-                alt={image.originalName}
-                className="image-thumbnail"
-                loading="lazy"
-                onError={(e) => {
-                  // Fallback to original image if thumbnail fails
-                  const target = e.target as HTMLImageElement;
-                  if (target.src !== image.originalUrl) {
-                    target.src = image.originalUrl;
-                  }
-                }}
-              />
+              {image.thumbnailUrl ? (
+                <img
+                  src={image.thumbnailUrl}
+                  alt={image.originalName}
+                  className="image-thumbnail"
+                  loading="lazy"
+                  onError={(e) => {
+                    // Fallback to original image if thumbnail fails
+                    const target = e.target as HTMLImageElement;
+                    if (target.src !== image.originalUrl) {
+                      target.src = image.originalUrl;
+                    }
+                  }}
+                />
+              ) : (
+                // 缩略图由后台生成，完成前显示占位骨架，避免加载原图
+                <div className="image-thumbnail thumbnail-pending" title={image.originalName} />
+              )}
               {image.status === 'processing' && (
                 <div className="processing-overlay">
                   <Upload className="animate-pulse" size={20} />
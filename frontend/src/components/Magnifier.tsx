@@ -1,12 +1,14 @@
 import { useRef, useEffect } from 'react';
 import type { Point, CropArea } from '../types';
 import { loadImage } from '../utils/imageProcessing';
+import type { TileSource } from '../utils/tileSource';
 
 interface MagnifierProps {
   isVisible: boolean;
   mousePosition: Point;
   canvasPosition: Point;
   imageUrl: string;
+  tileSource?: TileSource | null;
   selectedCorner: number | null;
   cropArea?: CropArea;
   zoom: number;
@@ -22,6 +24,7 @@ export function Magnifier({
   mousePosition,
   canvasPosition,
   imageUrl,
+  tileSource,
   selectedCorner,
   cropArea,
   zoom,
@@ -99,6 +102,28 @@ export function Magnifier({
             sourceX, sourceY, sourceWidth, sourceHeight,
             0, 0, MAGNIFIER_SIZE, MAGNIFIER_SIZE
           );
+          
+          // 超大图片：叠加放大区域内的高分辨率瓦片（imageUrl 为 editor 级别）
+          if (tileSource) {
+            const toOriginal = tileSource.info.width / img.width;
+            const scale = MAGNIFIER_SIZE / (sourceWidth * toOriginal);
+            const level = tileSource.levelForScale(scale);
+            if (tileSource.levelSize(level) > Math.max(img.width, img.height)) {
+              ctx.imageSmoothingEnabled = true;
+              tileSource.draw(
+                ctx,
+                level,
+                {
+                  x: sourceX * toOriginal,
+                  y: sourceY * toOriginal,
+                  width: sourceWidth * toOriginal,
+                  height: sourceHeight * toOriginal,
+                },
+                { x: -sourceX * toOriginal * scale, y: -sourceY * toOriginal * scale },
+                scale
+              );
+            }
+          }
         }
 
         // 绘制当前拖拽的角点
@@ -157,7 +182,7 @@ export function Magnifier({
     };
 
     renderMagnifier();
-  }, [isVisible, canvasPosition, imageUrl, selectedCorner, cropArea, zoom, offset]);
+  }, [isVisible, canvasPosition, imageUrl, tileSource, selectedCorner, cropArea, zoom, offset]);
 
   if (!isVisible) {
     return null;
@@ -0,0 +1,46 @@
+import { useEffect, useState } from 'react';
+import { apiService, type ProgressSnapshot, type FileStateEvent, type ThumbnailReadyEvent } from '../services/api';
+
+/**
+ * 订阅服务器推送的处理进度（SSE）
+ * 计数由服务器增量维护，前端不再需要反复拉取完整列表来计算完成率
+ * 后台缩略图生成完成时通过 thumbnail 事件通知，用于替换占位图
+ */
+export function useProgressStream(
+  onFileState?: (event: FileStateEvent) => void,
+  onThumbnailReady?: (event: ThumbnailReadyEvent) => void
+) {
+  const [progress, setProgress] = useState<ProgressSnapshot | null>(null);
+
+  useEffect(() => {
+    const source = new EventSource(apiService.getProgressStreamUrl());
+
+    const handleProgress = (event: MessageEvent) => {
+      setProgress(JSON.parse(event.data) as ProgressSnapshot);
+    };
+    const handleFileState = (event: MessageEvent) => {
+      onFileState?.(JSON.parse(event.data) as FileStateEvent);
+    };
+    const handleThumbnail = (event: MessageEvent) => {
+      onThumbnailReady?.(JSON.parse(event.data) as ThumbnailReadyEvent);
+    };
+
+    source.addEventListener('progress', handleProgress);
+    source.addEventListener('file', handleFileState);
+    source.addEventListener('thumbnail', handleThumbnail);
+
+    // EventSource 断开后会自动重连，这里只记录错误
+    source.onerror = () => {
+      console.warn('Progress stream disconnected, retrying...');
+    };
+
+    return () => {
+      source.removeEventListener('progress', handleProgress);
+      source.removeEventListener('file', handleFileState);
+      source.removeEventListener('thumbnail', handleThumbnail);
+      source.close();
+    };
+  }, [onFileState, onThumbnailReady]);
+
+  return progress;
+}
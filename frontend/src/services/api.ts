@@ -5,6 +5,17 @@
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
+// 操作员标识：每个浏览器标签页一个，用于服务器端的文件租约分配
+function getOperatorId(): string {
+  const key = 'operator-id';
+  let operatorId = sessionStorage.getItem(key);
+  if (!operatorId) {
+    operatorId = crypto.randomUUID();
+    sessionStorage.setItem(key, operatorId);
+  }
+  return operatorId;
+}
+
 // 类型定义
 export interface ImageInfo {
   filename: string;
@@ -14,6 +25,10 @@ export interface ImageInfo {
   created_time?: string;
   has_thumbnail?: boolean;
   thumbnail_url?: string;
+  thumbnail_state?: 'none' | 'pending' | 'ready' | 'failed';
+  format?: string;
+  orientation?: number;
+  probe_method?: 'header' | 'decode';
 }
 
 export interface PaginatedFileListResponse {
@@ -26,6 +41,9 @@ export interface PaginatedFileListResponse {
   total_pages: number;
   has_next: boolean;
   has_prev: boolean;
+  next_cursor?: string | null;
+  processed_count: number;
+  processed_next_cursor?: string | null;
 }
 
 export interface FileListResponse {
@@ -35,8 +53,71 @@ export interface FileListResponse {
   completion_rate: number;
 }
 
-export interface CropRequest {
-  points: number[][]; // [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+export interface FileChange {
+  seq: number;
+  change_type: 'added' | 'removed' | 'modified' | 'moved';
+  directory: 'source' | 'processed' | 'output';
+  filename: string;
+  to_directory?: string | null;
+  to_filename?: string | null;
+  file?: ImageInfo | null;
+}
+
+export interface FileChangesResponse {
+  changes: FileChange[];
+  token: string;
+  has_more: boolean;
+  reset: boolean;
+}
+
+export interface ProgressSnapshot {
+  pending_count: number;
+  processed_count: number;
+  total_files: number;
+  completion_rate: number;
+  timestamp: number;
+}
+
+export interface FileStateEvent {
+  filename: string;
+  state: 'pending' | 'processing' | 'processed' | 'removed' | 'error';
+  processed_filename?: string;
+  error?: string;
+}
+
+export interface TileInfo {
+  width: number;
+  height: number;
+  tile_size: number;
+  overlap: number;
+  format: string;
+  max_level: number; // 原图分辨率所在级别，每低一级缩小一半
+  version: string;
+}
+
+export interface ThumbnailReadyEvent {
+  directory: string;
+  filename: string;
+  thumbnail_url: string;
+}
+
+export interface CropOutputOptions {
+  output_width?: number; // 只传宽或高时按比例计算另一边
+  output_height?: number;
+  max_side?: number; // 最大边长，只缩小不放大
+  dpi?: number;
+}
+
+export interface CropRequest extends CropOutputOptions {
+  points?: number[][]; // [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+  regions?: number[][][]; // 多区域裁剪，与 points 二选一
+}
+
+export interface CropOutput {
+  filename: string;
+  output_width: number;
+  output_height: number;
+  transform: 'roi' | 'warp' | 'tiled';
 }
 
 export interface CropResponse {
@@ -45,6 +126,31 @@ export interface CropResponse {
   message: string;
   processed_filename?: string;
   error?: string;
+  output_width?: number;
+  output_height?: number;
+  transform?: 'roi' | 'warp' | 'tiled'; // 服务器实际使用的计算方式
+  outputs?: CropOutput[]; // 各区域的输出，顶层字段对应第一个区域
+}
+
+export interface BatchCropRequest extends CropOutputOptions {
+  points: number[][]; // 模板角点
+  files?: string[]; // 与 pattern 二选一
+  pattern?: string; // 通配符，例如 "lecture_*.jpg"
+  reference_size?: [number, number]; // 角点所在图片的尺寸，默认取第一张
+}
+
+export interface BatchJobStatus {
+  job_id: string;
+  state: 'queued' | 'running' | 'done' | 'cancelled' | 'failed';
+  total: number;
+  completed: number;
+  failed: number;
+  skipped: number;
+  progress: number;
+  elapsed: number;
+  frames_per_second: number;
+  outputs?: CropOutput[];
+  errors?: Record<string, string>;
 }
 
 export interface AutoDetectResponse {
@@ -60,6 +166,7 @@ export interface NextFileResponse {
   next_filename?: string;
   remaining_count: number;
   message: string;
+  lease_expires_at?: number | null;
 }
 
 export interface UploadResponse {
@@ -111,6 +218,7 @@ async function apiRequest<T>(
     ...options,
     headers: {
       'Content-Type': 'application/json',
+      'X-Operator-Id': getOperatorId(),
       ...options.headers,
     },
   });
@@ -170,6 +278,16 @@ export const apiService = {
     return apiRequest<ImageInfo>(`/api/image-info/${encodeURIComponent(filename)}`);
   },
 
+  // 获取瓦片金字塔描述
+  async getTileInfo(filename: string): Promise<TileInfo> {
+    return apiRequest<TileInfo>(`/api/tiles/${encodeURIComponent(filename)}/info`);
+  },
+
+  // 瓦片地址，带版本参数可被浏览器永久缓存
+  getTileUrl(filename: string, level: number, column: number, row: number, version: string): string {
+    return `${API_BASE_URL}/api/tiles/${encodeURIComponent(filename)}/${level}/${column}_${row}.jpg?v=${encodeURIComponent(version)}`;
+  },
+
   // 自动检测角点
   async autoDetectCorners(filename: string): Promise<AutoDetectResponse> {
     return apiRequest<AutoDetectResponse>(`/api/auto-detect/${encodeURIComponent(filename)}`, {
@@ -186,12 +304,12 @@ export const apiService = {
 
     console.log('生成预览，文件:', filename, '坐标:', points);
 
-    const response = await fetch(`${API_BASE_URL}/api/preview/${encodeURIComponent(filename)}`, {
-      method: 'POST',
+    // 使用 GET 形式：相同角点对应相同 URL，浏览器可以按 ETag 复用已缓存的预览
+    const query = encodeURIComponent(points.flat().join(','));
+    const response = await fetch(`${API_BASE_URL}/api/preview/${encodeURIComponent(filename)}?points=${query}`, {
       headers: {
-        'Content-Type': 'application/json',
+        'X-Operator-Id': getOperatorId(),
       },
-      body: JSON.stringify({ points }),
     });
 
     if (!response.ok) {
@@ -204,7 +322,7 @@ export const apiService = {
   },
 
   // 执行裁剪（确认截图，执行实际的裁剪和文件移动）
-  async cropImage(filename: string, points: number[][]): Promise<CropResponse> {
+  async cropImage(filename: string, points: number[][], output: CropOutputOptions = {}): Promise<CropResponse> {
     // 验证坐标
     if (!points || points.length !== 4) {
       throw new ApiError(400, '需要4个角点坐标');
@@ -214,10 +332,40 @@ export const apiService = {
 
     return apiRequest<CropResponse>(`/api/crop/${encodeURIComponent(filename)}`, {
       method: 'POST',
-      body: JSON.stringify({ points }),
+      body: JSON.stringify({ points, ...output }),
+    });
+  },
+
+  // 一次裁剪多个区域（原图只解码一次，全部完成后才移动原文件）
+  async cropRegions(filename: string, regions: number[][][], output: CropOutputOptions = {}): Promise<CropResponse> {
+    if (!regions.length || regions.some((points) => points.length !== 4)) {
+      throw new ApiError(400, '每个区域需要4个角点坐标');
+    }
+
+    return apiRequest<CropResponse>(`/api/crop/${encodeURIComponent(filename)}`, {
+      method: 'POST',
+      body: JSON.stringify({ regions, ...output }),
+    });
+  },
+
+  // 批量裁剪：同一组角点应用到一批图片，返回后台任务状态
+  async startBatchCrop(request: BatchCropRequest): Promise<BatchJobStatus> {
+    return apiRequest<BatchJobStatus>('/api/batch-crop', {
+      method: 'POST',
+      body: JSON.stringify(request),
     });
   },
 
+  // 查询批量裁剪任务状态
+  async getBatchCrop(jobId: string): Promise<BatchJobStatus> {
+    return apiRequest<BatchJobStatus>(`/api/batch-crop/${encodeURIComponent(jobId)}`);
+  },
+
+  // 取消批量裁剪任务
+  async cancelBatchCrop(jobId: string): Promise<BatchJobStatus> {
+    return apiRequest<BatchJobStatus>(`/api/batch-crop/${encodeURIComponent(jobId)}`, { method: 'DELETE' });
+  },
+
   // 下载处理结果
   async downloadResult(filename: string): Promise<string> {
     const response = await fetch(`${API_BASE_URL}/api/download/${encodeURIComponent(filename)}`);
@@ -233,6 +381,13 @@ export const apiService = {
     return apiRequest<NextFileResponse>(`/api/next-file/${encodeURIComponent(currentFilename)}`);
   },
 
+  // 释放当前操作员对文件的租约
+  async releaseLease(filename: string): Promise<{ success: boolean; filename: string }> {
+    return apiRequest(`/api/lease/${encodeURIComponent(filename)}`, {
+      method: 'DELETE',
+    });
+  },
+
   // 健康检查
   async healthCheck(): Promise<{ status: string; timestamp: number; directories: Record<string, boolean> }> {
     return apiRequest('/api/health');
@@ -280,8 +435,24 @@ export const apiService = {
   },
 
   // 获取分页文件列表
-  async getFilesPaginated(page = 1, pageSize = 20): Promise<PaginatedFileListResponse> {
-    return apiRequest<PaginatedFileListResponse>(`/api/files/paginated?page=${page}&page_size=${pageSize}`);
+  async getFilesPaginated(page = 1, pageSize = 20, cursor?: string | null): Promise<PaginatedFileListResponse> {
+    const params = new URLSearchParams({ page: String(page), page_size: String(pageSize) });
+    if (cursor) {
+      // 游标分页：按稳定顺序取下一页，不受并发上传/裁剪影响
+      params.set('cursor', cursor);
+    }
+    return apiRequest<PaginatedFileListResponse>(`/api/files/paginated?${params.toString()}`);
+  },
+
+  // 获取文件列表的增量变更（不传 since 时只返回当前令牌）
+  async getFileChanges(since?: string | null): Promise<FileChangesResponse> {
+    const query = since ? `?since=${encodeURIComponent(since)}` : '';
+    return apiRequest<FileChangesResponse>(`/api/files/changes${query}`);
+  },
+
+  // 处理进度事件流（SSE）地址
+  getProgressStreamUrl(): string {
+    return `${API_BASE_URL}/api/progress/stream`;
   },
 
   // 获取缩略图URL
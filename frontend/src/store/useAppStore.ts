@@ -1,6 +1,6 @@
 import { create } from 'zustand';
 import type { Point, ProcessedImage, AppSettings, ViewState } from '../types';
-import { apiService, type FileListResponse, type PaginatedFileListResponse } from '../services/api';
+import { apiService, type FileListResponse, type PaginatedFileListResponse, type ImageInfo } from '../services/api';
 
 interface AppState {
   // Current image state
@@ -18,6 +18,7 @@ interface AppState {
   currentPage: number;
   pageSize: number;
   lastRefresh: number | null;
+  changeToken: string | null; // 增量同步令牌
   
   // View and interaction state
   viewState: ViewState;
@@ -36,6 +37,7 @@ interface AppState {
   // Server actions
   refreshFromServer: () => Promise<void>;
   loadPage: (page: number) => Promise<void>;
+  syncChanges: () => Promise<void>;
   loadImageFromServer: (filename: string) => Promise<void>;
   
   // View actions
@@ -66,6 +68,28 @@ interface AppState {
   moveToNextImage: (currentImageId?: string) => void;
 }
 
+export const API_BASE = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
+
+// 将服务器返回的待处理文件信息转换为列表项
+const toPendingImage = (fileInfo: ImageInfo): ProcessedImage => ({
+  id: fileInfo.filename,
+  originalName: fileInfo.filename,
+  originalUrl: `${API_BASE}/api/image/${encodeURIComponent(fileInfo.filename)}`,
+  thumbnailUrl: fileInfo.has_thumbnail ? `${API_BASE}${fileInfo.thumbnail_url}` : undefined,
+  timestamp: Date.now(),
+  status: 'pending' as const
+});
+
+// 将已处理文件名转换为列表项
+const toProcessedImage = (filename: string): ProcessedImage => ({
+  id: `processed_${filename}`,
+  originalName: filename,
+  originalUrl: `${API_BASE}/api/image/${encodeURIComponent(filename)}`,
+  thumbnailUrl: `${API_BASE}/api/thumbnail/${encodeURIComponent(filename)}`,
+  timestamp: Date.now(),
+  status: 'completed' as const
+});
+
 const defaultViewState: ViewState = {
   zoom: 1,
   offset: { x: 0, y: 0 },
@@ -92,6 +116,7 @@ export const useAppStore = create<AppState>((set, get) => ({
   currentPage: 1,
   pageSize: 20,
   lastRefresh: null,
+  changeToken: null,
   viewState: defaultViewState,
   settings: defaultSettings,
   isLoading: false,
@@ -160,6 +185,9 @@ export const useAppStore = create<AppState>((set, get) => ({
     try {
       set({ isLoading: true, error: null });
       
+      // 先获取同步令牌，保证之后的增量同步不会遗漏加载期间的变更
+      const { token } = await apiService.getFileChanges();
+      
       // 使用分页API加载第一页
       const paginatedData = await apiService.getFilesPaginated(1, get().pageSize);
       
@@ -205,6 +233,7 @@ export const useAppStore = create<AppState>((set, get) => ({
         processedImages: completedImages,
         currentPage: 1,
         lastRefresh: Date.now(),
+        changeToken: token,
         isLoading: false 
       });
     } catch (error) {
@@ -220,7 +249,10 @@ export const useAppStore = create<AppState>((set, get) => ({
     try {
       set({ isLoading: true, error: null });
       
-      const paginatedData = await apiService.getFilesPaginated(page, get().pageSize);
+      // 翻到下一页时使用上一页返回的游标，避免偏移分页在文件增删时错位
+      const { paginatedData: previousData, currentPage } = get();
+      const cursor = page === currentPage + 1 ? previousData?.next_cursor : undefined;
+      const paginatedData = await apiService.getFilesPaginated(page, get().pageSize, cursor);
       
       // Convert pending files to ProcessedImage format with thumbnail URLs
       const pendingImages: ProcessedImage[] = paginatedData.pending_files.map(fileInfo => {
@@ -263,6 +295,66 @@ export const useAppStore = create<AppState>((set, get) => ({
     }
   },
 
+  syncChanges: async () => {
+    const { changeToken } = get();
+    if (!changeToken) return;
+    
+    try {
+      let token: string = changeToken;
+      let hasMore = true;
+      
+      while (hasMore) {
+        const result = await apiService.getFileChanges(token);
+        if (result.reset) {
+          // 令牌已过期，回退到全量刷新
+          await get().refreshFromServer();
+          return;
+        }
+        
+        if (result.changes.length > 0) {
+          set((state) => {
+            let images = state.images;
+            let processedImages = state.processedImages;
+            
+            for (const change of result.changes) {
+              if (change.directory === 'source') {
+                images = images.filter(img => img.id !== change.filename);
+                if ((change.change_type === 'added' || change.change_type === 'modified') && change.file) {
+                  images = [toPendingImage(change.file), ...images];
+                }
+              }
+              if (change.change_type === 'moved' && change.to_directory === 'processed' && change.to_filename) {
+                processedImages = [...processedImages, toProcessedImage(change.to_filename)];
+              } else if (change.directory === 'processed' && change.change_type === 'added') {
+                processedImages = [...processedImages, toProcessedImage(change.filename)];
+              } else if (change.directory === 'processed' && change.change_type === 'removed') {
+                processedImages = processedImages.filter(img => img.id !== `processed_${change.filename}`);
+              }
+            }
+            
+            const currentRemoved = state.currentImage !== null
+              && state.currentImage.status === 'pending'
+              && !images.some(img => img.id === state.currentImage?.id);
+            
+            return {
+              images,
+              processedImages,
+              currentImage: currentRemoved ? null : state.currentImage,
+              lastRefresh: Date.now()
+            };
+          });
+        }
+        
+        token = result.token;
+        hasMore = result.has_more;
+      }
+      
+      set({ changeToken: token });
+    } catch (error) {
+      console.error('Failed to sync changes from server:', error);
+    }
+  },
+
   loadImageFromServer: async (filename: string) => {
     try {
       const imageUrl = await apiService.getImage(filename);
@@ -14,6 +14,19 @@ export function createImageFromFile(file: File): ProcessedImage {
   };
 }
 
+export type ImageLevel = 'thumb' | 'preview' | 'editor' | 'full';
+
+/**
+ * 服务器图片地址附加金字塔级别参数；本地 blob 地址原样返回
+ * 级别图与原图宽高比相同，画布按比例适配显示，坐标换算不受影响
+ */
+export function getImageLevelUrl(url: string, level: ImageLevel): string {
+  if (level === 'full' || !url.includes('/api/image/')) {
+    return url;
+  }
+  return `${url}${url.includes('?') ? '&' : '?'}level=${level}`;
+}
+
 /**
  * Load an image and return its dimensions
  */
@@ -0,0 +1,105 @@
+import { apiService, type TileInfo } from '../services/api';
+
+// 最多缓存的瓦片数（256x256 解码后约 256KB，上限约 50MB）
+const MAX_CACHED_TILES = 200;
+
+export interface TileRect {
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+}
+
+/**
+ * Deep Zoom 瓦片源
+ * 按当前缩放选择级别，只加载视口内的瓦片，内存和传输量取决于视口而不是原图大小
+ */
+export class TileSource {
+  private readonly tiles = new Map<string, HTMLImageElement>();
+  private readonly loading = new Set<string>();
+
+  constructor(
+    private readonly filename: string,
+    readonly info: TileInfo,
+    private readonly onTileLoaded: () => void
+  ) {}
+
+  /**
+   * 选择级别：该级别每个像素不大于屏幕上一个像素
+   * @param scale 画布单位 / 原图像素
+   */
+  levelForScale(scale: number): number {
+    const level = this.info.max_level + Math.ceil(Math.log2(Math.max(scale, 1e-6)));
+    return Math.max(0, Math.min(this.info.max_level, level));
+  }
+
+  /** 某一级别的最大边长 */
+  levelSize(level: number): number {
+    return Math.ceil(Math.max(this.info.width, this.info.height) / 2 ** (this.info.max_level - level));
+  }
+
+  /**
+   * 绘制可见区域内的瓦片，未加载的瓦片会异步请求，加载完成后触发 onTileLoaded
+   * @param ctx 画布上下文
+   * @param level 瓦片级别
+   * @param visible 可见区域（原图坐标）
+   * @param origin 原图 (0, 0) 在画布上的位置
+   * @param scale 画布单位 / 原图像素
+   */
+  draw(ctx: CanvasRenderingContext2D, level: number, visible: TileRect, origin: { x: number; y: number }, scale: number) {
+    const { tile_size: tileSize } = this.info;
+    const downsample = 2 ** (this.info.max_level - level);
+    const span = tileSize * downsample; // 一个瓦片覆盖的原图像素
+
+    const x0 = Math.max(0, visible.x);
+    const y0 = Math.max(0, visible.y);
+    const x1 = Math.min(this.info.width, visible.x + visible.width);
+    const y1 = Math.min(this.info.height, visible.y + visible.height);
+    if (x1 <= x0 || y1 <= y0) return;
+
+    for (let row = Math.floor(y0 / span); row * span < y1; row++) {
+      for (let column = Math.floor(x0 / span); column * span < x1; column++) {
+        const tile = this.getTile(level, column, row);
+        if (!tile) continue;
+        ctx.drawImage(
+          tile,
+          origin.x + column * span * scale,
+          origin.y + row * span * scale,
+          tile.naturalWidth * downsample * scale,
+          tile.naturalHeight * downsample * scale
+        );
+      }
+    }
+  }
+
+  private getTile(level: number, column: number, row: number): HTMLImageElement | null {
+    const url = apiService.getTileUrl(this.filename, level, column, row, this.info.version);
+    const cached = this.tiles.get(url);
+    if (cached) {
+      // 刷新 LRU 顺序
+      this.tiles.delete(url);
+      this.tiles.set(url, cached);
+      return cached;
+    }
+
+    if (!this.loading.has(url)) {
+      this.loading.add(url);
+      const img = new Image();
+      img.crossOrigin = 'anonymous';
+      img.onload = () => {
+        this.loading.delete(url);
+        this.tiles.set(url, img);
+        while (this.tiles.size > MAX_CACHED_TILES) {
+          const oldest = this.tiles.keys().next().value as string;
+          this.tiles.delete(oldest);
+        }
+        this.onTileLoaded();
+      };
+      img.onerror = () => {
+        this.loading.delete(url);
+      };
+      img.src = url;
+    }
+    return null;
+  }
+}
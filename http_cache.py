@@ -0,0 +1,123 @@
+"""
+HTTP 缓存校验模块
+为图片、缩略图和列表接口生成强 ETag / Last-Modified，并处理
+If-None-Match / If-Modified-Since 条件请求，命中时返回 304
+"""
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+
+# 内容寻址 URL（带版本参数）的缓存策略：版本变化即 URL 变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def file_version(inode: int, size: int, mtime_ns: int) -> str:
+    """
+    根据 (inode, size, mtime_ns) 生成文件版本号
+
+    Returns:
+        str: 紧凑的十六进制版本字符串，文件被替换或修改后必然变化
+    """
+    return f"{inode:x}-{size:x}-{mtime_ns:x}"
+
+
+def stat_version(stat_result) -> str:
+    """根据 os.stat 结果生成文件版本号"""
+    return file_version(stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def make_etag(version: str) -> str:
+    """将版本号包装为强 ETag"""
+    return f'"{version}"'
+
+
+def content_etag(content: bytes) -> str:
+    """根据响应内容哈希生成强 ETag"""
+    return make_etag(hashlib.sha1(content).hexdigest())
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    判断条件请求是否可以返回 304
+
+    If-None-Match 存在时优先使用，否则比较 If-Modified-Since。
+
+    Args:
+        request: 当前请求
+        etag: 资源当前的 ETag
+        last_modified: 资源的最后修改时间戳（秒）
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP 日期只精确到秒
+        return int(last_modified) <= int(since)
+
+    return False
+
+
+def not_modified_response(etag: str, headers: Optional[dict] = None) -> Response:
+    """构造 304 响应，保留 ETag 和缓存相关头部"""
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+
+
+def conditional_file_response(request: Request, path: str, media_type: str,
+                              headers: Optional[dict] = None, stat_result=None) -> Response:
+    """
+    返回带 ETag / Last-Modified 的文件响应，条件请求命中时返回 304
+
+    Args:
+        request: 当前请求
+        path: 文件路径
+        media_type: MIME 类型
+        headers: 额外的响应头（如 Cache-Control、CORS）
+        stat_result: 已有的 stat 结果，避免重复 stat
+    """
+    stat_result = stat_result or os.stat(path)
+    etag = make_etag(stat_version(stat_result))
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return not_modified_response(etag, headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+
+def conditional_json_response(request: Request, model, headers: Optional[dict] = None) -> Response:
+    """
+    序列化 Pydantic 模型并以内容哈希作为 ETag 返回，内容未变化时返回 304
+
+    列表内容变化时 ETag 随之变化，客户端重复轮询同一批文件时几乎不传输数据。
+    """
+    body = model.model_dump_json().encode("utf-8")
+    etag = content_etag(body)
+    headers = {"Cache-Control": "no-cache", **(headers or {}), "ETag": etag}
+
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,517 @@
+"""
+解码图像缓存模块
+在进程内按 LRU 缓存解码后的原图 ndarray，同一文件的预览、裁剪和自动检测只解码一次。
+缓存键为 (路径, inode, mtime_ns, size)，文件被修改或替换后自然失效；
+裁剪移动文件时显式清除对应条目。
+
+多 worker 部署时可以加一层跨进程的 .npy 落盘缓存（优先放在 tmpfs 上）：解码结果以 mmap
+方式共享，一个 worker 解码后其他 worker 直接映射同一份页面，不再各自解码和占用内存
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# 默认内存预算：约 6 张 6000x4000 的 RGB 图像
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 跨进程落盘缓存的默认容量（tmpfs 占用的是内存）
+DEFAULT_SPOOL_BYTES = 1024 * 1024 * 1024
+
+CacheKey = Tuple[str, int, int, int]
+
+SPOOL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS decoded_spool (
+    token TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_decoded_spool_access ON decoded_spool (last_access);
+CREATE INDEX IF NOT EXISTS idx_decoded_spool_path ON decoded_spool (path);
+"""
+
+
+def make_cache_key(path: str, stat_result=None) -> CacheKey:
+    """根据文件路径和 os.stat 结果生成缓存键"""
+    if stat_result is None:
+        stat_result = os.stat(path)
+    return (os.path.abspath(path), stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def default_spool_dir(db_path: str) -> str:
+    """
+    落盘缓存目录：优先使用 /dev/shm（tmpfs），按数据库路径区分不同的服务实例
+    """
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    tag = hashlib.sha1(os.path.abspath(db_path).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(root, f"picture_crop-{tag}")
+
+
+class DecodedImageSpool:
+    """
+    跨进程共享的解码图像缓存
+
+    每张解码后的图像保存为一个 .npy 文件，读取时以只读 mmap 打开，同一台机器上的所有
+    worker 共享操作系统页缓存中的同一份数据。索引保存在与 FileIndex 相同的 SQLite 数据库中，
+    按最近访问时间在所有进程之间统一淘汰。
+    """
+
+    def __init__(self, db_path: str, spool_dir: str, max_bytes: int = DEFAULT_SPOOL_BYTES):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径（与 FileIndex 相同）
+            spool_dir: .npy 文件目录
+            max_bytes: 落盘数据总大小上限（字节）
+        """
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SPOOL_SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def load(self, key: CacheKey) -> Optional[np.ndarray]:
+        """
+        以只读 mmap 打开已落盘的图像
+
+        Returns:
+            numpy.ndarray: 只读数组，未缓存时返回 None
+        """
+        token = self._token(key)
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE decoded_spool SET last_access = ? WHERE token = ?", (time.time(), token)
+            )
+            if cursor.rowcount == 0:
+                return None
+        try:
+            return np.load(self._file_path(token), mmap_mode="r", allow_pickle=False)
+        except (OSError, ValueError):
+            # 文件已被其他进程淘汰或不完整
+            with self._lock:
+                self._conn.execute("DELETE FROM decoded_spool WHERE token = ?", (token,))
+            return None
+
+    def store(self, key: CacheKey, image: np.ndarray) -> Optional[np.ndarray]:
+        """
+        写入一张解码后的图像，必要时淘汰最久未访问的条目
+
+        Returns:
+            numpy.ndarray: 指向落盘文件的只读 mmap 数组，超过容量或写入失败时返回 None
+        """
+        if image.nbytes > self.max_bytes:
+            return None
+        token = self._token(key)
+        path = self._file_path(token)
+        # 先写临时文件再替换，其他进程不会映射到写了一半的文件
+        temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(image), allow_pickle=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"解码缓存写入失败: {e}")
+            self._remove_file(temp_path)
+            return None
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO decoded_spool (token, path, nbytes, last_access) VALUES (?, ?, ?, ?)",
+                    (token, key[0], image.nbytes, time.time()),
+                )
+                evicted = self._evict_locked()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for evicted_token in evicted:
+            self._remove_file(self._file_path(evicted_token))
+        try:
+            return np.load(path, mmap_mode="r", allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+
+    def invalidate(self, path: str) -> int:
+        """
+        清除某个路径的所有落盘版本
+
+        Returns:
+            int: 清除的条目数
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens = [row["token"] for row in self._conn.execute(
+                    "SELECT token FROM decoded_spool WHERE path = ?", (os.path.abspath(path),)
+                )]
+                self._conn.execute("DELETE FROM decoded_spool WHERE path = ?", (os.path.abspath(path),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for token in tokens:
+            self._remove_file(self._file_path(token))
+        return len(tokens)
+
+    def registered(self, keys: List[CacheKey]) -> set:
+        """
+        返回仍登记在索引中的缓存键（未被淘汰或清除）
+
+        Returns:
+            set: keys 中仍有效的键
+        """
+        if not keys:
+            return set()
+        tokens = {self._token(key): key for key in keys}
+        placeholders = ",".join("?" * len(tokens))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT token FROM decoded_spool WHERE token IN ({placeholders})", list(tokens)
+            ).fetchall()
+        return {tokens[row["token"]] for row in rows}
+
+    def sweep(self, min_age: float = 60.0) -> int:
+        """
+        删除索引中已不存在的 .npy 文件（例如 Windows 上淘汰时文件仍被映射而未能删除）
+
+        Args:
+            min_age: 只删除修改时间早于该秒数的文件，避免误删其他进程刚写入、尚未登记的文件
+
+        Returns:
+            int: 删除的文件数
+        """
+        with self._lock:
+            tokens = {row["token"] for row in self._conn.execute("SELECT token FROM decoded_spool")}
+        cutoff = time.time() - min_age
+        removed = 0
+        for entry in os.listdir(self.spool_dir):
+            token, ext = os.path.splitext(entry)
+            if ext != ".npy" or token in tokens:
+                continue
+            path = os.path.join(self.spool_dir, entry)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue
+            if self._remove_file(path):
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        """落盘缓存统计信息"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(nbytes), 0) AS bytes FROM decoded_spool"
+            ).fetchone()
+        return {"entries": row["entries"], "bytes": row["bytes"], "max_bytes": self.max_bytes}
+
+    def _evict_locked(self) -> List[str]:
+        """按最近访问时间淘汰超出容量的条目（调用方需持有锁并处于事务中），返回被淘汰的 token"""
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM decoded_spool").fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+        for row in self._conn.execute("SELECT token, nbytes FROM decoded_spool ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append(row["token"])
+            total -= row["nbytes"]
+        self._conn.executemany("DELETE FROM decoded_spool WHERE token = ?", [(token,) for token in evicted])
+        return evicted
+
+    def _file_path(self, token: str) -> str:
+        return os.path.join(self.spool_dir, f"{token}.npy")
+
+    @staticmethod
+    def _token(key: CacheKey) -> str:
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _remove_file(path: str) -> bool:
+        # POSIX 上删除仍被其他进程映射的文件是安全的，映射在解除前一直有效
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+class DecodedImageCache:
+    """
+    按字节预算淘汰的解码图像 LRU 缓存
+
+    返回的数组被设为只读，多个请求共享同一份数据；需要修改时调用方应先复制。
+    同一文件的并发未命中只解码一次，其余请求等待该次解码的结果。
+    配置了 spool 时，本进程未命中会先查找其他 worker 落盘的解码结果，
+    自己解码的图像也会落盘，进程内缓存保存的是指向落盘文件的 mmap 数组。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, spool: Optional[DecodedImageSpool] = None):
+        """
+        Args:
+            max_bytes: 缓存的解码数据总大小上限（字节）
+            spool: 跨进程落盘缓存，不传时只在进程内缓存
+        """
+        self.max_bytes = max_bytes
+        self.spool = spool
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        # 正在解码的键 -> 完成事件
+        self._loading: Dict[CacheKey, threading.Event] = {}
+        self.hits = 0
+        self.spool_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        """
+        返回解码后的图像，未缓存时解码并加入缓存（同步执行，调用方应放在线程中）
+
+        Returns:
+            numpy.ndarray: 只读的 BGR 图像，文件不存在或无法解码时返回 None
+        """
+        try:
+            key = make_cache_key(path)
+        except OSError:
+            return None
+
+        while True:
+            with self._lock:
+                image = self._entries.get(key)
+                if image is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return image
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # 其他线程正在解码同一文件，等待后重新查找
+            loading.wait()
+
+        try:
+            image = self.spool.load(key) if self.spool is not None else None
+            if image is not None:
+                with self._lock:
+                    self.spool_hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                image = cv2.imread(path)
+                if image is None:
+                    return None
+                spooled = self.spool.store(key, image) if self.spool is not None else None
+                if spooled is not None:
+                    # 换成 mmap 数组，本进程不再保留私有的一份解码数据
+                    image = spooled
+                image.flags.writeable = False
+            self._put(key, image)
+            return image
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            loading.set()
+
+    def peek(self, path: str) -> Optional[np.ndarray]:
+        """只查找缓存，不解码也不计入命中统计"""
+        try:
+            key = make_cache_key(path)
+        except OSError:
+            return None
+        with self._lock:
+            return self._entries.get(key)
+
+    def invalidate(self, path: str) -> int:
+        """
+        清除某个路径的所有缓存版本（文件被移动、删除或覆盖时调用），包括落盘缓存
+
+        Returns:
+            int: 清除的进程内条目数
+        """
+        if self.spool is not None:
+            self.spool.invalidate(path)
+        return self._invalidate_local(path)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self, include_spool: bool = True) -> dict:
+        """
+        缓存统计信息
+
+        Args:
+            include_spool: 是否附带落盘缓存的统计（需要查询数据库）
+        """
+        with self._lock:
+            lookups = self.hits + self.spool_hits + self.misses
+            stats = {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "spool_hits": self.spool_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.spool_hits) / lookups if lookups else 0.0,
+            }
+        if include_spool and self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
+
+    def prune_stale(self) -> int:
+        """
+        清除已失效的条目，释放其占用的内存（引擎进程在每个任务开始前调用）
+
+        以下条目视为失效：原图已被移动、删除或覆盖（stat 与缓存键不一致）；
+        或者指向的落盘文件已被清除或淘汰（例如服务进程在裁剪移动文件时调用了 invalidate）。
+        后者在 tmpfs 上已被删除，但映射不解除就一直占用内存，且不计入落盘缓存的容量。
+
+        Returns:
+            int: 清除的条目数
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        if not entries:
+            return 0
+
+        stale = set()
+        for key, _ in entries:
+            try:
+                current = make_cache_key(key[0])
+            except OSError:
+                current = None
+            if current != key:
+                stale.add(key)
+        if self.spool is not None:
+            spooled = [key for key, image in entries if key not in stale and isinstance(image, np.memmap)]
+            registered = self.spool.registered(spooled)
+            stale.update(key for key in spooled if key not in registered)
+
+        with self._lock:
+            for key in stale:
+                image = self._entries.pop(key, None)
+                if image is not None:
+                    self._bytes -= image.nbytes
+        return len(stale)
+
+    def _invalidate_local(self, path: str) -> int:
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == abs_path]
+            for key in keys:
+                self._bytes -= self._entries.pop(key).nbytes
+        return len(keys)
+
+    def _put(self, key: CacheKey, image: np.ndarray):
+        """加入缓存并按字节预算淘汰最久未使用的条目；单张超过预算的图像不缓存"""
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = image
+            self._bytes += image.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+
+# 预览缓存的角点量化步长（像素）：拖动产生的亚像素抖动映射到同一个缓存键
+PREVIEW_POINT_STEP = 0.125
+
+# 预览结果缓存默认容量（编码后的 JPEG，单张约 50~150KB）
+DEFAULT_PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def quantize_points(points, step: float = PREVIEW_POINT_STEP) -> Tuple[Tuple[float, float], ...]:
+    """
+    将角点坐标量化到 step 的整数倍
+
+    Returns:
+        tuple: 可作为缓存键的角点元组，渲染时也应使用量化后的坐标以保证与缓存内容一致
+    """
+    return tuple((round(x / step) * step, round(y / step) * step) for x, y in points)
+
+
+class PreviewCache:
+    """
+    编码后的裁剪预览 LRU 缓存
+
+    键由调用方组成，一般为 (文件版本, 量化角点, 输出尺寸, JPEG 质量)，
+    文件变化后版本不同，旧条目不再命中并随容量淘汰。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_PREVIEW_CACHE_BYTES):
+        """
+        Args:
+            max_bytes: 缓存的 JPEG 数据总大小上限（字节）
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        """查找预览，命中时刷新 LRU 顺序"""
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key: tuple, content: bytes):
+        """加入缓存并按容量淘汰最久未使用的条目"""
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = content
+            self._bytes += len(content)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,439 @@
+"""
+图像处理引擎模块
+在独立的进程池中执行解码、透视变换、角点检测、缩略图和编码任务。
+每个进程只导入一次 cv2，并按进程数设置 OpenCV 内部线程数，避免多个 uvicorn worker
+各自开满 OpenCV 线程造成的核心超订；进程在处理一定数量的任务或常驻内存超过阈值后
+被替换，限制大图解码带来的堆碎片
+"""
+import asyncio
+import ctypes
+import multiprocessing
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from executors import ExecutorBusy
+from image_cache import DecodedImageCache, DecodedImageSpool
+from image_processor import (
+    auto_detect_corners,
+    auto_detect_corners_in_image,
+    encode_image,
+    generate_thumbnail,
+    read_image_reduced,
+    set_jpeg_dpi,
+    single_threaded_opencv,
+    transform_quad,
+)
+
+
+# 默认进程数：为 uvicorn worker 和后台线程保留一半的核
+DEFAULT_ENGINE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 每个进程处理多少个任务后被替换
+DEFAULT_MAX_TASKS_PER_CHILD = 200
+# 进程常驻内存超过该值（且归还空闲堆后仍超过）时替换进程池
+DEFAULT_MAX_RSS = 1536 * 1024 * 1024
+# 每个进程内解码缓存的容量；配置了落盘缓存时缓存的是 mmap 数组，几乎不占私有内存
+DEFAULT_WORKER_CACHE_BYTES = 256 * 1024 * 1024
+# 进程内解码缓存的累计计数
+CACHE_COUNTERS = ("hits", "spool_hits", "misses", "evictions")
+
+
+# ---- 以下在引擎进程中执行 ----
+
+_worker_cache: Optional[DecodedImageCache] = None
+# 大尺寸输出分条带并行变换的线程池，每个进程只有一个 OpenCV 线程时不创建
+_worker_threads: Optional[ThreadPoolExecutor] = None
+
+
+def _init_worker(cv_threads: int, cache_bytes: int, spool_db: Optional[str], spool_dir: Optional[str]):
+    """进程初始化：设置 OpenCV 线程数，创建进程内解码缓存和条带变换线程池"""
+    global _worker_cache, _worker_threads
+    cv2.setNumThreads(cv_threads)
+    spool = DecodedImageSpool(spool_db, spool_dir) if spool_db and spool_dir else None
+    _worker_cache = DecodedImageCache(cache_bytes, spool=spool)
+    if cv_threads > 1:
+        _worker_threads = ThreadPoolExecutor(max_workers=cv_threads, thread_name_prefix="warp-strip")
+
+
+def _current_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法获取时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _trim_heap():
+    """把 glibc 堆中空闲的内存归还给操作系统（其他平台不做处理）"""
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def decode_task(path: str, max_side: Optional[int] = None):
+    """解码图片；指定 max_side 时按该尺寸缩小解码（JPEG 使用 DCT 缩小解码）"""
+    if max_side is not None:
+        image, _ = read_image_reduced(path, max_side)
+        return image
+    image = _worker_cache.get(path)
+    # 缓存中的数组是只读 mmap，复制后再传回
+    return None if image is None else np.array(image)
+
+
+def warp_task(path: str, points, source_size=None, max_size: Optional[int] = None,
+              output_path: Optional[str] = None, image_format: Optional[str] = None, quality: int = 90,
+              output_size=None, dpi: Optional[float] = None):
+    """
+    透视变换
+
+    output_size 指定输出 (宽, 高) 时透视矩阵直接映射到该尺寸，只重采样一次；
+    dpi 写入输出 JPEG 的像素密度。
+
+    Returns:
+        传入 output_path 时写入文件并返回 (宽, 高, 计算方式)；传入 image_format 时返回编码后的字节；
+        否则返回变换后的图像。无法读取图片时返回 None
+    """
+    image = _worker_cache.get(path)
+    if image is None:
+        return None
+    warped, method = transform_quad(image, points, max_size=max_size, source_size=source_size,
+                                       executor=_worker_threads, output_size=output_size)
+    if output_path is not None:
+        if not cv2.imwrite(output_path, warped):
+            raise IOError(f"无法保存裁剪结果: {output_path}")
+        if dpi:
+            set_jpeg_dpi(output_path, dpi)
+        return warped.shape[1], warped.shape[0], method
+    if image_format is not None:
+        success, buf = encode_image(warped, image_format, quality)
+        if not success:
+            raise ValueError("图片编码失败")
+        return buf.tobytes()
+    return warped
+
+
+def warp_regions_task(path: str, regions, output_paths, output_sizes=None, dpi: Optional[float] = None):
+    """
+    从同一张原图裁剪多个区域：原图只解码一次，各区域在条带线程池中并行变换并写入文件
+
+    Args:
+        regions: 各区域的四个角点
+        output_paths: 各区域的输出文件路径
+        output_sizes: 各区域的输出 (宽, 高)，不传时按全分辨率输出
+
+    Returns:
+        list: 各区域的 (宽, 高, 计算方式)；无法读取图片时返回 None
+    """
+    image = _worker_cache.get(path)
+    if image is None:
+        return None
+    output_sizes = output_sizes or [None] * len(regions)
+
+    def crop_region(index, executor=None):
+        warped, method = transform_quad(image, regions[index], output_size=output_sizes[index], executor=executor)
+        if not cv2.imwrite(output_paths[index], warped):
+            raise IOError(f"无法保存裁剪结果: {output_paths[index]}")
+        if dpi:
+            set_jpeg_dpi(output_paths[index], dpi)
+        return warped.shape[1], warped.shape[0], method
+
+    indexes = range(len(regions))
+    if _worker_threads is None or len(regions) == 1:
+        # 只有一个区域时由该区域按条带并行
+        return [crop_region(index, _worker_threads) for index in indexes]
+    # 区域之间已经并行，单个区域内不再按条带拆分，OpenCV 内部也不再开线程
+    with single_threaded_opencv():
+        return list(_worker_threads.map(crop_region, indexes))
+
+
+def template_warp_task(path: str, output_path: str, rect, source_size, output_size,
+                       decode_size: Optional[int] = None, dpi: Optional[float] = None):
+    """
+    批量裁剪中的一帧：角点和输出尺寸已按帧尺寸预先算好，这里只做解码、变换和编码
+
+    帧只处理一次，不经过解码缓存；输出明显小于原图时按 decode_size 缩小解码（JPEG DCT 缩小）。
+
+    Returns:
+        tuple: (宽, 高, 计算方式)
+    """
+    image, size = read_image_reduced(path, decode_size or max(source_size))
+    if image is None:
+        raise IOError(f"无法读取图片: {path}")
+    if tuple(size) != tuple(source_size):
+        raise ValueError(f"图片尺寸 {size[0]}x{size[1]} 与模板不一致")
+    warped, method = transform_quad(image, rect, source_size=source_size, output_size=output_size,
+                                    executor=_worker_threads)
+    if not cv2.imwrite(output_path, warped):
+        raise IOError(f"无法保存裁剪结果: {output_path}")
+    if dpi:
+        set_jpeg_dpi(output_path, dpi)
+    return warped.shape[1], warped.shape[0], method
+
+
+def detect_task(path: str, debug: bool = False):
+    """自动检测角点；原图已在本进程缓存中时直接在内存中检测"""
+    cached = _worker_cache.peek(path)
+    if cached is not None:
+        return auto_detect_corners_in_image(cached, debug=debug)
+    return auto_detect_corners(path, debug=debug)
+
+
+def thumbnail_task(path: str, thumbnail_path: str) -> bool:
+    """生成缩略图"""
+    return generate_thumbnail(path, thumbnail_path)
+
+
+def encode_task(image, image_format: str = "jpeg", quality: int = 90) -> bytes:
+    """编码图像"""
+    success, buf = encode_image(image, image_format, quality)
+    if not success:
+        raise ValueError("图片编码失败")
+    return buf.tobytes()
+
+
+TASKS = {
+    "decode": decode_task,
+    "warp": warp_task,
+    "warp_regions": warp_regions_task,
+    "template_warp": template_warp_task,
+    "detect": detect_task,
+    "thumbnail": thumbnail_task,
+    "encode": encode_task,
+}
+
+
+def _run_task(name: str, args, kwargs, max_rss: int):
+    """
+    执行任务并检查常驻内存，同时带回本进程解码缓存的统计
+
+    Returns:
+        tuple: (任务结果, 是否需要替换进程, (进程号, 解码缓存统计))
+    """
+    # 释放已被移动、覆盖或在落盘缓存中清除的原图，避免已删除的 tmpfs 页面一直被映射
+    _worker_cache.prune_stale()
+    result = TASKS[name](*args, **kwargs)
+    rss = _current_rss()
+    if rss is not None and rss > max_rss:
+        _trim_heap()
+        rss = _current_rss()
+    return result, rss is not None and rss > max_rss, (os.getpid(), _worker_cache.stats(include_spool=False))
+
+
+# ---- 以下在调用方进程中执行 ----
+
+class ImageEngine:
+    """
+    进程池图像处理引擎
+
+    同时存在的任务（运行中 + 排队中）不超过 workers + max_queue，超出时立即抛出 ExecutorBusy。
+    进程达到任务数上限后由进程池自动替换；任务报告内存超限或进程异常退出时，
+    整个进程池被替换：新任务进入新进程池，旧进程池完成已提交的任务后退出。
+    """
+
+    def __init__(self, workers: int = DEFAULT_ENGINE_WORKERS, cv_threads: Optional[int] = None,
+                 max_queue: Optional[int] = None,
+                 max_tasks_per_child: int = DEFAULT_MAX_TASKS_PER_CHILD,
+                 max_rss: int = DEFAULT_MAX_RSS,
+                 cache_bytes: int = DEFAULT_WORKER_CACHE_BYTES,
+                 spool_db: Optional[str] = None, spool_dir: Optional[str] = None):
+        """
+        Args:
+            workers: 进程数
+            cv_threads: 每个进程的 OpenCV 线程数，默认按核心数平均分配
+            max_queue: 最多排队的任务数，默认为进程数的 4 倍
+            max_tasks_per_child: 每个进程处理多少个任务后被替换
+            max_rss: 进程常驻内存上限（字节）
+            cache_bytes: 每个进程内解码缓存的容量
+            spool_db: 落盘解码缓存的索引数据库，与 spool_dir 同时传入时启用
+            spool_dir: 落盘解码缓存目录
+        """
+        self.workers = workers
+        self.cv_threads = cv_threads or max(1, (os.cpu_count() or 1) // workers)
+        self.max_queue = workers * 4 if max_queue is None else max_queue
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_rss = max_rss
+        self._initargs = (self.cv_threads, cache_bytes, spool_db, spool_dir)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(workers + self.max_queue)
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.recycled = 0
+        # 各进程最近一次报告的解码缓存统计（按报告顺序，只保留最近的 workers 个进程）和累计计数
+        self._worker_caches: "OrderedDict[int, dict]" = OrderedDict()
+        self._cache_totals = dict.fromkeys(CACHE_COUNTERS, 0)
+
+    def start(self):
+        """启动进程池（首次提交任务时也会自动启动）"""
+        self._get_pool()
+
+    def stop(self):
+        """停止进程池"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, task: str, *args, **kwargs):
+        """
+        在进程池中执行任务并等待结果
+
+        Raises:
+            ExecutorBusy: 运行和排队名额已满
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy("engine")
+        return await asyncio.wrap_future(self._submit(task, args, kwargs))
+
+    def call(self, task: str, *args, **kwargs):
+        """在后台线程中同步执行任务（名额已满时等待，不拒绝）"""
+        self._slots.acquire()
+        return self._submit(task, args, kwargs).result()
+
+    async def decode(self, path: str, max_side: Optional[int] = None):
+        return await self.run("decode", path, max_side)
+
+    async def warp(self, path: str, points, **kwargs):
+        return await self.run("warp", path, points, **kwargs)
+
+    async def warp_regions(self, path: str, regions, output_paths, **kwargs):
+        return await self.run("warp_regions", path, regions, output_paths, **kwargs)
+
+    async def template_warp(self, path: str, output_path: str, rect, source_size, output_size, **kwargs):
+        return await self.run("template_warp", path, output_path, rect, source_size, output_size, **kwargs)
+
+    async def detect(self, path: str, debug: bool = False):
+        return await self.run("detect", path, debug)
+
+    async def thumbnail(self, path: str, thumbnail_path: str) -> bool:
+        return await self.run("thumbnail", path, thumbnail_path)
+
+    async def encode(self, image, image_format: str = "jpeg", quality: int = 90) -> bytes:
+        return await self.run("encode", image, image_format, quality)
+
+    def stats(self) -> dict:
+        """引擎统计信息"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "cv_threads": self.cv_threads,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "recycled": self.recycled,
+                "decoded_cache": self._cache_stats_locked(),
+            }
+
+    def _cache_stats_locked(self) -> dict:
+        """汇总各进程解码缓存的统计（调用方需持有锁）"""
+        lookups = self._cache_totals["hits"] + self._cache_totals["spool_hits"] + self._cache_totals["misses"]
+        caches = list(self._worker_caches.values())
+        return {
+            **self._cache_totals,
+            "hit_rate": (self._cache_totals["hits"] + self._cache_totals["spool_hits"]) / lookups if lookups else 0.0,
+            "entries": sum(cache["entries"] for cache in caches),
+            "bytes": sum(cache["bytes"] for cache in caches),
+            "max_bytes": sum(cache["max_bytes"] for cache in caches),
+        }
+
+    def _record_cache_stats(self, pid: int, stats: dict):
+        """
+        记录任务带回的进程解码缓存统计
+
+        计数按与该进程上次报告的差值累加，进程被替换后累计值不会回退；
+        条目数和字节数只统计最近报告过的 workers 个进程。
+        """
+        with self._lock:
+            previous = self._worker_caches.pop(pid, None)
+            for key in CACHE_COUNTERS:
+                self._cache_totals[key] += stats[key] - (previous[key] if previous else 0)
+            self._worker_caches[pid] = stats
+            while len(self._worker_caches) > self.workers:
+                self._worker_caches.popitem(last=False)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # max_tasks_per_child 要求 spawn 方式启动进程（Windows 默认即为 spawn）
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=self._initargs,
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+            return self._pool
+
+    def _submit(self, task: str, args, kwargs) -> Future:
+        """提交任务（调用方已取得名额），返回结果为任务返回值的 Future"""
+        result: Future = Future()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            pool = self._get_pool()
+            inner = pool.submit(_run_task, task, args, kwargs, self.max_rss)
+        except BaseException as e:
+            self._finish(None)
+            if isinstance(e, BrokenProcessPool):
+                self._recycle(self._pool)
+            raise
+
+        def on_done(inner_future: Future):
+            value, error = None, None
+            try:
+                value, over_limit, (pid, cache_stats) = inner_future.result()
+            except BrokenProcessPool as e:
+                # 进程异常退出（例如被系统因内存不足杀掉）
+                self._recycle(pool)
+                self._finish(None)
+                error = RuntimeError(f"图像处理进程异常退出: {e}")
+            except BaseException as e:
+                self._finish(inner_future)
+                error = e
+            else:
+                self._record_cache_stats(pid, cache_stats)
+                if over_limit:
+                    self._recycle(pool)
+                self._finish(inner_future)
+            # 调用方可能已经取消等待（例如实时预览被新请求取代），此时丢弃结果；
+            # 返回 True 后 result 进入运行状态，不会再被并发取消
+            if not result.set_running_or_notify_cancel():
+                return
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(value)
+
+        inner.add_done_callback(on_done)
+        return result
+
+    def _recycle(self, pool: Optional[ProcessPoolExecutor]):
+        """替换进程池；旧进程池完成已提交的任务后退出"""
+        with self._lock:
+            if pool is None or self._pool is not pool:
+                # 已被其他任务替换
+                return
+            self._pool = None
+            self.recycled += 1
+        pool.shutdown(wait=False)
+
+    def _finish(self, future: Optional[Future]):
+        with self._lock:
+            self._in_flight -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
@@ -0,0 +1,210 @@
+"""
+图片元数据探测模块
+只读取 JPEG SOF / PNG IHDR / BMP 文件头获取宽高、格式和 EXIF 方向，
+避免为了读取尺寸而完整解码整张图片；文件头损坏时回退到 cv2.imread 完整解码
+"""
+import struct
+from typing import NamedTuple, Optional
+
+import cv2
+
+
+# JPEG 中携带图像尺寸的 SOF 标记（排除 DHT=C4、JPG=C8、DAC=CC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# 没有长度字段的独立标记（TEM、RST0-7）
+JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+# EXIF 方向 5-8 表示需要转置，显示尺寸的宽高互换
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ImageMetadata(NamedTuple):
+    """图片元数据，width/height 为应用 EXIF 方向后的显示尺寸（与 cv2.imread 结果一致）"""
+    width: int
+    height: int
+    format: str
+    orientation: int = 1
+    probe_method: str = "header"  # header: 文件头解析, decode: 完整解码回退
+
+
+def _parse_exif_orientation(data):
+    """
+    从 APP1 段数据中解析 EXIF 方向标签 (0x0112)
+
+    Args:
+        data: APP1 段内容（不含标记和长度字段）
+
+    Returns:
+        int: 方向值 (1-8)，无法解析时返回 1
+    """
+    if len(data) < 14 or data[:6] != b"Exif\x00\x00":
+        return 1
+
+    tiff = data[6:]
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return 1
+
+    try:
+        ifd_offset = struct.unpack(endian + "I", tiff[4:8])[0]
+        entry_count = struct.unpack(endian + "H", tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(entry_count):
+            entry_start = ifd_offset + 2 + i * 12
+            entry = tiff[entry_start:entry_start + 12]
+            if len(entry) < 12:
+                break
+            tag, value_type = struct.unpack(endian + "HH", entry[:4])
+            if tag == 0x0112 and value_type == 3:
+                orientation = struct.unpack(endian + "H", entry[8:10])[0]
+                return orientation if 1 <= orientation <= 8 else 1
+    except struct.error:
+        pass
+
+    return 1
+
+
+def _probe_jpeg(f):
+    """
+    逐段扫描 JPEG 标记，读取 SOF 中的尺寸和 APP1 中的 EXIF 方向
+
+    Returns:
+        tuple: (width, height, orientation)，解析失败返回 None
+    """
+    f.seek(2)
+    orientation = 1
+
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            return None
+
+        # 跳过填充字节 0xFF
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker_code = marker[0]
+
+        if marker_code in JPEG_STANDALONE_MARKERS:
+            continue
+        # 到达扫描数据或图像结束仍未找到 SOF，视为损坏
+        if marker_code in (0xD9, 0xDA):
+            return None
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        segment_length = struct.unpack(">H", length_bytes)[0]
+        if segment_length < 2:
+            return None
+
+        if marker_code in JPEG_SOF_MARKERS:
+            sof = f.read(5)
+            if len(sof) < 5:
+                return None
+            _, height, width = struct.unpack(">BHH", sof)
+            return width, height, orientation
+
+        if marker_code == 0xE1 and orientation == 1:
+            orientation = _parse_exif_orientation(f.read(segment_length - 2))
+        else:
+            f.seek(segment_length - 2, 1)
+
+
+def _probe_png(f):
+    """读取 PNG IHDR 块中的尺寸"""
+    f.seek(8)
+    chunk = f.read(16)
+    if len(chunk) < 16 or chunk[4:8] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", chunk[8:16])
+    return width, height, 1
+
+
+def _probe_bmp(f):
+    """读取 BMP DIB 头中的尺寸（兼容 BITMAPCOREHEADER）"""
+    f.seek(14)
+    header = f.read(12)
+    if len(header) < 12:
+        return None
+    dib_size = struct.unpack("<I", header[:4])[0]
+    if dib_size == 12:
+        width, height = struct.unpack("<HH", header[4:8])
+    else:
+        width, height = struct.unpack("<ii", header[4:12])
+    # 高度为负表示自上而下存储
+    return abs(width), abs(height), 1
+
+
+def probe_image_header(image_path):
+    """
+    只读取文件头获取图片尺寸信息，不解码像素
+
+    Args:
+        image_path: 图片文件路径
+
+    Returns:
+        ImageMetadata: 探测结果，格式不支持或文件头损坏时返回 None
+    """
+    try:
+        with open(image_path, "rb") as f:
+            signature = f.read(8)
+
+            if signature[:2] == b"\xff\xd8":
+                image_format, result = "jpeg", _probe_jpeg(f)
+            elif signature == PNG_SIGNATURE:
+                image_format, result = "png", _probe_png(f)
+            elif signature[:2] == b"BM":
+                image_format, result = "bmp", _probe_bmp(f)
+            else:
+                return None
+    except OSError:
+        return None
+
+    if result is None:
+        return None
+
+    width, height, orientation = result
+    if width <= 0 or height <= 0:
+        return None
+
+    # 与 cv2.imread 保持一致：按 EXIF 方向返回显示尺寸
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    return ImageMetadata(width, height, image_format, orientation, "header")
+
+
+def probe_image(image_path) -> Optional[ImageMetadata]:
+    """
+    获取图片元数据：优先解析文件头，失败时回退到完整解码
+
+    Args:
+        image_path: 图片文件路径
+
+    Returns:
+        ImageMetadata: 探测结果（probe_method 标明走的是哪条路径），无法读取时返回 None
+    """
+    metadata = probe_image_header(image_path)
+    if metadata is not None:
+        return metadata
+
+    print(f"文件头解析失败，回退到完整解码: {image_path}")
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+
+    height, width = img.shape[:2]
+    image_format = image_path.rsplit(".", 1)[-1].lower() if "." in image_path else "unknown"
+    if image_format == "jpg":
+        image_format = "jpeg"
+    return ImageMetadata(int(width), int(height), image_format, 1, "decode")
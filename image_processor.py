@@ -5,8 +5,30 @@
 import cv2
 import numpy as np
 import os
+from contextlib import contextmanager
 from PIL import Image
 
+from image_probe import probe_image_header
+
+
+# JPEG 缩小解码标志：libjpeg 在 DCT 阶段直接输出 1/2、1/4、1/8 尺寸，不必解码全分辨率
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+# 分条透视变换：输出像素数达到该值时按水平条带并行计算
+TILED_WARP_MIN_PIXELS = 16_000_000
+# 每个条带的行数，单个条带的临时内存约为 输出宽度 x 行数 x 3 字节
+TILED_WARP_STRIP_HEIGHT = 256
+# 条带在原图中的采样范围向外扩展的像素数，保证边缘的双线性插值与整图变换一致
+TILED_WARP_MARGIN = 2
+# 四边形各边与坐标轴的偏差在该值（像素）以内时视为轴对齐矩形，直接切片不做插值
+AXIS_ALIGNED_TOLERANCE = 0.5
+# 透视变换采样到图像边界外时复制边缘像素：角点贴边或预缩小后，最后一行/列不会混入黑边
+WARP_BORDER_MODE = cv2.BORDER_REPLICATE
+
 
 def order_points(pts):
     """
@@ -23,28 +45,179 @@ def order_points(pts):
     return rect
 
 
-def four_point_transform(image, pts):
+def get_warp_size(rect):
     """
-    执行四点透视变换，将梯形区域校正为矩形
+    计算四点透视变换后的全分辨率输出尺寸
     
     Args:
-        image: 输入图像
-        pts: 四个角点坐标
+        rect: 按左上、右上、右下、左下排列的四个角点
     
     Returns:
-        warped: 变换后的图像
+        tuple: (width, height)
     """
-    rect = order_points(pts)
     (tl, tr, br, bl) = rect
-    
-    # 计算新图像的宽度和高度
     widthA = np.linalg.norm(br - bl)
     widthB = np.linalg.norm(tr - tl)
-    maxWidth = int(max(widthA, widthB))
-    
     heightA = np.linalg.norm(tr - br)
     heightB = np.linalg.norm(tl - bl)
-    maxHeight = int(max(heightA, heightB))
+    return int(max(widthA, widthB)), int(max(heightA, heightB))
+
+
+def get_output_size(width, height, max_size=None):
+    """
+    按最大边长限制输出尺寸（与 resize_image_for_preview 的取整方式一致）
+    
+    Returns:
+        tuple: (width, height)
+    """
+    if max_size is None or (width <= max_size and height <= max_size):
+        return width, height
+    if width > height:
+        return max_size, max(1, int(height * max_size / width))
+    return max(1, int(width * max_size / height)), max_size
+
+
+def get_target_size(width, height, output_width=None, output_height=None, max_side=None, scale=None):
+    """
+    按请求的输出参数计算裁剪输出尺寸
+    
+    同时指定宽和高时按该尺寸输出（不保持比例）；只指定其一时按比例计算另一边；
+    否则按 scale（例如 目标 DPI / 原图 DPI）缩放。max_side 最后限制最大边长，只缩小不放大。
+    
+    Args:
+        width, height: 透视校正后的全分辨率尺寸
+    
+    Returns:
+        tuple: (width, height)
+    
+    Raises:
+        ValueError: 角点围成的区域宽或高为 0
+    """
+    if width <= 0 or height <= 0:
+        raise ValueError("角点围成的区域面积为 0")
+    if output_width and output_height:
+        width, height = output_width, output_height
+    elif output_width:
+        width, height = output_width, max(1, int(round(height * output_width / width)))
+    elif output_height:
+        width, height = max(1, int(round(width * output_height / height))), output_height
+    elif scale:
+        width, height = max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+    return get_output_size(width, height, max_side)
+
+
+def prefilter_for_shrink(image, rect, output_size):
+    """
+    缩小倍数较大时先用高斯金字塔预缩小采样区域
+    
+    warpPerspective 的双线性插值每个输出像素只读取 4 个原图像素，缩小 2 倍以上会产生锯齿和摩尔纹；
+    先 pyrDown 到缩小倍数小于 2，再做一次透视变换，仍然只有一次插值重采样。
+    只对角点外接矩形（加边距）做预缩小，小区域裁剪不处理整张原图。
+    
+    Args:
+        image: 输入图像
+        rect: 按左上、右上、右下、左下排列的角点（image 坐标）
+        output_size: 输出 (宽, 高)
+    
+    Returns:
+        tuple: (采样图像, 对应坐标系下的角点)
+    """
+    warp_width, warp_height = get_warp_size(rect)
+    factor = min(warp_width / max(output_size[0], 1), warp_height / max(output_size[1], 1))
+    if factor < 2:
+        return image, rect
+    
+    height, width = image.shape[:2]
+    margin = 2 * TILED_WARP_MARGIN * int(factor)
+    x0 = max(0, int(np.floor(rect[:, 0].min())) - margin)
+    y0 = max(0, int(np.floor(rect[:, 1].min())) - margin)
+    x1 = min(width, int(np.ceil(rect[:, 0].max())) + margin)
+    y1 = min(height, int(np.ceil(rect[:, 1].max())) + margin)
+    image = image[y0:y1, x0:x1]
+    rect = rect - np.array([x0, y0], dtype="float32")
+    
+    while factor >= 2 and min(image.shape[:2]) >= 2:
+        # pyrDown 输出像素 i 对应输入像素 2i，角点坐标直接减半
+        image = cv2.pyrDown(image)
+        rect = rect / 2
+        factor /= 2
+    return image, rect
+
+
+def four_point_transform(image, pts, max_size=None, source_size=None, executor=None, output_size=None):
+    """
+    执行四点透视变换，将梯形区域校正为矩形（参数见 transform_quad）
+    
+    Returns:
+        warped: 变换后的图像
+    """
+    return transform_quad(image, pts, max_size, source_size, executor, output_size)[0]
+
+
+def get_axis_aligned_roi(rect, output_size, image_width, image_height, tolerance=AXIS_ALIGNED_TOLERANCE):
+    """
+    判断排序后的四边形是否为不需要缩放的轴对齐矩形
+    
+    order_points 已按几何位置排列角点，旋转 90/180/270 度的矩形同样落在这里，输出方向与原图一致。
+    
+    Args:
+        rect: 按左上、右上、右下、左下排列的角点（image 坐标）
+        output_size: 输出 (宽, 高)
+    
+    Returns:
+        tuple: 原图中的 (x0, y0, x1, y1)，不满足条件时返回 None
+    """
+    (tl, tr, br, bl) = rect
+    if (abs(tl[1] - tr[1]) > tolerance or abs(bl[1] - br[1]) > tolerance
+            or abs(tl[0] - bl[0]) > tolerance or abs(tr[0] - br[0]) > tolerance):
+        return None
+    width, height = output_size
+    # 输出尺寸与四边形尺寸一致（get_warp_size 向下取整）时才不需要缩放
+    if abs((tr[0] - tl[0]) - width) >= 1 or abs((bl[1] - tl[1]) - height) >= 1:
+        return None
+    x0, y0 = int(round(tl[0])), int(round(tl[1]))
+    x1, y1 = min(image_width, x0 + width), min(image_height, y0 + height)
+    if x0 < 0 or y0 < 0 or x1 - x0 != width or y1 - y0 != height:
+        return None
+    return x0, y0, x1, y1
+
+
+def transform_quad(image, pts, max_size=None, source_size=None, executor=None, output_size=None):
+    """
+    执行四点透视变换，将梯形区域校正为矩形，并返回实际使用的计算方式
+    
+    输出缩放直接折算进透视矩阵，warpPerspective 只计算最终尺寸的像素，
+    不需要先生成全分辨率结果再缩小。四边形是不需要缩放的轴对齐矩形时直接返回原图切片
+    （不复制、不插值，与原图像素完全一致）。
+    
+    Args:
+        image: 输入图像
+        pts: 四个角点坐标（source_size 坐标系）
+        max_size: 输出最大边长，不传时按全分辨率输出
+        source_size: 角点所在坐标系的 (宽, 高)；image 是缩小后的金字塔级别时传原图尺寸
+        executor: 线程池；传入且输出足够大时按条带并行变换
+        output_size: 输出 (宽, 高)，传入时忽略 max_size（见 get_target_size）
+    
+    Returns:
+        tuple: (变换后的图像, 计算方式)；计算方式为 roi（切片）、warp（整图变换）或 tiled（条带并行变换）
+    """
+    rect = order_points(pts)
+    
+    # 计算新图像的宽度和高度（按原图坐标，与是否缩小无关）
+    maxWidth, maxHeight = output_size or get_output_size(*get_warp_size(rect), max_size)
+    
+    if source_size is not None:
+        # 角点换算到实际采样的图像坐标
+        height, width = image.shape[:2]
+        rect = rect * np.array([width / source_size[0], height / source_size[1]], dtype="float32")
+    
+    roi = get_axis_aligned_roi(rect, (maxWidth, maxHeight), image.shape[1], image.shape[0])
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        return image[y0:y1, x0:x1], "roi"
+    
+    # 缩小倍数大时先预缩小，透视矩阵直接映射到目标尺寸
+    image, rect = prefilter_for_shrink(image, rect.astype("float32"), (maxWidth, maxHeight))
     
     # 定义目标矩形的四个角点
     dst = np.array([
@@ -55,9 +228,86 @@ def four_point_transform(image, pts):
     
     # 计算透视变换矩阵并应用
     M = cv2.getPerspectiveTransform(rect, dst)
-    warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+    if executor is not None and maxWidth * maxHeight >= TILED_WARP_MIN_PIXELS:
+        return warp_perspective_tiled(image, M, (maxWidth, maxHeight), executor), "tiled"
+    warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight), borderMode=WARP_BORDER_MODE)
+    
+    return warped, "warp"
+
+
+def get_strip_source_box(M_inv, y0, y1, width, image_width, image_height, margin=TILED_WARP_MARGIN):
+    """
+    计算输出条带 [y0, y1) 在原图中的采样范围
+    
+    矩形经透视变换后是凸四边形，四个角的外接矩形即覆盖整个条带。
+    条带落在原图之外时返回最近的边缘像素，复制边缘后与整图变换结果一致。
+    
+    Returns:
+        tuple: (x0, y0, x1, y1)
+    """
+    corners = np.array([[[0, y0], [width, y0], [width, y1], [0, y1]]], dtype="float64")
+    src = cv2.perspectiveTransform(corners, M_inv)[0]
+    x_min = min(max(0, int(np.floor(src[:, 0].min())) - margin), image_width - 1)
+    y_min = min(max(0, int(np.floor(src[:, 1].min())) - margin), image_height - 1)
+    x_max = max(min(image_width, int(np.ceil(src[:, 0].max())) + margin), x_min + 1)
+    y_max = max(min(image_height, int(np.ceil(src[:, 1].max())) + margin), y_min + 1)
+    return x_min, y_min, x_max, y_max
+
+
+@contextmanager
+def single_threaded_opencv():
+    """
+    在外层线程池并行期间把 OpenCV 线程数临时设为 1，结束后恢复
+
+    外层的条带或区域线程已经占满分配的核，每个线程内的 OpenCV 调用再各自开满内部线程
+    会造成线程数相乘的超订。OpenCV 线程数是进程级设置，只应在同一时间只执行一个任务的
+    进程（图像处理引擎进程）中使用。
+    """
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+    try:
+        yield
+    finally:
+        cv2.setNumThreads(threads)
+
+
+def warp_perspective_tiled(image, M, size, executor, strip_height=TILED_WARP_STRIP_HEIGHT):
+    """
+    按水平条带并行执行透视变换
+    
+    每个条带只采样原图中对应的区域，直接写入输出数组的对应行（不做拼接复制），
+    临时内存只与条带大小有关；OpenCV 计算时释放 GIL，条带可以在多个线程中并行。
+    条带执行期间 OpenCV 内部为单线程，并行度由 executor 的线程数决定。
+    
+    Args:
+        image: 输入图像（可以是只读 mmap 数组）
+        M: 原图到输出的 3x3 透视矩阵
+        size: 输出 (宽, 高)
+        executor: 执行条带任务的线程池
+        strip_height: 每个条带的行数
+    
+    Returns:
+        变换后的图像
+    """
+    width, height = size
+    out = np.empty((height, width) + image.shape[2:], dtype=image.dtype)
+    image_height, image_width = image.shape[:2]
+    M_inv = np.linalg.inv(M)
+    
+    def warp_strip(y0):
+        y1 = min(height, y0 + strip_height)
+        strip = out[y0:y1]
+        x_min, y_min, x_max, y_max = get_strip_source_box(M_inv, y0, y1, width, image_width, image_height)
+        # 条带坐标 = 平移(-0, -y0) · M · 平移(x_min, y_min) · 采样区域坐标
+        shift_src = np.array([[1, 0, x_min], [0, 1, y_min], [0, 0, 1]], dtype="float64")
+        shift_dst = np.array([[1, 0, 0], [0, 1, -y0], [0, 0, 1]], dtype="float64")
+        cv2.warpPerspective(image[y_min:y_max, x_min:x_max], shift_dst @ M @ shift_src,
+                            (width, y1 - y0), dst=strip, borderMode=WARP_BORDER_MODE)
     
-    return warped
+    with single_threaded_opencv():
+        # list() 等待所有条带完成，并抛出其中的异常
+        list(executor.map(warp_strip, range(0, height, strip_height)))
+    return out
 
 
 def validate_and_correct_points(points, width, height):
@@ -115,6 +365,70 @@ def resize_image_for_preview(image, max_size=800):
     return image
 
 
+def resize_to_max_side(image, max_side, interpolation=cv2.INTER_AREA):
+    """
+    按最大边长等比缩小图像，图像已足够小时原样返回
+    
+    Args:
+        image: 输入图像
+        max_side: 最大边长
+        interpolation: 插值方式
+    
+    Returns:
+        resized_image: 缩小后的图像
+    """
+    height, width = image.shape[:2]
+    if max(width, height) <= max_side:
+        return image
+    
+    scale = max_side / max(width, height)
+    new_width = max(1, int(round(width * scale)))
+    new_height = max(1, int(round(height * scale)))
+    return cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+
+
+# 预览支持的编码格式：格式名 -> (扩展名, 质量参数, MIME 类型)
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+
+def encode_image(image, image_format="jpeg", quality=85):
+    """
+    将图像编码为指定格式
+    
+    Args:
+        image: 输入图像
+        image_format: IMAGE_FORMATS 中的格式名
+        quality: 编码质量 (1-100)
+    
+    Returns:
+        success: 编码是否成功
+        buffer: 编码后的字节数据
+    """
+    extension, quality_flag, _ = IMAGE_FORMATS[image_format]
+    return cv2.imencode(extension, image, [quality_flag, quality])
+
+
+def set_jpeg_dpi(path, dpi):
+    """
+    在 JFIF APP0 段中写入像素密度（OpenCV 写出的 JPEG 密度固定为 1:1 无单位）
+    
+    Returns:
+        bool: 文件带有 JFIF 头并已写入时返回 True
+    """
+    dpi = max(1, min(65535, int(round(dpi))))
+    with open(path, "r+b") as f:
+        header = f.read(18)
+        if len(header) < 18 or header[2:4] != b"\xff\xe0" or header[6:11] != b"JFIF\x00":
+            return False
+        # 单位 1 = 每英寸像素，随后是 X、Y 密度
+        f.seek(13)
+        f.write(bytes([1]) + dpi.to_bytes(2, "big") * 2)
+    return True
+
+
 def encode_image_to_jpeg(image, quality=85):
     """
     将图像编码为JPEG格式
@@ -144,34 +458,123 @@ def auto_detect_corners(image_path, debug=False):
         confidence: 检测置信度 (0-1)
     """
     try:
-        # 读取图像
-        image = cv2.imread(image_path)
+        # 按检测尺寸缩小解码，检测和精定位都在缩小后的图像上进行
+        image, (width, height) = read_image_reduced(image_path, 400)
         if image is None:
             raise ValueError(f"无法读取图像: {image_path}")
-        
+    except Exception as e:
+        if debug:
+            print(f"自动检测出错: {e}")
+        # 返回默认角点
+        return get_smart_default_corners(1920, 1080), 0.0
+    
+    corners, confidence = auto_detect_corners_in_image(image, debug=debug)
+    return scale_corners_to_size(corners, image, width, height), confidence
+
+
+def get_reduction_factor(width, height, target_size):
+    """
+    选择缩小解码倍数：在 8、4、2 中取缩小后最大边仍不小于 target_size 的最大倍数
+    
+    Returns:
+        int: 缩小倍数，无法缩小时为 1
+    """
+    for factor in REDUCED_DECODE_FLAGS:
+        if max(width, height) / factor >= target_size:
+            return factor
+    return 1
+
+
+def read_image_reduced(image_path, target_size):
+    """
+    以能覆盖目标尺寸的最小分辨率解码图片
+    
+    只对 JPEG 使用 IMREAD_REDUCED_COLOR_*（其他格式 OpenCV 会先完整解码再缩放，没有收益）。
+    解码结果仍需调用方缩放到最终尺寸。
+    
+    Args:
+        image_path: 图片路径
+        target_size: 后续需要的最大边长
+    
+    Returns:
+        tuple: (image, (原图宽, 原图高))，无法读取时 image 为 None
+    """
+    metadata = probe_image_header(image_path)
+    factor = 1
+    if metadata is not None and metadata.format == "jpeg":
+        factor = get_reduction_factor(metadata.width, metadata.height, target_size)
+    
+    image = cv2.imread(image_path, REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR))
+    if image is None and factor > 1:
+        # 个别编码器写出的 JPEG 不支持缩小解码，回退到完整解码
+        image = cv2.imread(image_path)
+    if image is None:
+        return None, (None, None)
+    
+    if metadata is not None:
+        return image, (metadata.width, metadata.height)
+    height, width = image.shape[:2]
+    return image, (width, height)
+
+
+def scale_corners_to_size(corners, image, width, height):
+    """
+    将在缩小解码图像上得到的角点映射回原图坐标
+    
+    libjpeg 缩小时尺寸向上取整，因此按实际宽高比例而不是缩小倍数换算。
+    """
+    image_height, image_width = image.shape[:2]
+    if (image_width, image_height) == (width, height):
+        return corners
+    scale_x = width / image_width
+    scale_y = height / image_height
+    corners = [[float(x) * scale_x, float(y) * scale_y] for x, y in corners]
+    return validate_and_correct_points(corners, width, height)
+
+
+def get_detection_size(width, height, max_detection_size=400):
+    """
+    计算检测用图像尺寸（最大边长不超过 max_detection_size）
+    
+    Returns:
+        tuple: (new_width, new_height)
+    """
+    if max(width, height) > max_detection_size:
+        if width > height:
+            return max_detection_size, int(height * max_detection_size / width)
+        return int(width * max_detection_size / height), max_detection_size
+    return width, height
+
+
+def auto_detect_corners_in_image(image, debug=False, small_image=None):
+    """
+    在已解码的图像上自动检测PPT角点
+    
+    Args:
+        image: 已解码的原尺寸图像
+        debug: 是否输出调试信息
+        small_image: 预先缩小好的检测用图像（最大边长400px），不传时从 image 缩放生成
+    
+    Returns:
+        corners: 检测到的四个角点坐标（原图坐标），按照左上、右上、右下、左下的顺序
+        confidence: 检测置信度 (0-1)
+    """
+    try:
         original_height, original_width = image.shape[:2]
         if debug:
             print(f"原始图像尺寸: {original_width} x {original_height}")
         
         # 1. 预处理：将图像缩小到400px最大边长进行检测
-        max_detection_size = 400
-        if max(original_width, original_height) > max_detection_size:
-            if original_width > original_height:
-                new_width = max_detection_size
-                new_height = int(original_height * max_detection_size / original_width)
-            else:
-                new_height = max_detection_size
-                new_width = int(original_width * max_detection_size / original_height)
+        if small_image is None:
+            new_width, new_height = get_detection_size(original_width, original_height)
+            small_image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
         else:
-            new_width = original_width
-            new_height = original_height
+            new_height, new_width = small_image.shape[:2]
         
         # 计算缩放比例用于后续映射
         scale_x = original_width / new_width
         scale_y = original_height / new_height
         
-        small_image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        
         # 转换为灰度图
         gray_small = cv2.cvtColor(small_image, cv2.COLOR_BGR2GRAY)
         
@@ -419,6 +822,9 @@ def generate_thumbnail(image_path, thumbnail_path, max_size=(200, 200), quality=
     """
     try:
         with Image.open(image_path) as img:
+            # JPEG 在 DCT 阶段直接缩小到不小于目标尺寸的 1/2、1/4、1/8，再做 LANCZOS 缩放
+            img.draft(None, max_size)
+            
             # 转换为RGB模式 (如果是RGBA等)
             if img.mode in ('RGBA', 'LA', 'P'):
                 img = img.convert('RGB')
@@ -0,0 +1,178 @@
+"""
+多分辨率图像金字塔模块
+每张图片按 thumb(200) / preview(800) / editor(1600) / full 四个级别缓存，
+一次解码逐级缩小生成；级别文件的 mtime 标记为原图的 mtime，原图变化后自动失效
+"""
+import os
+import threading
+from typing import Dict, Optional
+
+import cv2
+
+from image_processor import read_image_reduced, resize_to_max_side, get_thumbnail_path
+
+
+# 级别名称 -> 最大边长，按从大到小排列（生成时逐级缩小）
+PYRAMID_LEVELS: Dict[str, int] = {
+    "editor": 1600,
+    "preview": 800,
+    "thumb": 200,
+}
+FULL_LEVEL = "full"
+
+LEVEL_QUALITY = {
+    "editor": 90,
+    "preview": 85,
+    "thumb": 85,
+}
+
+
+def choose_level(max_side: int) -> str:
+    """
+    选择能覆盖 max_side 的最小级别
+
+    Returns:
+        str: 级别名称，超过最大缓存级别时返回 full
+    """
+    for level, size in reversed(PYRAMID_LEVELS.items()):
+        if size >= max_side:
+            return level
+    return FULL_LEVEL
+
+
+def get_level_path(image_filename: str, level: str, proxy_dir: str = "proxies",
+                   thumbnail_dir: str = "thumbnails") -> str:
+    """
+    获取级别文件路径（thumb 级别与缩略图共用同一个文件）
+
+    Args:
+        image_filename: 原始图片文件名
+        level: 级别名称
+        proxy_dir: 代理图目录
+        thumbnail_dir: 缩略图目录
+    """
+    if level == "thumb":
+        return get_thumbnail_path(image_filename, thumbnail_dir)
+    name, _ = os.path.splitext(image_filename)
+    return os.path.join(proxy_dir, f"{name}_{level}.jpg")
+
+
+def stamp_level_file(path: str, source_mtime_ns: int):
+    """将级别文件的 mtime 标记为原图的 mtime，作为该级别对应的原图版本"""
+    os.utime(path, ns=(source_mtime_ns, source_mtime_ns))
+
+
+def is_level_fresh(path: str, source_mtime_ns: int) -> bool:
+    """级别文件存在且标记的版本与原图一致"""
+    try:
+        return os.stat(path).st_mtime_ns == source_mtime_ns
+    except OSError:
+        return False
+
+
+def write_level(image, path: str, level: str, source_mtime_ns: Optional[int] = None) -> bool:
+    """
+    写入一个级别文件
+
+    Args:
+        image: 已缩放到该级别的图像
+        path: 级别文件路径
+        level: 级别名称（决定 JPEG 质量）
+        source_mtime_ns: 原图 mtime，用于标记版本
+
+    Returns:
+        bool: 是否写入成功
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # 先写临时文件再替换，避免并发请求读到写了一半的文件
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp.jpg"
+    if not cv2.imwrite(temp_path, image, [cv2.IMWRITE_JPEG_QUALITY, LEVEL_QUALITY[level]]):
+        return False
+    os.replace(temp_path, path)
+    if source_mtime_ns is not None:
+        stamp_level_file(path, source_mtime_ns)
+    return True
+
+
+class ImagePyramid:
+    """
+    按需生成和查询图像金字塔级别
+
+    任一级别缺失或过期时，以能覆盖最大缺失级别的分辨率解码一次（JPEG 使用 DCT 缩小解码），
+    然后逐级缩小生成所有过期的级别。
+    """
+
+    def __init__(self, index, proxy_dir: str, thumbnail_dir: str):
+        """
+        Args:
+            index: FileIndex 实例
+            proxy_dir: 代理图目录
+            thumbnail_dir: 缩略图目录
+        """
+        self.index = index
+        self.proxy_dir = proxy_dir
+        self.thumbnail_dir = thumbnail_dir
+
+    def level_path(self, filename: str, level: str) -> str:
+        """级别文件路径"""
+        return get_level_path(filename, level, self.proxy_dir, self.thumbnail_dir)
+
+    def is_fresh(self, record, level: str) -> bool:
+        """级别文件是否与当前原图版本一致（不需要缓存的小图视为始终有效）"""
+        if level == FULL_LEVEL or self._serves_original(record, level):
+            return True
+        return is_level_fresh(self.level_path(record["filename"], level), record["mtime_ns"])
+
+    def get_level(self, directory: str, filename: str, level: str) -> Optional[str]:
+        """
+        返回指定级别的文件路径，缺失或过期时重新生成（同步执行，调用方应放在线程中）
+
+        原图最大边不超过该级别时直接返回原图路径。
+
+        Returns:
+            str: 文件路径，文件不存在或无法解码时返回 None
+        """
+        record = self.index.get_file(directory, filename, refresh=True)
+        if record is None or record["width"] is None:
+            return None
+
+        source_path = os.path.join(self.index.directories[directory], filename)
+        if level == FULL_LEVEL or self._serves_original(record, level):
+            return source_path
+
+        path = self.level_path(filename, level)
+        if is_level_fresh(path, record["mtime_ns"]):
+            return path
+
+        if not self.build(source_path, record):
+            return None
+        return path
+
+    def build(self, source_path: str, record) -> bool:
+        """
+        一次解码生成所有过期的级别
+
+        Returns:
+            bool: 是否全部生成成功
+        """
+        stale = [level for level in PYRAMID_LEVELS if not self.is_fresh(record, level)]
+        if not stale:
+            return True
+
+        image, _ = read_image_reduced(source_path, PYRAMID_LEVELS[stale[0]])
+        if image is None:
+            return False
+
+        success = True
+        for level, size in PYRAMID_LEVELS.items():
+            # 逐级缩小：每一级都从上一级缩放而来
+            image = resize_to_max_side(image, size)
+            if level in stale:
+                path = self.level_path(record["filename"], level)
+                success = write_level(image, path, level, record["mtime_ns"]) and success
+        return success
+
+    @staticmethod
+    def _serves_original(record, level: str) -> bool:
+        """原图不大于该级别时直接使用原图"""
+        return max(record["width"], record["height"]) <= PYRAMID_LEVELS[level]
@@ -0,0 +1,225 @@
+"""
+Deep Zoom 瓦片模块
+为超大扫描图提供 DZI 风格的瓦片金字塔：第 max_level 级为原图分辨率，每低一级缩小一半，
+每级切成 256px 瓦片。瓦片按级别懒生成并缓存在 tiles/{文件名}/{版本}/{级别}/ 下，
+原图变化后版本号变化，旧瓦片随之失效
+"""
+import math
+import os
+import shutil
+import threading
+from typing import Optional
+
+import cv2
+
+from admission import estimate_image_bytes
+from http_cache import file_version
+from image_processor import read_image_reduced
+from image_pyramid import ImagePyramid, PYRAMID_LEVELS
+
+
+TILE_SIZE = 256
+TILE_OVERLAP = 0
+TILE_FORMAT = "jpg"
+TILE_QUALITY = 85
+
+
+def get_max_level(width: int, height: int) -> int:
+    """最高级别（原图分辨率）的级别号，与 DZI 约定一致：第 0 级为 1x1 像素"""
+    return int(math.ceil(math.log2(max(width, height, 1))))
+
+
+def get_level_size(width: int, height: int, level: int):
+    """
+    计算某一级别的图像尺寸
+
+    Returns:
+        tuple: (level_width, level_height)
+    """
+    scale = 2 ** (get_max_level(width, height) - level)
+    return max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))
+
+
+def get_tile_grid(level_width: int, level_height: int):
+    """
+    某一级别的瓦片行列数
+
+    Returns:
+        tuple: (columns, rows)
+    """
+    return math.ceil(level_width / TILE_SIZE), math.ceil(level_height / TILE_SIZE)
+
+
+def estimate_level_bytes(width: int, height: int, level: int) -> int:
+    """
+    估算生成一个级别的峰值内存：来源栅格（editor 代理图或原图解码）加缩放后的级别栅格
+
+    高级别按原图完整解码估算；JPEG 实际会缩小解码，估算偏保守。
+    """
+    level_width, level_height = get_level_size(width, height, level)
+    if max(level_width, level_height) <= PYRAMID_LEVELS["editor"]:
+        scale = min(1.0, PYRAMID_LEVELS["editor"] / max(width, height))
+        source_width, source_height = math.ceil(width * scale), math.ceil(height * scale)
+    else:
+        source_width, source_height = width, height
+    source = estimate_image_bytes(source_width, source_height)
+    if (source_width, source_height) == (level_width, level_height):
+        return source
+    return source + estimate_image_bytes(level_width, level_height)
+
+
+class TileCache:
+    """
+    按级别懒生成的瓦片缓存
+
+    请求某一级别的任意瓦片时一次生成该级别的全部瓦片：不超过编辑器代理图尺寸的级别
+    从金字塔 editor 级别缩放得到，更高的级别按需要的分辨率（JPEG 使用 DCT 缩小解码）
+    解码原图。
+
+    生成阻塞且占用整级栅格的内存（见 estimate_level_bytes），由调用方控制并发：同一 (文件, 版本, 级别) 只应有一个
+    生成在进行，其余请求等待其完成。不同进程同时生成同一级别时以先完成的为准。
+    """
+
+    def __init__(self, index, pyramid: ImagePyramid, tile_dir: str):
+        """
+        Args:
+            index: FileIndex 实例
+            pyramid: 图像金字塔，用于低级别瓦片的来源
+            tile_dir: 瓦片缓存目录
+        """
+        self.index = index
+        self.pyramid = pyramid
+        self.tile_dir = tile_dir
+
+    def info(self, directory: str, filename: str) -> Optional[dict]:
+        """
+        返回瓦片金字塔描述（对应 DZI 描述文件中的字段）
+
+        Returns:
+            dict: 描述信息，文件不存在或无法读取时返回 None
+        """
+        record = self.index.get_file(directory, filename, refresh=True)
+        if record is None or record["width"] is None:
+            return None
+        return {
+            "width": record["width"],
+            "height": record["height"],
+            "tile_size": TILE_SIZE,
+            "overlap": TILE_OVERLAP,
+            "format": TILE_FORMAT,
+            "max_level": get_max_level(record["width"], record["height"]),
+            "version": file_version(record["inode"], record["size"], record["mtime_ns"]),
+        }
+
+    def get_tile(self, directory: str, filename: str, level: int, column: int, row: int) -> Optional[str]:
+        """
+        返回瓦片文件路径，所在级别尚未生成时先生成（同步执行，调用方应放在线程中）
+
+        Returns:
+            str: 瓦片路径，文件不存在或级别、行列越界时返回 None
+        """
+        tile = self.locate_tile(directory, filename, level, column, row)
+        if tile is None:
+            return None
+        if not tile["built"]:
+            self.build_level(directory, tile)
+        return tile["path"] if os.path.exists(tile["path"]) else None
+
+    def locate_tile(self, directory: str, filename: str, level: int, column: int, row: int) -> Optional[dict]:
+        """
+        定位瓦片，不生成
+
+        Returns:
+            dict: 瓦片路径、所在级别是否已生成以及生成级别所需的参数，
+                  文件不存在或级别、行列越界时返回 None
+        """
+        record = self.index.get_file(directory, filename, refresh=True)
+        if record is None or record["width"] is None:
+            return None
+
+        width, height = record["width"], record["height"]
+        if not 0 <= level <= get_max_level(width, height):
+            return None
+        level_width, level_height = get_level_size(width, height, level)
+        columns, rows = get_tile_grid(level_width, level_height)
+        if not (0 <= column < columns and 0 <= row < rows):
+            return None
+
+        version = file_version(record["inode"], record["size"], record["mtime_ns"])
+        tile_path = os.path.join(self._level_dir(filename, version, level), f"{column}_{row}.{TILE_FORMAT}")
+        return {
+            "path": tile_path,
+            "built": os.path.exists(tile_path),
+            "record": record,
+            "version": version,
+            "level": level,
+            "level_size": (level_width, level_height),
+        }
+
+    def build_level(self, directory: str, tile: dict):
+        """生成 locate_tile 返回的瓦片所在的级别（同步执行），已生成时直接返回"""
+        record, version, level = tile["record"], tile["version"], tile["level"]
+        if not os.path.exists(self._level_dir(record["filename"], version, level)):
+            self._build_level(directory, record, version, level, *tile["level_size"])
+
+    def _image_dir(self, filename: str) -> str:
+        return os.path.join(self.tile_dir, filename)
+
+    def _level_dir(self, filename: str, version: str, level: int) -> str:
+        return os.path.join(self._image_dir(filename), version, str(level))
+
+    def _level_raster(self, directory: str, record, level_width: int, level_height: int):
+        """生成某一级别的完整栅格"""
+        filename = record["filename"]
+        image = None
+        if max(level_width, level_height) <= PYRAMID_LEVELS["editor"]:
+            editor_path = self.pyramid.get_level(directory, filename, "editor")
+            if editor_path is not None:
+                image = cv2.imread(editor_path)
+        if image is None:
+            source_path = os.path.join(self.index.directories[directory], filename)
+            image, _ = read_image_reduced(source_path, max(level_width, level_height))
+        if image is None:
+            return None
+
+        if (image.shape[1], image.shape[0]) != (level_width, level_height):
+            interpolation = cv2.INTER_AREA if image.shape[1] > level_width else cv2.INTER_CUBIC
+            image = cv2.resize(image, (level_width, level_height), interpolation=interpolation)
+        return image
+
+    def _build_level(self, directory: str, record, version: str, level: int,
+                     level_width: int, level_height: int):
+        """切出一个级别的全部瓦片，写入临时目录后整体改名，读取方不会看到不完整的级别"""
+        filename = record["filename"]
+        self._remove_stale_versions(filename, version)
+
+        raster = self._level_raster(directory, record, level_width, level_height)
+        if raster is None:
+            print(f"瓦片生成失败，无法读取图片: {filename}")
+            return
+
+        level_dir = self._level_dir(filename, version, level)
+        temp_dir = f"{level_dir}.{os.getpid()}-{threading.get_ident()}.tmp"
+        os.makedirs(temp_dir, exist_ok=True)
+        columns, rows = get_tile_grid(level_width, level_height)
+        params = [cv2.IMWRITE_JPEG_QUALITY, TILE_QUALITY]
+        for row in range(rows):
+            for column in range(columns):
+                x, y = column * TILE_SIZE, row * TILE_SIZE
+                tile = raster[y:y + TILE_SIZE, x:x + TILE_SIZE]
+                cv2.imwrite(os.path.join(temp_dir, f"{column}_{row}.{TILE_FORMAT}"), tile, params)
+
+        try:
+            os.replace(temp_dir, level_dir)
+        except OSError:
+            # 其他进程已生成同一级别
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _remove_stale_versions(self, filename: str, version: str):
+        """删除该图片旧版本的瓦片"""
+        image_dir = self._image_dir(filename)
+        if not os.path.isdir(image_dir):
+            return
+        for entry in os.listdir(image_dir):
+            if entry != version:
+                shutil.rmtree(os.path.join(image_dir, entry), ignore_errors=True)
@@ -0,0 +1,131 @@
+"""
+图片导入流水线模块
+每张新图片只解码一次，由同一份像素数据依次生成：元数据、图像金字塔
+（编辑器代理图、预览图、缩略图）、400px 检测用图像和自动检测角点，并一起写入索引
+"""
+import os
+import time
+from typing import NamedTuple, Optional, List
+
+import cv2
+
+from image_processor import (
+    auto_detect_corners_in_image,
+    get_detection_size,
+    read_image_reduced,
+    resize_to_max_side,
+    scale_corners_to_size,
+)
+from image_pyramid import PYRAMID_LEVELS, get_level_path, write_level
+
+
+THUMBNAIL_SIZE = PYRAMID_LEVELS["thumb"]
+DETECTION_SIZE = 400
+EDITOR_PROXY_SIZE = PYRAMID_LEVELS["editor"]
+
+
+class IngestResult(NamedTuple):
+    """导入结果"""
+    width: int
+    height: int
+    thumbnail_path: Optional[str]
+    proxy_path: Optional[str]
+    corners: List[List[float]]
+    confidence: float
+    elapsed: float
+
+
+def ingest_image(image_path, filename, thumbnail_dir, proxy_dir) -> Optional[IngestResult]:
+    """
+    对一张图片执行单次解码的导入流程
+
+    JPEG 按编辑器代理图尺寸缩小解码（相机原图通常为 1/2），之后按
+    解码图 -> 编辑器代理图 -> 预览图 -> 检测图 -> 缩略图 逐级缩小，避免多次从全分辨率重采样；
+    自动检测的亚像素精化使用解码图，结果换算回原图坐标。
+    金字塔级别文件以原图 mtime 标记版本，原图变化后自动失效。
+
+    Args:
+        image_path: 原图路径
+        filename: 原图文件名（用于派生文件命名）
+        thumbnail_dir: 缩略图目录
+        proxy_dir: 代理图目录
+
+    Returns:
+        IngestResult: 导入结果，无法解码时返回 None
+    """
+    start_time = time.time()
+
+    # 解码前记录版本，解码期间原图被替换时级别文件会因版本不一致而重新生成
+    source_mtime_ns = os.stat(image_path).st_mtime_ns
+    image, (width, height) = read_image_reduced(image_path, EDITOR_PROXY_SIZE)
+    if image is None:
+        print(f"导入失败，无法读取图片: {image_path}")
+        return None
+
+    # 编辑器代理图和预览图
+    proxy = resize_to_max_side(image, EDITOR_PROXY_SIZE)
+    proxy_path = get_level_path(filename, "editor", proxy_dir, thumbnail_dir)
+    if not write_level(proxy, proxy_path, "editor", source_mtime_ns):
+        proxy_path = None
+
+    preview = resize_to_max_side(proxy, PYRAMID_LEVELS["preview"])
+    write_level(preview, get_level_path(filename, "preview", proxy_dir, thumbnail_dir), "preview", source_mtime_ns)
+
+    # 检测用图像，尺寸与 auto_detect_corners 内部的计算保持一致
+    detection_size = get_detection_size(image.shape[1], image.shape[0], DETECTION_SIZE)
+    if (preview.shape[1], preview.shape[0]) == detection_size:
+        detection_image = preview
+    else:
+        detection_image = cv2.resize(preview, detection_size, interpolation=cv2.INTER_AREA)
+
+    # 缩略图
+    thumbnail = resize_to_max_side(detection_image, THUMBNAIL_SIZE)
+    thumbnail_path = get_level_path(filename, "thumb", proxy_dir, thumbnail_dir)
+    if not write_level(thumbnail, thumbnail_path, "thumb", source_mtime_ns):
+        thumbnail_path = None
+
+    # 自动检测角点
+    corners, confidence = auto_detect_corners_in_image(image, small_image=detection_image)
+    corners = scale_corners_to_size(corners, image, width, height)
+    corners = [[float(x), float(y)] for x, y in corners]
+
+    elapsed = time.time() - start_time
+    print(f"导入完成: {filename}, 尺寸: {width}x{height}, 耗时: {elapsed * 1000:.0f}ms")
+
+    return IngestResult(int(width), int(height), thumbnail_path, proxy_path, corners, float(confidence), elapsed)
+
+
+def ingest_indexed_file(index, directory, filename, thumbnail_dir, proxy_dir) -> Optional[IngestResult]:
+    """
+    导入索引中的一个文件，并把缩略图、代理图和检测结果一起写回索引
+
+    Args:
+        index: FileIndex 实例
+        directory: 目录角色
+        filename: 文件名
+        thumbnail_dir: 缩略图目录
+        proxy_dir: 代理图目录
+
+    Returns:
+        IngestResult: 导入结果，文件不存在或无法解码时返回 None
+    """
+    record = index.get_file(directory, filename, refresh=True)
+    if record is None:
+        return None
+
+    image_path = os.path.join(index.directories[directory], filename)
+    result = ingest_image(image_path, filename, thumbnail_dir, proxy_dir)
+    if result is None:
+        index.update_fields(directory, filename, mtime_ns=record["mtime_ns"],
+                            thumbnail_state="failed", ingest_state="failed")
+        return None
+
+    # 只有在源文件版本未变化时才写入，避免覆盖处理期间被替换的文件的新状态
+    index.update_fields(
+        directory, filename, mtime_ns=record["mtime_ns"],
+        thumbnail_state="ready" if result.thumbnail_path else "failed",
+        ingest_state="ready" if result.proxy_path else "failed",
+        corners=result.corners,
+        confidence=result.confidence,
+    )
+    return result
@@ -4,33 +4,82 @@
 为现代前端应用提供完整的 REST API 接口
 """
 import os
-import cv2
+import asyncio
+import fnmatch
+import hashlib
+import json
+import math
+import re
 import shutil
 import time
 import uvicorn
 import urllib.parse
-from typing import List, Optional
+import cv2
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from pydantic import BaseModel
-from fastapi import FastAPI, UploadFile, HTTPException, File
-from fastapi.responses import FileResponse, Response
+from fastapi import FastAPI, UploadFile, HTTPException, File, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # 导入自定义模块
 from image_processor import (
-    four_point_transform, 
+    order_points,
+    get_warp_size,
+    get_output_size,
+    get_target_size,
     validate_and_correct_points, 
-    resize_image_for_preview, 
-    encode_image_to_jpeg,
-    auto_detect_corners,
-    generate_thumbnail,
+    IMAGE_FORMATS,
     get_thumbnail_path
 )
+from file_index import FileIndex, encode_cursor
+from progress_events import ProgressBroker
+from work_queue import LeaseQueue, DEFAULT_LEASE_TTL
+from thumbnail_worker import ThumbnailWorkerPool, PRIORITY_INTERACTIVE
+from image_pyramid import ImagePyramid, PYRAMID_LEVELS, FULL_LEVEL, choose_level
+from image_tiles import TileCache, estimate_level_bytes
+from batch_jobs import BatchJobManager, FrameSkipped
+from admission import MemoryAdmission, default_memory_budget, estimate_regions_bytes, estimate_warp_bytes
+from executors import BoundedExecutor, ExecutorBusy, DEFAULT_CPU_WORKERS, DEFAULT_IO_WORKERS
+from image_cache import DecodedImageSpool, PreviewCache, default_spool_dir, quantize_points
+from image_engine import ImageEngine, DEFAULT_ENGINE_WORKERS, DEFAULT_MAX_TASKS_PER_CHILD, DEFAULT_MAX_RSS
+from http_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    file_version,
+    stat_version,
+    make_etag,
+    is_not_modified,
+    not_modified_response,
+    conditional_file_response,
+    conditional_json_response
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动和停止进度事件跟踪与后台缩略图线程"""
+    await progress_broker.start()
+    thumbnail_pool.start()
+    # 补齐上次运行时尚未生成的缩略图（同步时新发现的文件已经通过变更监听入队）
+    thumbnail_pool.backfill("source")
+    thumbnail_pool.backfill("processed")
+    if decoded_spool is not None:
+        # 清理上次运行遗留的未登记解码文件
+        await io_executor.run(decoded_spool.sweep)
+    image_engine.start()
+    yield
+    await batch_jobs.stop()
+    thumbnail_pool.stop()
+    image_engine.stop()
+    cpu_executor.shutdown(wait=False)
+    io_executor.shutdown(wait=False)
+    await progress_broker.stop()
 
 # 创建 FastAPI 应用
 app = FastAPI(
     title="图片梯形裁剪校正 API",
     description="为图片梯形裁剪校正工具提供的完整 REST API 接口",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # 添加 CORS 中间件
@@ -42,17 +91,144 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    """执行器排队已满：返回 503 并提示客户端稍后重试，而不是让请求无限排队"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "服务器繁忙，请稍后重试"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # 配置文件夹
 SOURCE_DIR = "source_images"
 OUTPUT_DIR = "output_images"
 PROCESSED_DIR = "processed"
 THUMBNAIL_DIR = "thumbnails"
+PROXY_DIR = "proxies"
+TILE_DIR = "tiles"
+INDEX_DB_PATH = "file_index.db"
+# 跨 worker 共享的解码图像目录（默认在 /dev/shm 下），设为 None 时只使用进程内缓存
+DECODED_SPOOL_DIR = default_spool_dir(INDEX_DB_PATH)
+
+# 裁剪预览的最大边长和 JPEG 质量
+# 原图（扫描件）的分辨率，裁剪请求指定 dpi 时按 dpi / SOURCE_DPI 缩放输出
+SOURCE_DPI = 300
+# 单次裁剪请求最多的区域数
+MAX_CROP_REGIONS = 16
+# 裁剪结果文件名：单区域 xxx_cropped.jpg，多区域 xxx_cropped_N.jpg
+CROPPED_NAME_PATTERN = re.compile(r"_cropped(_\d+)?\.jpe?g$")
+PREVIEW_MAX_SIZE = 800
+PREVIEW_QUALITY = 90
+
+# 计算（解码、透视变换、编码）和文件 I/O 线程池的大小与排队上限，排队已满时返回 503
+CPU_WORKERS = DEFAULT_CPU_WORKERS
+CPU_QUEUE_SIZE = CPU_WORKERS * 4
+IO_WORKERS = DEFAULT_IO_WORKERS
+IO_QUEUE_SIZE = 64
+
+# 图像处理引擎的进程数、每个进程处理的任务数上限和常驻内存上限
+ENGINE_WORKERS = DEFAULT_ENGINE_WORKERS
+ENGINE_MAX_TASKS_PER_CHILD = DEFAULT_MAX_TASKS_PER_CHILD
+ENGINE_MAX_RSS = DEFAULT_MAX_RSS
+
+# 服务进程内的 OpenCV 线程数：导入、金字塔和瓦片生成仍在计算线程池和缩略图线程中调用 OpenCV，
+# 并行度由这些线程池提供，每次调用再各自开满 OpenCV 线程只会造成核心超订
+IN_PROCESS_CV_THREADS = 1
+cv2.setNumThreads(IN_PROCESS_CV_THREADS)
+
+# 全分辨率解码 / 变换的内存预算（字节）和最长排队时间（秒），排队超时返回 503
+MEMORY_BUDGET = default_memory_budget()
+MEMORY_ADMISSION_TIMEOUT = 30.0
+
+# 缩略图请求等待后台线程生成的最长时间（秒），超时返回 503 让浏览器稍后重试
+THUMBNAIL_WAIT_TIMEOUT = 10.0
 
 # 确保目录存在
 os.makedirs(SOURCE_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+os.makedirs(PROXY_DIR, exist_ok=True)
+os.makedirs(TILE_DIR, exist_ok=True)
+
+# 文件元数据索引（列表接口直接查询索引，按目录 mtime 增量同步）
+file_index = FileIndex(INDEX_DB_PATH, {
+    "source": SOURCE_DIR,
+    "processed": PROCESSED_DIR,
+    "output": OUTPUT_DIR,
+})
+
+# 多操作员租约队列（与索引共用数据库，跨 worker 进程原子分配）
+lease_queue = LeaseQueue(INDEX_DB_PATH, "source")
+
+# 进度事件中心（增量维护计数并推送 SSE）
+progress_broker = ProgressBroker(file_index)
+file_index.add_listener(progress_broker.notify)
+
+
+def notify_thumbnail_ready(directory: str, filename: str) -> None:
+    """后台缩略图生成完成后通过 SSE 通知前端替换占位图"""
+    record = file_index.get_file(directory, filename)
+    if record is None:
+        return
+    progress_broker.publish_threadsafe("thumbnail", {
+        "directory": directory,
+        "filename": filename,
+        "thumbnail_url": versioned_thumbnail_url(record),
+    })
+
+
+# 跨 worker 共享的解码图像落盘缓存（引擎进程中的解码缓存以 mmap 方式复用）
+decoded_spool = DecodedImageSpool(INDEX_DB_PATH, DECODED_SPOOL_DIR) if DECODED_SPOOL_DIR else None
+
+# 图像处理引擎：解码、透视变换、角点检测、缩略图和编码在独立进程池中执行，
+# 每个进程内有自己的解码缓存，并通过落盘缓存共享其他进程的解码结果
+image_engine = ImageEngine(
+    workers=ENGINE_WORKERS,
+    max_tasks_per_child=ENGINE_MAX_TASKS_PER_CHILD,
+    max_rss=ENGINE_MAX_RSS,
+    spool_db=INDEX_DB_PATH if decoded_spool else None,
+    spool_dir=DECODED_SPOOL_DIR
+)
+
+# 内存准入控制：按图片尺寸估算每个请求的峰值内存，预算用尽时排队，突发的大图裁剪不会撑爆内存
+memory_admission = MemoryAdmission(MEMORY_BUDGET, MEMORY_ADMISSION_TIMEOUT)
+
+# 后台缩略图线程池（上传和目录同步发现的新文件自动入队，请求处理函数中不再生成缩略图）
+thumbnail_pool = ThumbnailWorkerPool(file_index, THUMBNAIL_DIR, PROXY_DIR, on_ready=notify_thumbnail_ready,
+                                     engine=image_engine)
+file_index.add_listener(thumbnail_pool.handle_change)
+
+# 有界执行器：金字塔和瓦片生成等阻塞操作在这里执行，事件循环只负责调度
+cpu_executor = BoundedExecutor("cpu", CPU_WORKERS, CPU_QUEUE_SIZE)
+io_executor = BoundedExecutor("io", IO_WORKERS, IO_QUEUE_SIZE)
+
+
+async def reconcile_index(*directories: str) -> None:
+    """在 I/O 线程池中增量同步索引（目录有变化时需要 stat 并探测新文件，不能在事件循环中执行）"""
+    for directory in directories:
+        await io_executor.run(file_index.reconcile, directory)
+
+
+async def refresh_file(directory: str, filename: str):
+    """在 I/O 线程池中刷新并返回单个文件的索引记录（文件变化时会重新探测尺寸）"""
+    return await io_executor.run(file_index.get_file, directory, filename, refresh=True)
+
+# 多分辨率图像金字塔（thumb / preview / editor / full），编辑器首屏只需加载 editor 级别
+image_pyramid = ImagePyramid(file_index, PROXY_DIR, THUMBNAIL_DIR)
+
+# 超大扫描图的 Deep Zoom 瓦片缓存，编辑器只请求视口内的瓦片
+tile_cache = TileCache(file_index, image_pyramid, TILE_DIR)
+# 正在生成的瓦片级别：(目录, 文件名, 版本, 级别) -> 生成任务，同一级别的并发请求等待同一个任务
+tile_builds: Dict[tuple, asyncio.Task] = {}
+
+# 编码后的裁剪预览缓存：重复的角点组合（例如重新打开预览）不再重新渲染
+preview_cache = PreviewCache()
+
+# 批量裁剪任务（模板角点应用到整批固定机位的帧）
+batch_jobs = BatchJobManager()
 
 # API 数据模型定义
 class ImageInfo(BaseModel):
@@ -64,11 +240,15 @@ class ImageInfo(BaseModel):
     created_time: Optional[str] = None
     has_thumbnail: bool = False
     thumbnail_url: Optional[str] = None
+    format: Optional[str] = None
+    orientation: int = 1
+    probe_method: Optional[str] = None  # header: 文件头解析, decode: 完整解码回退
+    thumbnail_state: Optional[str] = None  # none / pending / ready / failed
 
 class PaginatedFileListResponse(BaseModel):
     """分页文件列表响应模型"""
     pending_files: List[ImageInfo]
-    processed_files: List[str]
+    processed_files: List[str]  # 已处理文件同样分页返回，总数见 processed_count
     total_files: int
     completion_rate: float
     page: int
@@ -76,6 +256,9 @@ class PaginatedFileListResponse(BaseModel):
     total_pages: int
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None  # 下一页待处理文件的游标
+    processed_count: int = 0
+    processed_next_cursor: Optional[str] = None  # 下一页已处理文件的游标
 
 class FileListResponse(BaseModel):
     """文件列表响应模型 - 保持向后兼容"""
@@ -84,9 +267,39 @@ class FileListResponse(BaseModel):
     total_files: int
     completion_rate: float
 
+class FileChange(BaseModel):
+    """文件变更记录模型"""
+    seq: int
+    change_type: str  # added / removed / modified / moved
+    directory: str  # source / processed / output
+    filename: str
+    to_directory: Optional[str] = None
+    to_filename: Optional[str] = None
+    file: Optional[ImageInfo] = None  # 新增或修改的待处理文件的最新信息
+
+class FileChangesResponse(BaseModel):
+    """增量同步响应模型"""
+    changes: List[FileChange]
+    token: str
+    has_more: bool
+    reset: bool = False  # 为 true 时令牌已失效，客户端需要全量刷新
+
 class CropRequest(BaseModel):
     """裁剪请求模型"""
-    points: List[List[float]]  # 四个角点坐标 [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+    points: Optional[List[List[float]]] = None  # 四个角点坐标 [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+    regions: Optional[List[List[List[float]]]] = None  # 多个区域的角点，与 points 二选一（仅裁剪接口）
+    # 可选的输出尺寸，不传时按透视校正后的全分辨率输出（预览接口忽略这些字段）
+    output_width: Optional[int] = None  # 只传宽或高时按比例计算另一边
+    output_height: Optional[int] = None
+    max_side: Optional[int] = None  # 最大边长，只缩小不放大
+    dpi: Optional[float] = None  # 目标分辨率，按 SOURCE_DPI 换算缩放比例并写入输出文件
+
+class CropOutput(BaseModel):
+    """单个裁剪区域的输出"""
+    filename: str
+    output_width: int
+    output_height: int
+    transform: str
 
 class CropResponse(BaseModel):
     """裁剪响应模型"""
@@ -95,6 +308,35 @@ class CropResponse(BaseModel):
     message: str
     processed_filename: Optional[str] = None
     error: Optional[str] = None
+    output_width: Optional[int] = None
+    output_height: Optional[int] = None
+    transform: Optional[str] = None  # roi: 轴对齐矩形直接切片 / warp: 透视变换 / tiled: 条带并行透视变换
+    outputs: Optional[List[CropOutput]] = None  # 各区域的输出（上面的字段对应第一个区域）
+
+class BatchCropRequest(BaseModel):
+    """批量裁剪请求模型：同一组角点应用到多张图片"""
+    points: List[List[float]]  # 模板角点（reference_size 坐标系）
+    files: Optional[List[str]] = None  # 待处理文件名列表
+    pattern: Optional[str] = None  # 或者按通配符选择待处理文件，例如 "lecture_*.jpg"
+    reference_size: Optional[List[int]] = None  # 角点所在的图片 [宽, 高]，默认取第一张图片的尺寸
+    output_width: Optional[int] = None
+    output_height: Optional[int] = None
+    max_side: Optional[int] = None
+    dpi: Optional[float] = None
+
+class BatchJobResponse(BaseModel):
+    """批量裁剪任务状态"""
+    job_id: str
+    state: str  # queued / running / done / cancelled / failed
+    total: int
+    completed: int
+    failed: int
+    skipped: int
+    progress: float
+    elapsed: float
+    frames_per_second: float
+    outputs: List[CropOutput] = []
+    errors: dict = {}
 
 class AutoDetectResponse(BaseModel):
     """自动检测响应模型"""
@@ -110,6 +352,17 @@ class NextFileResponse(BaseModel):
     next_filename: Optional[str] = None
     remaining_count: int
     message: str
+    lease_expires_at: Optional[float] = None  # 传入操作员标识时返回租约到期时间
+
+class TileInfoResponse(BaseModel):
+    """瓦片金字塔描述（DZI 风格）"""
+    width: int
+    height: int
+    tile_size: int
+    overlap: int
+    format: str
+    max_level: int  # 原图分辨率所在级别，每低一级缩小一半
+    version: str  # 原图版本，瓦片地址带上 ?v= 后可被永久缓存
 
 @app.get("/")
 async def root():
@@ -132,84 +385,111 @@ async def health_check():
             "source": os.path.exists(SOURCE_DIR),
             "output": os.path.exists(OUTPUT_DIR),
             "processed": os.path.exists(PROCESSED_DIR)
+        },
+        "image_engine": image_engine.stats(),
+        "memory_admission": memory_admission.stats(),
+        "decoded_spool": decoded_spool.stats() if decoded_spool else None,
+        "preview_cache": preview_cache.stats(),
+        "thumbnail_queue": thumbnail_pool.pending_count(),
+        "executors": {
+            "cpu": cpu_executor.stats(),
+            "io": io_executor.stats()
         }
     }
 
 # 辅助函数
-def generate_thumbnail_if_needed(image_path: str, filename: str) -> tuple[bool, str]:
+def versioned_thumbnail_url(record) -> str:
+    """带原图版本参数的缩略图地址，原图不变时可被浏览器永久缓存"""
+    version = file_version(record["inode"], record["size"], record["mtime_ns"])
+    return f"/api/thumbnail/{record['filename']}?v={version}"
+
+def thumbnail_status(record) -> tuple[bool, Optional[str], str]:
     """
-    如果需要，生成缩略图
+    返回缩略图状态，不在请求中生成缩略图
+    
+    缩略图尚未就绪时以高优先级提交给后台线程池，生成后通过 SSE 的 thumbnail 事件通知。
     
     Returns:
-        tuple: (has_thumbnail, thumbnail_url)
+        tuple: (has_thumbnail, thumbnail_url, thumbnail_state)
     """
-    thumbnail_path = get_thumbnail_path(filename, THUMBNAIL_DIR)
-    
-    # 检查缩略图是否已存在且比原图新
-    if os.path.exists(thumbnail_path):
-        thumb_mtime = os.path.getmtime(thumbnail_path)
-        img_mtime = os.path.getmtime(image_path)
-        if thumb_mtime >= img_mtime:
-            return True, f"/api/thumbnail/{filename}"
-    
-    # 生成缩略图
-    if generate_thumbnail(image_path, thumbnail_path):
-        return True, f"/api/thumbnail/{filename}"
+    if record["thumbnail_state"] == "ready":
+        return True, versioned_thumbnail_url(record), "ready"
+    if record["thumbnail_state"] == "failed":
+        return False, None, "failed"
     
-    return False, ""
+    thumbnail_pool.submit(record["directory"], record["filename"], PRIORITY_INTERACTIVE)
+    return False, None, "pending"
+
+def image_info_from_record(record, has_thumbnail: bool = False, thumbnail_url: Optional[str] = None,
+                           thumbnail_state: Optional[str] = None) -> ImageInfo:
+    """根据索引记录构建 ImageInfo"""
+    return ImageInfo(
+        filename=record["filename"],
+        width=record["width"],
+        height=record["height"],
+        file_size=record["size"],
+        created_time=time.ctime(record["ctime_ns"] / 1e9),
+        has_thumbnail=has_thumbnail,
+        thumbnail_url=thumbnail_url,
+        format=record["format"],
+        orientation=record["orientation"],
+        probe_method=record["probe_method"],
+        thumbnail_state=thumbnail_state or record["thumbnail_state"]
+    )
+
+def renew_lease(filename: str, operator: Optional[str]) -> None:
+    """操作员仍在编辑时续租；未携带操作员标识的旧客户端不参与租约"""
+    if operator:
+        lease_queue.renew(filename, operator)
 
 # API 实现部分
 @app.get("/api/files/paginated", response_model=PaginatedFileListResponse)
-async def get_files_paginated(page: int = 1, page_size: int = 20):
-    """获取分页文件列表 - 优化性能的新接口"""
+async def get_files_paginated(request: Request, page: int = 1, page_size: int = 20,
+                              cursor: Optional[str] = None, processed_cursor: Optional[str] = None):
+    """
+    获取分页文件列表 - 优化性能的新接口
+    
+    传入 cursor（上一页返回的 next_cursor）时使用游标分页，按 (创建时间倒序, 文件名) 的
+    稳定顺序取下一页，不受并发上传和裁剪的影响；否则按 page 参数偏移分页。
+    已处理文件通过 processed_cursor 以同样方式分页。
+    """
     try:
-        # 获取待处理文件
-        all_files = [f for f in os.listdir(SOURCE_DIR) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
-        all_files.sort(key=lambda f: os.path.getctime(os.path.join(SOURCE_DIR, f)), reverse=True)
+        # 增量同步索引（目录未变化时直接跳过）
+        await reconcile_index("source", "processed")
         
         # 计算分页
-        total_files = len(all_files)
+        total_files = file_index.count("source", readable_only=True)
         total_pages = (total_files + page_size - 1) // page_size
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_files = all_files[start_idx:end_idx]
+        if cursor:
+            page_records, next_cursor = file_index.list_files_after("source", cursor, page_size)
+        else:
+            start_idx = (page - 1) * page_size
+            page_records = file_index.list_files("source", limit=page_size, offset=start_idx)
+            next_cursor = encode_cursor(page_records[-1]) if page_records and page < total_pages else None
         
         pending_files = []
         
-        for filename in page_files:
-            path = os.path.join(SOURCE_DIR, filename)
-            if os.path.exists(path):
-                try:
-                    img = cv2.imread(path)
-                    if img is not None:
-                        height, width = img.shape[:2]
-                        file_size = os.path.getsize(path)
-                        created_time = time.ctime(os.path.getctime(path))
-                        
-                        # 生成缩略图
-                        has_thumbnail, thumbnail_url = generate_thumbnail_if_needed(path, filename)
-                        
-                        pending_files.append(ImageInfo(
-                            filename=filename,
-                            width=int(width),
-                            height=int(height),
-                            file_size=file_size,
-                            created_time=created_time,
-                            has_thumbnail=has_thumbnail,
-                            thumbnail_url=thumbnail_url
-                        ))
-                except Exception as e:
-                    print(f"Error processing file {filename}: {e}")
-                    continue
+        for record in page_records:
+            try:
+                # 缩略图未就绪时返回 pending 状态，由后台线程生成
+                has_thumbnail, thumbnail_url, thumbnail_state = thumbnail_status(record)
+                pending_files.append(image_info_from_record(record, has_thumbnail, thumbnail_url, thumbnail_state))
+            except Exception as e:
+                print(f"Error processing file {record['filename']}: {e}")
+                continue
         
-        # 获取已处理文件
-        processed_files = [f for f in os.listdir(PROCESSED_DIR) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
+        # 获取已处理文件（同样分页）
+        processed_records, processed_next_cursor = file_index.list_files_after(
+            "processed", processed_cursor, page_size, readable_only=False
+        )
+        processed_files = [record["filename"] for record in processed_records]
+        processed_count = file_index.count("processed")
         
         # 计算统计信息
-        total_all_files = len(all_files) + len(processed_files)
-        completion_rate = (len(processed_files) / total_all_files * 100) if total_all_files > 0 else 100
+        total_all_files = total_files + processed_count
+        completion_rate = (processed_count / total_all_files * 100) if total_all_files > 0 else 100
         
-        return PaginatedFileListResponse(
+        return conditional_json_response(request, PaginatedFileListResponse(
             pending_files=pending_files,
             processed_files=processed_files,
             total_files=total_all_files,
@@ -217,88 +497,181 @@ async def get_files_paginated(page: int = 1, page_size: int = 20):
             page=page,
             page_size=page_size,
             total_pages=total_pages,
-            has_next=page < total_pages,
-            has_prev=page > 1
-        )
+            has_next=next_cursor is not None if cursor else page < total_pages,
+            has_prev=page > 1,
+            next_cursor=next_cursor,
+            processed_count=processed_count,
+            processed_next_cursor=processed_next_cursor
+        ))
         
+    except ExecutorBusy:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
 
 @app.get("/api/files", response_model=FileListResponse)
-async def get_files():
+async def get_files(request: Request):
     """获取文件列表 - 兼容旧接口，但优化为只返回文件名"""
     try:
-        # 获取待处理文件（只获取基本信息，不生成缩略图）
-        files = [f for f in os.listdir(SOURCE_DIR) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
-        pending_files = []
+        # 增量同步索引（目录未变化时直接跳过）
+        await reconcile_index("source", "processed")
         
-        for filename in files:
-            path = os.path.join(SOURCE_DIR, filename)
-            if os.path.exists(path):
-                try:
-                    # 使用更快的方法获取图片尺寸
-                    img = cv2.imread(path)
-                    if img is not None:
-                        height, width = img.shape[:2]
-                        file_size = os.path.getsize(path)
-                        created_time = time.ctime(os.path.getctime(path))
-                        
-                        pending_files.append(ImageInfo(
-                            filename=filename,
-                            width=int(width),
-                            height=int(height),
-                            file_size=file_size,
-                            created_time=created_time,
-                            has_thumbnail=False,
-                            thumbnail_url=None
-                        ))
-                except Exception as e:
-                    print(f"Error processing file {filename}: {e}")
-                    continue
+        # 获取待处理文件（只获取基本信息，不生成缩略图）
+        pending_files = [image_info_from_record(record) for record in file_index.list_files("source")]
         
         # 获取已处理文件
-        processed_files = [f for f in os.listdir(PROCESSED_DIR) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
+        processed_files = file_index.list_filenames("processed")
         
         # 计算统计信息
         total_files = len(pending_files) + len(processed_files)
         completion_rate = (len(processed_files) / total_files * 100) if total_files > 0 else 100
         
-        return FileListResponse(
+        return conditional_json_response(request, FileListResponse(
             pending_files=pending_files,
             processed_files=processed_files,
             total_files=total_files,
             completion_rate=completion_rate
-        )
+        ))
         
+    except ExecutorBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
 
+@app.get("/api/files/changes", response_model=FileChangesResponse)
+async def get_file_changes(since: Optional[str] = None, limit: int = 500):
+    """
+    获取文件列表的增量变更
+    
+    客户端首次调用时不传 since，仅获取当前令牌；之后传入上次返回的 token，
+    只返回期间新增、删除、修改和移动的文件，轮询代价取决于变更量而不是目录大小。
+    """
+    try:
+        # 先同步文件系统上的外部变更（目录未变化时直接跳过）
+        await reconcile_index("source", "processed")
+        
+        if since is None:
+            return FileChangesResponse(changes=[], token=str(file_index.current_token()), has_more=False)
+        
+        try:
+            since_seq = int(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的同步令牌: {since}")
+        
+        rows, token, reset = file_index.get_changes(since_seq, limit)
+        
+        changes = []
+        for row in rows:
+            file_info = None
+            if row["change_type"] in ("added", "modified") and row["directory"] == "source":
+                record = file_index.get_file("source", row["filename"])
+                if record is not None and record["width"] is not None:
+                    file_info = image_info_from_record(record)
+            changes.append(FileChange(
+                seq=row["seq"],
+                change_type=row["change_type"],
+                directory=row["directory"],
+                filename=row["filename"],
+                to_directory=row["to_directory"],
+                to_filename=row["to_filename"],
+                file=file_info
+            ))
+        
+        return FileChangesResponse(
+            changes=changes,
+            token=str(token),
+            has_more=len(rows) == limit,
+            reset=reset
+        )
+    
+    except (HTTPException, ExecutorBusy):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取文件变更失败: {str(e)}")
+
+@app.get("/api/progress")
+async def get_progress():
+    """获取当前处理进度快照（计数在内存中增量维护）"""
+    return progress_broker.snapshot()
+
+@app.get("/api/progress/stream")
+async def progress_stream():
+    """
+    以 Server-Sent Events 推送处理进度
+    
+    事件类型：
+    - progress: 待处理/已处理计数和完成率
+    - file: 单个文件的状态变化（pending / processing / processed / removed / error）
+    """
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # 禁止反向代理缓冲事件流
+    }
+    return StreamingResponse(progress_broker.stream(), media_type="text/event-stream", headers=headers)
+
+async def wait_for_thumbnail(future, timeout: Optional[float] = None):
+    """
+    等待后台缩略图任务
+    
+    同一文件的所有请求共享一个 Future：超时或客户端断开只取消本次等待，不取消任务本身。
+    """
+    return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+
+
 @app.get("/api/thumbnail/{filename}")
-async def get_thumbnail(filename: str):
-    """获取图片缩略图"""
+async def get_thumbnail(filename: str, request: Request, v: Optional[str] = None):
+    """
+    获取图片缩略图
+    
+    带版本参数 v（列表接口返回的 thumbnail_url）且与原图当前版本一致时，
+    响应标记为 immutable 可被永久缓存；否则需要通过 ETag 重新校验。
+    """
     thumbnail_path = get_thumbnail_path(filename, THUMBNAIL_DIR)
     
+    directory = "source"
+    source_path = os.path.join(SOURCE_DIR, filename)
+    if not os.path.exists(source_path):
+        directory = "processed"
+        source_path = os.path.join(PROCESSED_DIR, filename)
+    
     if not os.path.exists(thumbnail_path):
-        # 如果缩略图不存在，尝试生成
-        source_path = os.path.join(SOURCE_DIR, filename)
         if not os.path.exists(source_path):
-            source_path = os.path.join(PROCESSED_DIR, filename)
-        
-        if os.path.exists(source_path):
-            if not generate_thumbnail(source_path, thumbnail_path):
-                raise HTTPException(status_code=404, detail="无法生成缩略图")
-        else:
             raise HTTPException(status_code=404, detail="原图文件不存在")
+        
+        # 缩略图不存在时交给后台线程生成，等待期间不阻塞事件循环
+        future = thumbnail_pool.submit(directory, filename, PRIORITY_INTERACTIVE)
+        try:
+            generated = await wait_for_thumbnail(future, THUMBNAIL_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="缩略图生成中，请稍后重试",
+                                headers={"Retry-After": "1"})
+        if generated is None:
+            raise HTTPException(status_code=404, detail="无法生成缩略图")
+    
+    thumbnail_stat = os.stat(thumbnail_path)
+    cache_control = "no-cache"
+    if v is not None and os.path.exists(source_path):
+        source_stat = os.stat(source_path)
+        if v == stat_version(source_stat) and thumbnail_stat.st_mtime >= source_stat.st_mtime:
+            cache_control = IMMUTABLE_CACHE_CONTROL
     
     # 添加CORS头部，确保前端可以访问缩略图
     headers = {
-        "Cache-Control": "max-age=3600",
+        "Cache-Control": cache_control,
         "Access-Control-Allow-Origin": "*",
         "Access-Control-Allow-Methods": "GET",
         "Access-Control-Allow-Headers": "*"
     }
     
-    return FileResponse(thumbnail_path, media_type="image/jpeg", headers=headers)
+    return conditional_file_response(request, thumbnail_path, "image/jpeg", headers, thumbnail_stat)
+
+
+def write_file(path: str, content: bytes) -> None:
+    """写入上传的文件内容（在 I/O 线程池中执行）"""
+    with open(path, "wb") as f:
+        f.write(content)
 
 
 @app.post("/api/upload")
@@ -318,11 +691,14 @@ async def upload_files(files: List[UploadFile] = File(...)):
             content = await file.read()
             file_path = os.path.join(SOURCE_DIR, file.filename)
             
-            with open(file_path, "wb") as f:
-                f.write(content)
+            await io_executor.run(write_file, file_path, content)
             
+            # 写入索引后由变更监听自动加入后台导入队列（缩略图、代理图和自动检测结果）
+            await io_executor.run(file_index.upsert_file, "source", file.filename)
             uploaded_files.append(file.filename)
             
+        except ExecutorBusy:
+            raise
         except Exception as e:
             errors.append(f"{file.filename}: {str(e)}")
     
@@ -334,16 +710,31 @@ async def upload_files(files: List[UploadFile] = File(...)):
 
 
 @app.get("/api/image/{filename}")
-async def get_image(filename: str):
-    """提供源图片文件访问"""
+async def get_image(filename: str, request: Request, level: Optional[str] = None,
+                    max_side: Optional[int] = None):
+    """
+    提供源图片文件访问
+    
+    通过 level（thumb / preview / editor / full）或 max_side 选择金字塔级别，
+    max_side 会取能覆盖该尺寸的最小级别；都不传时返回原图。
+    """
     # 首先尝试从源文件夹查找
+    directory = "source"
     path = os.path.join(SOURCE_DIR, filename)
     if not os.path.exists(path):
         # 如果源文件夹没有，尝试从处理文件夹查找
+        directory = "processed"
         path = os.path.join(PROCESSED_DIR, filename)
         if not os.path.exists(path):
             raise HTTPException(status_code=404, detail="图片文件不存在")
     
+    if level is None and max_side is not None:
+        if max_side <= 0:
+            raise HTTPException(status_code=400, detail="max_side 必须为正整数")
+        level = choose_level(max_side)
+    if level is not None and level != FULL_LEVEL and level not in PYRAMID_LEVELS:
+        raise HTTPException(status_code=400, detail=f"无效的级别: {level}")
+    
     # 检测文件类型
     file_extension = filename.lower().split('.')[-1]
     media_type_map = {
@@ -355,7 +746,18 @@ async def get_image(filename: str):
     }
     media_type = media_type_map.get(file_extension, 'image/jpeg')
     
+    if level is not None and level != FULL_LEVEL:
+        record = await refresh_file(directory, filename)
+        if record is not None and directory == "source" and record["ingest_state"] == "none":
+            # 尚未导入的文件优先完成导入，金字塔级别随导入一起生成
+            await wait_for_thumbnail(thumbnail_pool.submit(directory, filename, PRIORITY_INTERACTIVE))
+        level_path = await cpu_executor.run(image_pyramid.get_level, directory, filename, level)
+        if level_path is not None and level_path != path:
+            path = level_path
+            media_type = "image/jpeg"
+    
     # 添加CORS头部，确保前端可以访问图片
+    # no-cache 表示每次都需要校验，配合 ETag 在原图未变化时只返回 304
     headers = {
         "Cache-Control": "no-cache",
         "Access-Control-Allow-Origin": "*",
@@ -363,105 +765,587 @@ async def get_image(filename: str):
         "Access-Control-Allow-Headers": "*"
     }
     
-    return FileResponse(path, media_type=media_type, headers=headers)
-@app.post("/api/preview/{filename}")
-async def preview_crop(filename: str, request: CropRequest):
-    """生成裁剪预览"""
+    return conditional_file_response(request, path, media_type, headers)
+
+
+def locate_image(filename: str) -> str:
+    """返回图片所在的目录角色（先查待处理，再查已处理），不存在时抛出 404"""
+    if os.path.exists(os.path.join(SOURCE_DIR, filename)):
+        return "source"
+    if os.path.exists(os.path.join(PROCESSED_DIR, filename)):
+        return "processed"
+    raise HTTPException(status_code=404, detail="图片文件不存在")
+
+@app.get("/api/tiles/{filename}/info", response_model=TileInfoResponse)
+async def get_tile_info(filename: str):
+    """获取图片的瓦片金字塔描述"""
+    info = await io_executor.run(tile_cache.info, locate_image(filename), filename)
+    if info is None:
+        raise HTTPException(status_code=400, detail="无法读取图片文件")
+    return TileInfoResponse(**info)
+
+@app.get("/api/tiles/{filename}/{level}/{column}_{row}.jpg")
+async def get_tile(filename: str, level: int, column: int, row: int, request: Request,
+                   v: Optional[str] = None):
+    """
+    获取单个瓦片，所在级别首次被请求时生成该级别的全部瓦片
+    
+    带版本参数 v 且与原图当前版本一致时，响应标记为 immutable。
+    """
+    directory = locate_image(filename)
+    tile = await io_executor.run(tile_cache.locate_tile, directory, filename, level, column, row)
+    if tile is None:
+        raise HTTPException(status_code=404, detail="瓦片不存在")
+    if not tile["built"]:
+        await build_tile_level(directory, tile)
+    tile_path = tile["path"]
+    if not os.path.exists(tile_path):
+        raise HTTPException(status_code=404, detail="瓦片不存在")
+    
+    cache_control = "no-cache"
+    if v is not None:
+        source_path = os.path.join(file_index.directories[directory], filename)
+        if v == stat_version(os.stat(source_path)):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+    
+    headers = {
+        "Cache-Control": cache_control,
+        "Access-Control-Allow-Origin": "*",
+    }
+    return conditional_file_response(request, tile_path, "image/jpeg", headers)
+
+async def run_tile_build(directory: str, tile: dict) -> None:
+    """按级别的来源栅格和级别栅格预留内存后，在 CPU 线程池中生成级别"""
+    record = tile["record"]
+    nbytes = estimate_level_bytes(record["width"], record["height"], tile["level"])
+    async with memory_admission.reserve(nbytes):
+        await cpu_executor.run(tile_cache.build_level, directory, tile)
+
+async def build_tile_level(directory: str, tile: dict) -> None:
+    """
+    生成瓦片所在的级别，同一级别只生成一次
+
+    后到的请求在事件循环中等待已有的生成任务，不占用 CPU 线程池的名额；
+    不同级别或不同文件的生成互不阻塞。
+    """
+    key = (directory, tile["record"]["filename"], tile["version"], tile["level"])
+    build = tile_builds.get(key)
+    if build is None:
+        build = asyncio.ensure_future(run_tile_build(directory, tile))
+        tile_builds[key] = build
+        build.add_done_callback(lambda _: tile_builds.pop(key, None))
+    # 某个请求被取消时不影响其他等待同一级别的请求
+    await asyncio.shield(build)
+
+def choose_preview_source(filename: str, points, width: int, height: int):
+    """
+    选择预览的采样来源：能覆盖预览分辨率的最小金字塔级别
+
+    先按原图坐标算出输出尺寸，再选择级别，预览耗时只取决于预览尺寸而与原图像素数无关。
+
+    Returns:
+        tuple: (采样文件路径, 估算的峰值内存)，级别无法生成时使用原图
+    """
+    warp_width, warp_height = get_warp_size(order_points(points))
+    scale = min(1.0, PREVIEW_MAX_SIZE / max(warp_width, warp_height, 1))
+    output_width, output_height = get_output_size(warp_width, warp_height, PREVIEW_MAX_SIZE)
+    level = choose_level(math.ceil(max(width, height) * scale))
+    level_path = image_pyramid.get_level("source", filename, level)
+    if level_path is None or level == FULL_LEVEL:
+        return os.path.join(SOURCE_DIR, filename), estimate_warp_bytes(width, height, output_width, output_height)
+    
+    level_scale = min(1.0, PYRAMID_LEVELS[level] / max(width, height))
+    source_width, source_height = math.ceil(width * level_scale), math.ceil(height * level_scale)
+    return level_path, estimate_warp_bytes(source_width, source_height, output_width, output_height)
+
+
+async def resolve_preview(filename: str, points, image_format: str = "jpeg"):
+    """
+    校验预览请求并计算缓存键
+
+    Returns:
+        tuple: (record, 量化后的角点, 缓存键, ETag)
+    """
     source_path = os.path.join(SOURCE_DIR, filename)
     if not os.path.exists(source_path):
         raise HTTPException(status_code=404, detail="文件不存在")
-    
-    if not request.points or len(request.points) != 4:
+    if not points or len(points) != 4:
         raise HTTPException(status_code=400, detail="需要4个角点")
     
+    record = await refresh_file("source", filename)
+    if record is None or record["width"] is None:
+        raise HTTPException(status_code=400, detail="无法读取图片文件")
+    
+    # 验证并修正角点坐标，量化后作为缓存键并用于渲染
+    corrected_points = quantize_points(validate_and_correct_points(points, record["width"], record["height"]))
+    version = file_version(record["inode"], record["size"], record["mtime_ns"])
+    key = (version, corrected_points, PREVIEW_MAX_SIZE, PREVIEW_QUALITY, image_format)
+    etag = make_etag(hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+    return record, corrected_points, key, etag
+
+
+async def get_preview_content(filename: str, record, points, key, image_format: str = "jpeg") -> bytes:
+    """
+    返回编码后的预览，未缓存时渲染、编码并加入缓存
+
+    结果按 (文件版本, 量化角点, 输出尺寸, 质量, 格式) 缓存，重复的角点组合直接返回已编码的图片。
+    """
+    content = preview_cache.get(key)
+    if content is not None:
+        return content
+    
+    width, height = record["width"], record["height"]
+    print(f"生成预览: {filename}, 尺寸: {width}x{height}")
+    print(f"角点坐标: {points}")
+    
+    source, nbytes = await cpu_executor.run(choose_preview_source, filename, points, width, height)
+    async with memory_admission.reserve(nbytes):
+        render = asyncio.ensure_future(image_engine.warp(
+            source, points, source_size=(width, height), max_size=PREVIEW_MAX_SIZE,
+            image_format=image_format, quality=PREVIEW_QUALITY))
+        try:
+            content = await asyncio.shield(render)
+        except asyncio.CancelledError:
+            # 调用方取消（例如实时预览的连接断开）只停止等待，引擎进程仍在变换；
+            # 等它结束后再归还预留的内存，避免其他请求提前占用这部分预算
+            await asyncio.wait({render})
+            if not render.cancelled():
+                render.exception()
+            raise
+    if content is None:
+        raise HTTPException(status_code=400, detail="无法读取图片文件")
+    preview_cache.put(key, content)
+    return content
+
+
+async def preview_response(filename: str, points, operator: Optional[str],
+                           request: Optional[Request] = None) -> Response:
+    """
+    生成裁剪预览响应（POST 和 GET 共用）
+
+    GET 请求携带匹配的 If-None-Match 时不渲染直接返回 304。
+    """
     try:
-        img = cv2.imread(source_path)
-        if img is None:
-            raise HTTPException(status_code=400, detail="无法读取图片文件")
+        record, corrected_points, key, etag = await resolve_preview(filename, points)
+        renew_lease(filename, operator)
+        # 预览只取决于文件版本和角点，反向代理可以共享缓存，每次使用前用 ETag 校验
+        headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
         
-        height, width = img.shape[:2]
-        print(f"生成预览: {filename}, 尺寸: {width}x{height}")
-        print(f"角点坐标: {request.points}")
-        
-        # 验证并修正角点坐标
-        corrected_points = validate_and_correct_points(request.points, width, height)
+        if request is not None and is_not_modified(request, etag):
+            return not_modified_response(etag, headers)
         
-        # 执行透视变换
-        warped = four_point_transform(img, corrected_points)
-        
-        # 如果预览图片太大，适当缩小以便在网页中显示
-        warped = resize_image_for_preview(warped)
-        
-        # 编码为JPEG并返回
-        success, buf = encode_image_to_jpeg(warped, 90)
-        if not success:
-            raise HTTPException(status_code=500, detail="预览图片编码失败")
-        
-        return Response(content=buf.tobytes(), media_type="image/jpeg")
+        content = await get_preview_content(filename, record, corrected_points, key)
+        return Response(content=content, media_type="image/jpeg", headers=headers)
     
+    except (HTTPException, ExecutorBusy):
+        raise
     except Exception as e:
         print(f"生成预览时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"生成预览时出错: {str(e)}")
 
 
+def parse_points_query(points: str) -> List[List[float]]:
+    """解析查询参数中的角点：x1,y1,x2,y2,x3,y3,x4,y4"""
+    try:
+        values = [float(value) for value in points.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="角点参数格式错误")
+    if len(values) != 8:
+        raise HTTPException(status_code=400, detail="需要4个角点")
+    return [values[i:i + 2] for i in range(0, 8, 2)]
+
+
+@app.post("/api/preview/{filename}")
+async def preview_crop(filename: str, request: CropRequest,
+                       operator: Optional[str] = Header(None, alias="X-Operator-Id")):
+    """生成裁剪预览"""
+    return await preview_response(filename, request.points, operator)
+
+
+@app.get("/api/preview/{filename}")
+async def get_preview_crop(filename: str, request: Request, points: str,
+                           operator: Optional[str] = Header(None, alias="X-Operator-Id")):
+    """
+    生成裁剪预览（GET 形式，角点放在查询参数中）
+    
+    相同的文件版本和角点对应相同的 URL 和 ETag，浏览器和反向代理可以缓存。
+    """
+    return await preview_response(filename, parse_points_query(points), operator, request)
+
+
+@app.websocket("/api/preview/{filename}/live")
+async def live_preview(websocket: WebSocket, filename: str, operator: Optional[str] = None,
+                       image_format: str = Query("jpeg", alias="format")):
+    """
+    实时预览通道：拖动角点时客户端持续发送 {"seq": n, "points": [[x, y], ...]}
+    
+    服务端只渲染最新的一条请求，渲染期间到达的旧请求直接丢弃；每帧先发送一条 JSON 描述
+    {"type": "frame", "seq": n, "format": ..., "dropped": k}，随后发送二进制图片。
+    客户端断开时取消正在等待的渲染，不再为其编码和发送。
+    """
+    await websocket.accept()
+    if image_format not in IMAGE_FORMATS:
+        await websocket.close(code=1003, reason="不支持的图片格式")
+        return
+    
+    latest: dict = {}
+    dropped = 0
+    updated = asyncio.Event()
+    
+    async def receive_updates():
+        nonlocal dropped
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                # 错误也由发送循环回复，避免与帧数据交错
+                message = {"seq": None, "error": "消息格式错误"}
+            if latest:
+                # 上一条尚未开始渲染就被新请求取代
+                dropped += 1
+            latest.clear()
+            latest.update(message)
+            updated.set()
+    
+    receiver = asyncio.create_task(receive_updates())
+    try:
+        while True:
+            waiter = asyncio.create_task(updated.wait())
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                waiter.cancel()
+                break
+            
+            updated.clear()
+            message = dict(latest)
+            latest.clear()
+            # 本帧之前被取代而未渲染的请求数
+            superseded, dropped = dropped, 0
+            seq = message.get("seq")
+            try:
+                if "error" in message:
+                    raise HTTPException(status_code=400, detail=message["error"])
+                record, points, key, _ = await resolve_preview(filename, message.get("points"), image_format)
+                renew_lease(filename, operator)
+                render = asyncio.create_task(get_preview_content(filename, record, points, key, image_format))
+                await asyncio.wait({receiver, render}, return_when=asyncio.FIRST_COMPLETED)
+                if receiver.done():
+                    # 客户端已断开
+                    render.cancel()
+                    break
+                content = render.result()
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "seq": seq, "detail": e.detail})
+                continue
+            except Exception as e:
+                print(f"生成实时预览时出错: {str(e)}")
+                await websocket.send_json({"type": "error", "seq": seq, "detail": str(e)})
+                continue
+            
+            await websocket.send_json({"type": "frame", "seq": seq, "format": image_format, "dropped": superseded})
+            await websocket.send_bytes(content)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+async def move_to_processed(filename: str) -> str:
+    """
+    裁剪完成后把原图移到 processed 文件夹并释放租约
+    
+    Returns:
+        str: processed 文件夹中的文件名
+    """
+    source_path = os.path.join(SOURCE_DIR, filename)
+    processed_path = os.path.join(PROCESSED_DIR, filename)
+    
+    # 如果processed文件夹中已存在同名文件，添加时间戳
+    if os.path.exists(processed_path):
+        timestamp = int(time.time())
+        name_part, ext_part = os.path.splitext(filename)
+        processed_filename = f"{name_part}_{timestamp}{ext_part}"
+        processed_path = os.path.join(PROCESSED_DIR, processed_filename)
+    
+    # 移动文件
+    await io_executor.run(shutil.move, source_path, processed_path)
+    if decoded_spool is not None:
+        await io_executor.run(decoded_spool.invalidate, source_path)
+    await io_executor.run(file_index.move_file, "source", filename, "processed", os.path.basename(processed_path))
+    lease_queue.release(filename)
+    return os.path.basename(processed_path)
+
+
 @app.post("/api/crop/{filename}", response_model=CropResponse)
-async def crop(filename: str, request: CropRequest):
+async def crop(filename: str, request: CropRequest,
+               operator: Optional[str] = Header(None, alias="X-Operator-Id")):
     """执行图片裁剪并移动文件"""
     source_path = os.path.join(SOURCE_DIR, filename)
     if not os.path.exists(source_path):
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    if not request.points or len(request.points) != 4:
+    # 文件已被其他操作员领取时拒绝，避免重复劳动
+    holder = lease_queue.holder(filename)
+    if holder is not None and holder != operator:
+        raise HTTPException(status_code=409, detail="该文件正由其他操作员处理")
+    
+    # 单区域使用 points，多区域使用 regions
+    regions = request.regions if request.regions is not None else [request.points]
+    if not regions or len(regions) > MAX_CROP_REGIONS or (request.points and request.regions is not None):
+        return CropResponse(success=False, message=f"需要 points 或 1-{MAX_CROP_REGIONS} 个区域的 regions",
+                            error="Invalid regions")
+    if any(not points or len(points) != 4 for points in regions):
         return CropResponse(success=False, message="需要4个角点", error="Invalid points")
     
+    sizing = (request.output_width, request.output_height, request.max_side, request.dpi)
+    if any(value is not None and value <= 0 for value in sizing):
+        return CropResponse(success=False, message="输出尺寸和 DPI 必须为正数", error="Invalid output size")
+    
+    progress_broker.publish_file_state(filename, "processing")
+    previous_outputs = {}
     try:
-        img = cv2.imread(source_path)
-        if img is None:
+        record = await refresh_file("source", filename)
+        if record is None or record["width"] is None:
+            progress_broker.publish_file_state(filename, "error", error="Cannot read image")
             return CropResponse(success=False, message="无法读取图片文件", error="Cannot read image")
         
-        height, width = img.shape[:2]
+        width, height = record["width"], record["height"]
         print(f"处理图片: {filename}, 尺寸: {width}x{height}")
-        print(f"接收到的角点坐标: {request.points}")
+        print(f"接收到的角点坐标: {regions}")
         
         # 验证并修正角点坐标
-        corrected_points = validate_and_correct_points(request.points, width, height)
-        print(f"修正后的角点坐标: {corrected_points}")
+        corrected_regions = [validate_and_correct_points(points, width, height) for points in regions]
+        print(f"修正后的角点坐标: {corrected_regions}")
         
-        # 执行透视变换
-        warped = four_point_transform(img, corrected_points)
-        
-        # 生成输出文件名
+        # 生成输出文件名：单区域为 _cropped.jpg，多区域按顺序编号 _cropped_1.jpg、_cropped_2.jpg ...
         name_without_ext = os.path.splitext(filename)[0]
-        output_filename = f"{name_without_ext}_cropped.jpg"
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
-        
-        # 保存裁剪结果
-        cv2.imwrite(output_path, warped)
-        print(f"裁剪结果已保存到: {output_path}")
+        if request.regions is None:
+            output_filenames = [f"{name_without_ext}_cropped.jpg"]
+        else:
+            output_filenames = [f"{name_without_ext}_cropped_{i}.jpg" for i in range(1, len(regions) + 1)]
+        output_paths = [os.path.join(OUTPUT_DIR, name) for name in output_filenames]
         
-        # 移动原文件到processed文件夹
-        processed_path = os.path.join(PROCESSED_DIR, filename)
+        # 透视矩阵直接映射到请求的输出尺寸，只重采样一次
+        output_sizes = [
+            get_target_size(
+                *get_warp_size(order_points(points)),
+                output_width=request.output_width,
+                output_height=request.output_height,
+                max_side=request.max_side,
+                scale=request.dpi / SOURCE_DPI if request.dpi else None,
+            )
+            for points in corrected_regions
+        ]
         
-        # 如果processed文件夹中已存在同名文件，添加时间戳
-        if os.path.exists(processed_path):
-            timestamp = int(time.time())
-            name_part, ext_part = os.path.splitext(filename)
-            processed_filename = f"{name_part}_{timestamp}{ext_part}"
-            processed_path = os.path.join(PROCESSED_DIR, processed_filename)
+        # 按原图和各区域输出尺寸预留内存后，在引擎进程中解码一次原图并变换所有区域
+        nbytes = estimate_regions_bytes(width, height, output_sizes)
+        previous_outputs = await io_executor.run(snapshot_outputs, output_filenames)
+        async with memory_admission.reserve(nbytes):
+            written = await image_engine.warp_regions(source_path, corrected_regions, output_paths,
+                                                      output_sizes=output_sizes, dpi=request.dpi)
+        if written is None:
+            progress_broker.publish_file_state(filename, "error", error="Cannot read image")
+            return CropResponse(success=False, message="无法读取图片文件", error="Cannot read image")
+        for output_filename, output_path in zip(output_filenames, output_paths):
+            await io_executor.run(file_index.upsert_file, "output", output_filename)
+            print(f"裁剪结果已保存到: {output_path}")
+        outputs = [
+            CropOutput(filename=name, output_width=w, output_height=h, transform=method)
+            for name, (w, h, method) in zip(output_filenames, written)
+        ]
         
-        # 移动文件
-        shutil.move(source_path, processed_path)
+        # 所有区域写入后再移动原文件到processed文件夹
+        processed_filename = await move_to_processed(filename)
         
         return CropResponse(
             success=True,
-            filename=output_filename,
+            filename=outputs[0].filename,
             message="文件已处理完成并移动到processed文件夹",
-            processed_filename=os.path.basename(processed_path)
+            processed_filename=processed_filename,
+            output_width=outputs[0].output_width,
+            output_height=outputs[0].output_height,
+            transform=outputs[0].transform,
+            outputs=outputs,
         )
-    except (IOError, ValueError, RuntimeError) as e:
+    except ExecutorBusy:
+        # 过载时文件保持待处理状态，客户端按 Retry-After 重试
+        progress_broker.publish_file_state(filename, "pending")
+        raise
+    except Exception as e:
+        # 包括引擎进程中的 cv2.error 等；已写出的部分区域一并删除，原图保持待处理
+        print(f"裁剪 {filename} 时出错: {str(e)}")
+        progress_broker.publish_file_state(filename, "error", error=str(e))
+        if previous_outputs:
+            await io_executor.run(remove_partial_outputs, previous_outputs)
         return CropResponse(success=False, message=f"处理失败: {str(e)}", error=str(e))
 
 
+def snapshot_outputs(output_filenames: List[str]) -> dict:
+    """
+    记录裁剪前各输出文件的修改时间，裁剪失败时据此判断哪些文件是本次写出的
+
+    Returns:
+        dict: 输出文件名 -> mtime_ns，文件不存在时为 None
+    """
+    snapshot = {}
+    for output_filename in output_filenames:
+        try:
+            snapshot[output_filename] = os.stat(os.path.join(OUTPUT_DIR, output_filename)).st_mtime_ns
+        except FileNotFoundError:
+            snapshot[output_filename] = None
+    return snapshot
+
+
+def remove_partial_outputs(snapshot: dict) -> None:
+    """删除裁剪失败时已经写出（新建或被覆盖）的输出文件及其索引记录"""
+    for output_filename, mtime_ns in snapshot.items():
+        output_path = os.path.join(OUTPUT_DIR, output_filename)
+        try:
+            if os.stat(output_path).st_mtime_ns == mtime_ns:
+                continue
+            os.remove(output_path)
+        except FileNotFoundError:
+            continue
+        file_index.remove_file("output", output_filename)
+        print(f"已删除不完整的裁剪结果: {output_path}")
+
+
+def get_template_plan(request: BatchCropRequest, reference_size, width: int, height: int):
+    """
+    计算模板在某一帧尺寸下的裁剪参数（每种尺寸只计算一次）
+    
+    模板角点按帧尺寸与参考尺寸的比例换算，输出尺寸和缩小解码尺寸随之确定。
+    
+    Returns:
+        tuple: (排序后的角点, 输出尺寸, 缩小解码的目标边长)
+    """
+    scale_x, scale_y = width / reference_size[0], height / reference_size[1]
+    points = [[x * scale_x, y * scale_y] for x, y in request.points]
+    rect = order_points(validate_and_correct_points(points, width, height))
+    warp_width, warp_height = get_warp_size(rect)
+    output_size = get_target_size(
+        warp_width, warp_height,
+        output_width=request.output_width,
+        output_height=request.output_height,
+        max_side=request.max_side,
+        scale=request.dpi / SOURCE_DPI if request.dpi else None,
+    )
+    # 输出比角点区域小得多时，原图可以按相同比例缩小解码
+    shrink = max(1.0, min(warp_width / output_size[0], warp_height / output_size[1]))
+    decode_size = math.ceil(max(width, height) / shrink)
+    return rect.tolist(), output_size, decode_size
+
+
+@app.post("/api/batch-crop", response_model=BatchJobResponse, status_code=202)
+async def batch_crop(request: BatchCropRequest,
+                     operator: Optional[str] = Header(None, alias="X-Operator-Id")):
+    """
+    批量裁剪：把同一组模板角点应用到多张图片（例如固定机位拍摄的连续帧）
+    
+    立即返回任务状态；各帧在后台按引擎进程数并发处理，完成一帧即移到 processed 文件夹。
+    进度通过 GET /api/batch-crop/{job_id} 或 /api/progress/stream 的 batch 事件获取。
+    """
+    if not request.points or len(request.points) != 4:
+        raise HTTPException(status_code=400, detail="需要4个角点")
+    sizing = (request.output_width, request.output_height, request.max_side, request.dpi)
+    if any(value is not None and value <= 0 for value in sizing):
+        raise HTTPException(status_code=400, detail="输出尺寸和 DPI 必须为正数")
+    if request.reference_size is not None and (len(request.reference_size) != 2 or min(request.reference_size) <= 0):
+        raise HTTPException(status_code=400, detail="reference_size 需要为 [宽, 高]")
+    if min(get_warp_size(order_points(request.points))) <= 0:
+        raise HTTPException(status_code=400, detail="角点围成的区域面积为 0")
+    
+    if request.files is not None:
+        # 只接受 source 目录中已登记的文件名，拒绝带路径的名称（防止越出 SOURCE_DIR）
+        if any(os.path.basename(name) != name or "\\" in name or name in ("", ".", "..") for name in request.files):
+            raise HTTPException(status_code=400, detail="文件名不能包含路径")
+        known = set(file_index.list_filenames("source"))
+        files = [name for name in dict.fromkeys(request.files) if name in known]
+    elif request.pattern:
+        files = sorted(fnmatch.filter(file_index.list_filenames("source"), request.pattern))
+    else:
+        raise HTTPException(status_code=400, detail="需要 files 或 pattern")
+    if not files:
+        raise HTTPException(status_code=404, detail="没有匹配的待处理文件")
+    
+    reference_size = request.reference_size
+    if reference_size is None:
+        first = file_index.get_file("source", files[0])
+        if first is None or first["width"] is None:
+            raise HTTPException(status_code=400, detail="无法确定模板尺寸，请传入 reference_size")
+        reference_size = [first["width"], first["height"]]
+    
+    plans = {}
+    
+    async def process(filename: str) -> dict:
+        # 处理前以任务身份领取租约，交互式裁剪和领取队列不会同时处理这一帧；
+        # 发起任务的操作员自己持有的租约直接沿用
+        lease_owner = f"batch:{job.id}"
+        if operator is None or lease_queue.holder(filename) != operator:
+            if not lease_queue.renew(filename, lease_owner):
+                raise FrameSkipped("该文件正由其他操作员处理")
+        try:
+            return await process_frame(filename)
+        finally:
+            # 成功时租约已随文件移动释放；跳过或失败时归还，帧重新回到待处理队列
+            lease_queue.release(filename, lease_owner)
+    
+    async def process_frame(filename: str) -> dict:
+        record = await refresh_file("source", filename)
+        if record is None or record["width"] is None:
+            raise FrameSkipped("文件不存在或无法读取")
+        
+        width, height = record["width"], record["height"]
+        if (width, height) not in plans:
+            plans[(width, height)] = get_template_plan(request, reference_size, width, height)
+        rect, output_size, decode_size = plans[(width, height)]
+        
+        output_filename = f"{os.path.splitext(filename)[0]}_cropped.jpg"
+        output_path = os.path.join(OUTPUT_DIR, output_filename)
+        progress_broker.publish_file_state(filename, "processing")
+        try:
+            async with memory_admission.reserve(estimate_warp_bytes(width, height, *output_size)):
+                written = await image_engine.template_warp(
+                    os.path.join(SOURCE_DIR, filename), output_path, rect, (width, height), output_size,
+                    decode_size=decode_size, dpi=request.dpi)
+        except ExecutorBusy:
+            progress_broker.publish_file_state(filename, "pending")
+            raise
+        except Exception as e:
+            progress_broker.publish_file_state(filename, "error", error=str(e))
+            raise
+        await io_executor.run(file_index.upsert_file, "output", output_filename)
+        await move_to_processed(filename)
+        return {"filename": output_filename, "output_width": written[0],
+                "output_height": written[1], "transform": written[2]}
+    
+    def on_progress(job):
+        progress_broker.publish("batch", job.snapshot(details=False))
+    
+    job = batch_jobs.create(files)
+    batch_jobs.start(job, process, image_engine.workers, on_progress)
+    return job.snapshot()
+
+
+@app.get("/api/batch-crop/{job_id}", response_model=BatchJobResponse)
+async def get_batch_crop(job_id: str):
+    """查询批量裁剪任务状态"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.snapshot()
+
+
+@app.delete("/api/batch-crop/{job_id}", response_model=BatchJobResponse)
+async def cancel_batch_crop(job_id: str):
+    """取消批量裁剪任务：正在处理的帧完成后停止，未处理的文件保持待处理"""
+    job = batch_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.snapshot()
+
+
 @app.get("/api/download/{filename:path}")
 async def download(filename: str):
     """下载处理后的图片"""
@@ -469,8 +1353,8 @@ async def download(filename: str):
         # URL解码文件名，处理空格等特殊字符
         decoded_filename = urllib.parse.unquote(filename)
         
-        # 如果文件名不包含_cropped，自动添加
-        if not decoded_filename.endswith('_cropped.jpg') and not decoded_filename.endswith('_cropped.jpeg'):
+        # 如果文件名不包含_cropped（或多区域的 _cropped_N），自动添加
+        if not CROPPED_NAME_PATTERN.search(decoded_filename):
             name_without_ext = os.path.splitext(decoded_filename)[0]
             decoded_filename = f"{name_without_ext}_cropped.jpg"
         
@@ -495,40 +1379,48 @@ async def get_image_info(filename: str):
         raise HTTPException(status_code=404, detail="文件不存在")
     
     try:
-        img = cv2.imread(path)
-        if img is None:
+        # 刷新单个文件的索引记录，文件未变化时不会重新探测
+        record = await refresh_file("source", filename)
+        if record is None or record["width"] is None:
             raise HTTPException(status_code=400, detail="无法读取图片文件")
         
-        height, width = img.shape[:2]
-        file_size = os.path.getsize(path)
-        created_time = time.ctime(os.path.getctime(path))
-        
-        return ImageInfo(
-            filename=filename,
-            width=int(width),
-            height=int(height),
-            file_size=file_size,
-            created_time=created_time
-        )
+        return image_info_from_record(record)
     
+    except (HTTPException, ExecutorBusy):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取图片信息时出错: {str(e)}")
 
 
 @app.post("/api/auto-detect/{filename}", response_model=AutoDetectResponse)
-async def auto_detect_corners_api(filename: str):
+async def auto_detect_corners_api(filename: str,
+                                  operator: Optional[str] = Header(None, alias="X-Operator-Id")):
     """自动检测图片的四个角点"""
     path = os.path.join(SOURCE_DIR, filename)
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="文件不存在")
     
+    renew_lease(filename, operator)
+    
     try:
-        print(f"开始自动检测角点: {filename}")
+        # 优先使用索引中缓存的检测结果（文件变化时缓存会被清空）
+        record = await refresh_file("source", filename)
+        corners, confidence = FileIndex.get_detection(record)
         
-        # 调用自动检测函数
-        corners, confidence = auto_detect_corners(path, debug=True)
-        
-        print(f"自动检测完成 - 角点: {corners}, 置信度: {confidence}")
+        if corners is None:
+            print(f"开始自动检测角点: {filename}")
+            
+            if record is not None and record["ingest_state"] == "none":
+                # 尚未导入的文件提升为高优先级，由后台线程完成导入后读取缓存的检测结果
+                await wait_for_thumbnail(thumbnail_pool.submit("source", filename, PRIORITY_INTERACTIVE))
+                corners, confidence = FileIndex.get_detection(file_index.get_file("source", filename))
+            
+            if corners is None:
+                # 在引擎进程中检测（原图已在该进程缓存中时直接使用，否则按检测尺寸缩小解码）
+                corners, confidence = await image_engine.detect(path, debug=True)
+                file_index.set_detection("source", filename, corners, confidence)
+            
+            print(f"自动检测完成 - 角点: {corners}, 置信度: {confidence}")
         
         return AutoDetectResponse(
             success=True,
@@ -537,6 +1429,8 @@ async def auto_detect_corners_api(filename: str):
             message=f"自动检测完成，置信度: {confidence:.1%}" if confidence > 0.3 else "检测置信度较低，建议手动调整"
         )
         
+    except ExecutorBusy:
+        raise
     except Exception as e:
         print(f"自动检测失败: {str(e)}")
         return AutoDetectResponse(
@@ -549,12 +1443,21 @@ async def auto_detect_corners_api(filename: str):
 
 
 @app.get("/api/next-file/{current_filename}", response_model=NextFileResponse)
-async def get_next_file(current_filename: str):
-    """获取下一个待处理的图片文件名"""
+async def get_next_file(current_filename: str, operator: Optional[str] = None,
+                        lease_ttl: float = DEFAULT_LEASE_TTL,
+                        operator_header: Optional[str] = Header(None, alias="X-Operator-Id")):
+    """
+    获取下一个待处理的图片文件名
+    
+    携带操作员标识（operator 参数或 X-Operator-Id 请求头）时，原子地领取一个
+    其他操作员未占用的文件并加上租约；预览和自动检测会续租，裁剪完成或超时后释放。
+    """
+    operator = operator or operator_header
     try:
-        files = [f for f in os.listdir(SOURCE_DIR) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
+        await reconcile_index("source")
+        total_count = file_index.count("source")
         
-        if not files:
+        if total_count == 0:
             return NextFileResponse(
                 success=False,
                 next_filename=None,
@@ -563,26 +1466,38 @@ async def get_next_file(current_filename: str):
             )
         
         # 如果当前文件还在列表中（这种情况不应该发生，因为裁剪后文件已移动）
-        if current_filename in files:
-            files.remove(current_filename)
+        remaining_count = total_count
+        if file_index.get_file("source", current_filename) is not None:
+            remaining_count -= 1
         
-        if not files:
+        if operator:
+            # 当前文件不再由该操作员占用
+            lease_queue.release(current_filename, operator)
+            next_file, lease_expires_at = lease_queue.claim(operator, lease_ttl, exclude=current_filename)
+            # 剩余数量不包括其他操作员正在处理的文件
+            remaining_count = max(0, remaining_count - lease_queue.active_count(exclude_operator=operator))
+        else:
+            # 返回第一个文件（按字母顺序）
+            next_file, lease_expires_at = file_index.first_filename("source", exclude=current_filename), None
+        
+        if next_file is None:
             return NextFileResponse(
                 success=False,
                 next_filename=None,
-                remaining_count=0,
-                message="所有文件已处理完成"
+                remaining_count=remaining_count,
+                message="所有文件已处理完成" if remaining_count == 0 else "剩余文件均由其他操作员处理中"
             )
         
-        # 返回第一个文件（按字母顺序）
-        next_file = sorted(files)[0]
         return NextFileResponse(
             success=True,
             next_filename=next_file,
-            remaining_count=len(files),
-            message="获取下一个文件成功"
+            remaining_count=remaining_count,
+            message="获取下一个文件成功",
+            lease_expires_at=lease_expires_at
         )
         
+    except ExecutorBusy:
+        raise
     except Exception as e:
         return NextFileResponse(
             success=False,
@@ -592,5 +1507,22 @@ async def get_next_file(current_filename: str):
         )
 
 
+@app.delete("/api/lease/{filename}")
+async def release_lease(filename: str, operator: Optional[str] = Header(None, alias="X-Operator-Id")):
+    """
+    释放操作员对文件的租约（例如切换到其他图片或关闭页面时）
+    
+    只能释放请求头中操作员自己持有的租约：未携带 X-Operator-Id 返回 400，
+    租约由其他操作员持有时返回 403。
+    """
+    if not operator:
+        raise HTTPException(status_code=400, detail="需要 X-Operator-Id 请求头")
+    holder = lease_queue.holder(filename)
+    if holder is not None and holder != operator:
+        raise HTTPException(status_code=403, detail="该文件的租约由其他操作员持有")
+    released = lease_queue.release(filename, operator)
+    return {"success": released, "filename": filename}
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+处理进度事件模块
+在内存中增量维护待处理/已处理计数，并通过 SSE 向前端推送进度和单个文件的状态变化
+"""
+import asyncio
+import json
+import time
+from typing import Optional, Set
+
+from file_index import FileIndex
+
+
+# 没有变更时的轮询间隔（秒）；其他 worker 进程写入的变更也通过轮询变更日志获得
+POLL_INTERVAL = 1.0
+
+# SSE 保活注释的发送间隔（秒），避免代理断开空闲连接
+KEEPALIVE_INTERVAL = 15.0
+
+# 每个订阅者最多积压的事件数，慢客户端只会丢弃最旧的事件
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class ProgressBroker:
+    """
+    进度事件中心
+
+    通过跟踪 FileIndex 的变更日志增量更新计数（不再重新列目录），
+    并把进度快照和文件状态变化广播给所有 SSE 订阅者。
+    """
+
+    def __init__(self, index: FileIndex):
+        self.index = index
+        self.pending_count = 0
+        self.processed_count = 0
+        self._last_seq = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _recount(self):
+        """从索引重新统计计数（启动时或变更日志令牌失效时）"""
+        self._last_seq = self.index.current_token()
+        self.pending_count = self.index.count("source")
+        self.processed_count = self.index.count("processed")
+
+    def _reconcile(self):
+        """同步待处理和已处理目录（发现新文件时需要探测尺寸，在线程中执行，不阻塞事件循环）"""
+        self.index.reconcile("source")
+        self.index.reconcile("processed")
+
+    async def start(self):
+        """在事件循环中启动变更跟踪任务"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await asyncio.to_thread(self._reconcile)
+        self._recount()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止变更跟踪任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self, change=None):
+        """
+        通知有新变更（可在任意线程调用），立即唤醒跟踪任务而不必等到下一次轮询
+
+        作为 FileIndex 的变更监听器使用。
+        """
+        if self._loop is None or self._wake is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def snapshot(self) -> dict:
+        """返回当前进度快照"""
+        total = self.pending_count + self.processed_count
+        return {
+            "pending_count": self.pending_count,
+            "processed_count": self.processed_count,
+            "total_files": total,
+            "completion_rate": (self.processed_count / total * 100) if total > 0 else 100,
+            "timestamp": time.time(),
+        }
+
+    def publish(self, event_type: str, data: dict):
+        """向所有订阅者广播事件（需在事件循环线程中调用）"""
+        event = (event_type, data)
+        for queue in list(self._subscribers):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def publish_threadsafe(self, event_type: str, data: dict):
+        """从其他线程（如后台缩略图线程）广播事件"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self.publish, event_type, data)
+
+    def publish_file_state(self, filename: str, state: str, **extra):
+        """广播单个文件的状态变化（pending / processing / processed / removed / error）"""
+        self.publish("file", {"filename": filename, "state": state, **extra})
+
+    def _apply_change(self, row):
+        """根据一条变更日志更新计数并广播文件状态"""
+        change_type = row["change_type"]
+        directory = row["directory"]
+
+        if change_type == "moved":
+            if directory == "source":
+                self.pending_count -= 1
+            elif directory == "processed":
+                self.processed_count -= 1
+            if row["to_directory"] == "source":
+                self.pending_count += 1
+            elif row["to_directory"] == "processed":
+                self.processed_count += 1
+                self.publish_file_state(row["filename"], "processed", processed_filename=row["to_filename"])
+            return
+
+        delta = {"added": 1, "removed": -1}.get(change_type, 0)
+        if directory == "source":
+            self.pending_count += delta
+            self.publish_file_state(row["filename"], "removed" if delta < 0 else "pending")
+        elif directory == "processed":
+            self.processed_count += delta
+
+    def _drain_changes(self) -> bool:
+        """
+        读取并应用自上次以来的全部变更
+
+        Returns:
+            bool: 计数是否发生变化
+        """
+        before = (self.pending_count, self.processed_count)
+        while True:
+            rows, token, reset = self.index.get_changes(self._last_seq)
+            if reset:
+                self._recount()
+                return True
+            for row in rows:
+                self._apply_change(row)
+            self._last_seq = token
+            if not rows:
+                break
+        return before != (self.pending_count, self.processed_count)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                # 同步外部放入/删除的文件（目录未变化时只有一次 stat）
+                await asyncio.to_thread(self._reconcile)
+                if self._drain_changes():
+                    self.publish("progress", self.snapshot())
+            except Exception as e:
+                print(f"进度事件更新失败: {e}")
+
+    async def stream(self):
+        """
+        SSE 事件流生成器：先发送当前快照，然后持续推送事件
+
+        Yields:
+            str: SSE 格式的消息
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            yield format_sse("progress", self.snapshot())
+            while True:
+                try:
+                    event_type, data = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event_type, data)
+        finally:
+            self._subscribers.discard(queue)
+
+
+def format_sse(event_type: str, data: dict) -> str:
+    """将事件格式化为 SSE 消息"""
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缩小解码性能对比
+比较缩略图、检测用图像和导入流程在 完整解码 + 缩放 与 DCT 缩小解码 + 缩放 两种方式下的耗时和解码内存
+
+用法:
+    python test_files/benchmark_reduced_decode.py [图片路径 ...]
+不传图片时生成一张 6000x4000 的合成相机照片
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processor import get_detection_size, read_image_reduced
+
+THUMBNAIL_SIZE = (200, 200)
+DETECTION_SIZE = 400
+EDITOR_PROXY_SIZE = 1600
+REPEAT = 5
+
+
+def make_camera_like_jpeg(path, width=6000, height=4000):
+    """生成带纹理和噪声的合成照片（纯色图压缩后太小，不能代表真实解码负载）"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = (np.sin(x / 37.0) + np.cos(y / 53.0)) * 40 + 128
+    image = np.dstack([base, base * 0.9, base * 1.1]) + rng.normal(0, 12, (height, width, 3))
+    cv2.rectangle(image, (width // 6, height // 6), (width * 5 // 6, height * 5 // 6), (235, 235, 235), 40)
+    cv2.imwrite(path, np.clip(image, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+
+def best_time(func):
+    """多次运行取最短耗时（毫秒）和最后一次的返回值"""
+    best = float("inf")
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def _decoded_bytes(img):
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+def thumbnail_full(path):
+    """原实现：Image.thumbnail 内部只按 2 倍余量（reducing_gap）缩小解码"""
+    with Image.open(path) as img:
+        img.draft(None, (THUMBNAIL_SIZE[0] * 2, THUMBNAIL_SIZE[1] * 2))
+        decoded = _decoded_bytes(img)
+        img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        return decoded
+
+
+def thumbnail_draft(path):
+    """新实现：按目标尺寸缩小解码"""
+    with Image.open(path) as img:
+        img.draft(None, THUMBNAIL_SIZE)
+        decoded = _decoded_bytes(img)
+        img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        return decoded
+
+
+def detection_full(path):
+    image = cv2.imread(path)
+    size = get_detection_size(image.shape[1], image.shape[0], DETECTION_SIZE)
+    cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image.nbytes
+
+
+def detection_reduced(path):
+    image, _ = read_image_reduced(path, DETECTION_SIZE)
+    size = get_detection_size(image.shape[1], image.shape[0], DETECTION_SIZE)
+    cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image.nbytes
+
+
+def ingest_full(path):
+    image = cv2.imread(path)
+    return image.nbytes
+
+
+def ingest_reduced(path):
+    image, _ = read_image_reduced(path, EDITOR_PROXY_SIZE)
+    return image.nbytes
+
+
+def benchmark(path):
+    print(f"\n{os.path.basename(path)} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    print(f"{'路径':<12}{'完整解码':>12}{'缩小解码':>12}{'加速':>8}{'解码内存':>20}")
+    for name, full, reduced in (
+        ("缩略图(PIL)", thumbnail_full, thumbnail_draft),
+        ("检测图(cv2)", detection_full, detection_reduced),
+        ("导入解码", ingest_full, ingest_reduced),
+    ):
+        full_ms, full_bytes = best_time(lambda: full(path))
+        reduced_ms, reduced_bytes = best_time(lambda: reduced(path))
+        memory = f"{full_bytes / 1e6:.1f}->{reduced_bytes / 1e6:.1f} MB"
+        print(f"{name:<12}{full_ms:>10.1f}ms{reduced_ms:>10.1f}ms{full_ms / reduced_ms:>7.1f}x{memory:>20}")
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, "camera_6000x4000.jpg")
+        make_camera_like_jpeg(path)
+        paths = [path]
+    for path in paths:
+        benchmark(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API 测试共用的夹具（在临时工作目录中启动应用）
+"""
+
+import os
+import shutil
+import sys
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """main 使用相对目录，导入和运行期间切换到临时目录；所有 API 测试共用一个应用实例"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("api"))
+    import main
+    try:
+        with TestClient(main.app) as client:
+            yield main, client
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(main.DECODED_SPOOL_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def add_source_image(api):
+    """在 source 目录中写入一张测试图片并同步索引"""
+    main, _ = api
+
+    def add(filename, width=400, height=300):
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+        cv2.rectangle(image, (50, 50), (width - 50, height - 50), (255, 255, 255), -1)
+        assert cv2.imwrite(os.path.join(main.SOURCE_DIR, filename), image)
+        main.file_index.reconcile("source")
+
+    return add
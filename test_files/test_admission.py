@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试内存预算准入控制
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import MemoryAdmission, estimate_warp_bytes
+from executors import ExecutorBusy
+
+
+def test_admission_gates_by_budget_and_backfills_small_requests():
+    """预算用尽时大请求排队，放得下的小请求先执行，释放后大请求按顺序放行"""
+    async def scenario():
+        admission = MemoryAdmission(budget=100, max_wait=5)
+        order = []
+        release_first = asyncio.Event()
+
+        async def job(name, nbytes, hold=None):
+            async with admission.reserve(nbytes):
+                order.append(name)
+                if hold is not None:
+                    await hold.wait()
+
+        first = asyncio.create_task(job("first", 70, release_first))
+        await asyncio.sleep(0)
+        large = asyncio.create_task(job("large", 60))
+        small = asyncio.create_task(job("small", 20))
+        await asyncio.sleep(0.01)
+
+        stats = admission.stats()
+        assert order == ["first", "small"]
+        assert stats["queue_depth"] == 1 and stats["queued_bytes"] == 60
+        assert stats["in_use"] == 70
+
+        release_first.set()
+        await asyncio.gather(first, large, small)
+        assert order == ["first", "small", "large"]
+        stats = admission.stats()
+        assert stats["in_use"] == 0 and stats["admitted"] == 3 and stats["max_wait"] > 0
+
+    asyncio.run(scenario())
+
+
+def test_admission_times_out_and_clamps_oversized_requests():
+    """排队超时抛出 ExecutorBusy；超过总预算的请求按总预算计"""
+    async def scenario():
+        admission = MemoryAdmission(budget=100, max_wait=0.05)
+        async with admission.reserve(10 ** 9):
+            assert admission.stats()["in_use"] == 100
+            with pytest.raises(ExecutorBusy):
+                async with admission.reserve(1):
+                    pass
+        stats = admission.stats()
+        assert stats["timeouts"] == 1 and stats["queue_depth"] == 0 and stats["in_use"] == 0
+
+    asyncio.run(scenario())
+    assert estimate_warp_bytes(100, 100, 10, 10) == 100 * 100 * 3 + 300 + 150
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 API 接口
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_batch_crop_rejects_paths_outside_source(api):
+    """批量裁剪只接受 source 目录中已登记的文件名"""
+    main, client = api
+    os.makedirs("secret", exist_ok=True)
+    assert cv2.imwrite(os.path.join("secret", "victim.jpg"), np.zeros((60, 80, 3), dtype=np.uint8))
+    points = [[0, 0], [80, 0], [80, 60], [0, 60]]
+
+    response = client.post("/api/batch-crop", json={
+        "points": points, "files": ["../secret/victim.jpg"], "reference_size": [80, 60]})
+    assert response.status_code == 400
+    response = client.post("/api/batch-crop", json={
+        "points": points, "files": ["victim.jpg"], "reference_size": [80, 60]})
+    assert response.status_code == 404
+    assert os.listdir("secret") == ["victim.jpg"]
+    assert main.file_index.get_file("source", "../secret/victim.jpg") is None
+
+
+def test_batch_crop_rejects_degenerate_template(api, add_source_image):
+    """角点重合时在创建任务前返回 400"""
+    main, client = api
+    add_source_image("frame.jpg")
+    response = client.post("/api/batch-crop", json={
+        "points": [[10, 10]] * 4, "files": ["frame.jpg"], "output_width": 100})
+    assert response.status_code == 400
+
+
+def test_crop_with_degenerate_quad_reports_error(api, add_source_image):
+    """角点重合时裁剪返回 success=False，原图保持待处理"""
+    main, client = api
+    add_source_image("flat.jpg")
+    response = client.post("/api/crop/flat.jpg", json={"points": [[10, 10]] * 4, "output_width": 100})
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+    assert os.path.exists(os.path.join(main.SOURCE_DIR, "flat.jpg"))
+
+
+def test_get_preview_is_shared_cacheable_and_revalidated(api, add_source_image):
+    """GET 预览可被反向代理缓存，匹配的 If-None-Match 返回 304"""
+    main, client = api
+    add_source_image("preview.jpg")
+    url = "/api/preview/preview.jpg?points=40,40,360,40,360,260,40,260"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, no-cache"
+
+    response = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+    assert response.headers["cache-control"] == "public, no-cache"
+
+
+def test_release_lease_requires_the_holding_operator(api, add_source_image):
+    """释放租约必须携带操作员标识，且只能释放自己持有的租约"""
+    main, client = api
+    add_source_image("leased.jpg")
+    assert main.lease_queue.renew("leased.jpg", "op1")
+
+    assert client.delete("/api/lease/leased.jpg").status_code == 400
+    assert client.delete("/api/lease/leased.jpg", headers={"X-Operator-Id": "op2"}).status_code == 403
+    assert main.lease_queue.holder("leased.jpg") == "op1"
+
+    response = client.delete("/api/lease/leased.jpg", headers={"X-Operator-Id": "op1"})
+    assert response.status_code == 200 and response.json()["success"] is True
+    assert main.lease_queue.holder("leased.jpg") is None
+
+
+def test_live_preview_renders_only_the_latest_update(api, add_source_image, monkeypatch):
+    """渲染期间到达的多条更新只渲染最后一条，帧描述报告被取代的条数"""
+    main, client = api
+    add_source_image("live.jpg")
+    render = main.get_preview_content
+    started, release = threading.Event(), threading.Event()
+
+    async def slow_render(*args, **kwargs):
+        started.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return await render(*args, **kwargs)
+
+    monkeypatch.setattr(main, "get_preview_content", slow_render)
+    points = [[40, 40], [360, 40], [360, 260], [40, 260]]
+    with client.websocket_connect("/api/preview/live.jpg/live?operator=op1") as ws:
+        ws.send_text(json.dumps({"seq": 0, "points": points}))
+        assert started.wait(5)
+        for seq in range(1, 5):
+            ws.send_text(json.dumps({"seq": seq, "points": [[40 + seq, 40]] + points[1:]}))
+        # 等待后续更新全部到达服务端后再完成第一帧的渲染
+        time.sleep(0.3)
+        release.set()
+
+        frames = []
+        for _ in range(2):
+            frame = ws.receive_json()
+            assert frame["type"] == "frame"
+            assert ws.receive_bytes()[:2] == b"\xff\xd8"
+            frames.append((frame["seq"], frame["dropped"]))
+    assert frames == [(0, 0), (4, 3)]
+
+
+def test_cancelled_preview_keeps_memory_reserved_until_render_finishes(api, add_source_image, monkeypatch):
+    """预览被取消后，预留的内存在引擎任务结束后才归还"""
+    main, client = api
+    add_source_image("cancel.jpg")
+    record = main.file_index.get_file("source", "cancel.jpg")
+    points = [[40, 40], [360, 40], [360, 260], [40, 260]]
+
+    async def scenario():
+        finish = asyncio.Event()
+
+        async def slow_warp(*args, **kwargs):
+            await finish.wait()
+            return b"\xff\xd8"
+
+        monkeypatch.setattr(main.image_engine, "warp", slow_warp)
+        in_use = main.memory_admission.in_use
+        render = asyncio.ensure_future(main.get_preview_content("cancel.jpg", record, points, ("cancel", 1)))
+        while main.memory_admission.in_use == in_use:
+            await asyncio.sleep(0.01)
+        render.cancel()
+        await asyncio.sleep(0.05)
+        assert main.memory_admission.in_use > in_use and not render.done()
+
+        finish.set()
+        try:
+            await render
+        except asyncio.CancelledError:
+            pass
+        assert main.memory_admission.in_use == in_use
+        assert main.preview_cache.get(("cancel", 1)) is None
+
+    asyncio.run(scenario())
+
+
+def test_tile_level_is_built_once_per_level(api, add_source_image, monkeypatch):
+    """同一级别的并发瓦片请求只生成一次，生成期间预留内存，等待中的请求不占用 CPU 线程池名额"""
+    main, client = api
+    add_source_image("tiles.jpg", width=1300, height=1000)
+    build = main.tile_cache.build_level
+    release = threading.Event()
+    builds, reserved = [], []
+
+    def slow_build(directory, tile):
+        builds.append(tile["level"])
+        reserved.append(main.memory_admission.in_use)
+        assert release.wait(5)
+        build(directory, tile)
+
+    monkeypatch.setattr(main.tile_cache, "build_level", slow_build)
+    top = client.get("/api/tiles/tiles.jpg/info").json()["max_level"]
+
+    async def fetch(column):
+        tile = main.tile_cache.locate_tile("source", "tiles.jpg", top, column, 0)
+        await main.build_tile_level("source", tile)
+        return tile["path"]
+
+    async def scenario():
+        pending = asyncio.gather(*[fetch(column) for column in range(3)])
+        while not builds:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        assert main.cpu_executor.stats()["in_flight"] == 1
+        release.set()
+        return await pending
+
+    paths = asyncio.run(scenario())
+    assert all(os.path.exists(path) for path in paths)
+    assert builds == [top] and main.tile_builds == {}
+    assert reserved[0] >= main.estimate_level_bytes(1300, 1000, top) == 1300 * 1000 * 3
+    monkeypatch.setattr(main.tile_cache, "build_level", build)
+    assert client.get(f"/api/tiles/tiles.jpg/{top - 1}/0_0.jpg").status_code == 200
+    assert client.get(f"/api/tiles/tiles.jpg/{top - 1}/9_0.jpg").status_code == 404
+
+
+def test_failed_crop_removes_partial_outputs(api, add_source_image, monkeypatch):
+    """引擎抛出 cv2.error 等异常时返回 success=False，删除已写出的区域并广播错误状态"""
+    main, client = api
+    add_source_image("partial.jpg")
+    states = []
+
+    async def failing_warp(path, regions, output_paths, **kwargs):
+        assert cv2.imwrite(output_paths[0], np.zeros((10, 10, 3), dtype=np.uint8))
+        main.file_index.upsert_file("output", os.path.basename(output_paths[0]))
+        raise cv2.error("warp failed")
+
+    monkeypatch.setattr(main.image_engine, "warp_regions", failing_warp)
+    monkeypatch.setattr(main.progress_broker, "publish_file_state",
+                        lambda filename, state, **extra: states.append((filename, state)))
+    quad = [[40, 40], [200, 40], [200, 260], [40, 260]]
+    response = client.post("/api/crop/partial.jpg", json={"regions": [quad, quad]})
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+    assert [state for filename, state in states if filename == "partial.jpg"][-2:] == ["processing", "error"]
+    assert not os.path.exists(os.path.join(main.OUTPUT_DIR, "partial_cropped_1.jpg"))
+    assert main.file_index.get_file("output", "partial_cropped_1.jpg") is None
+    assert os.path.exists(os.path.join(main.SOURCE_DIR, "partial.jpg"))
+
+
+def test_batch_crop_leases_each_frame(api, add_source_image, monkeypatch):
+    """批量任务处理每帧前以任务身份领取租约，被其他操作员领取的帧跳过，失败的帧归还租约"""
+    main, client = api
+    for name in ("batch_a.jpg", "batch_b.jpg", "batch_c.jpg"):
+        add_source_image(name)
+    assert main.lease_queue.renew("batch_b.jpg", "op2")
+    warp = main.image_engine.template_warp
+    holders = {}
+
+    async def recording_warp(path, *args, **kwargs):
+        filename = os.path.basename(path)
+        holders[filename] = main.lease_queue.holder(filename)
+        if filename == "batch_c.jpg":
+            raise RuntimeError("warp failed")
+        return await warp(path, *args, **kwargs)
+
+    monkeypatch.setattr(main.image_engine, "template_warp", recording_warp)
+    response = client.post("/api/batch-crop", json={
+        "points": [[40, 40], [360, 40], [360, 260], [40, 260]],
+        "files": ["batch_a.jpg", "batch_b.jpg", "batch_c.jpg"], "output_width": 100})
+    job_id = response.json()["job_id"]
+    for _ in range(100):
+        job = client.get(f"/api/batch-crop/{job_id}").json()
+        if job["state"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+
+    assert (job["completed"], job["skipped"], job["failed"]) == (1, 1, 1)
+    assert holders == {"batch_a.jpg": f"batch:{job_id}", "batch_c.jpg": f"batch:{job_id}"}
+    assert main.lease_queue.holder("batch_b.jpg") == "op2"
+    assert main.lease_queue.holder("batch_c.jpg") is None
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量裁剪任务管理
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_jobs import BatchJobManager, FrameSkipped
+from executors import ExecutorBusy
+
+
+def test_batch_job_streams_frames_with_bounded_concurrency():
+    """各帧按有限并发处理；跳过、失败和繁忙重试分别计数，每帧完成后报告进度"""
+    async def scenario():
+        manager = BatchJobManager()
+        running, peak, busy_once = 0, 0, {"f3"}
+        events = []
+
+        async def process(filename):
+            nonlocal running, peak
+            if filename in busy_once:
+                busy_once.discard(filename)
+                raise ExecutorBusy("engine", retry_after=0)
+            if filename == "missing":
+                raise FrameSkipped("文件不存在")
+            if filename == "broken":
+                raise IOError("无法读取图片")
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"filename": f"{filename}_cropped.jpg"}
+
+        files = ["f1", "f2", "f3", "missing", "broken", "f6"]
+        job = manager.create(files)
+        manager.start(job, process, concurrency=2, on_progress=lambda j: events.append(j.snapshot(details=False)))
+        await job._task
+
+        snapshot = manager.get(job.id).snapshot()
+        assert snapshot["state"] == "done" and snapshot["progress"] == 100
+        assert (snapshot["completed"], snapshot["skipped"], snapshot["failed"]) == (4, 1, 1)
+        assert set(snapshot["errors"]) == {"missing", "broken"}
+        assert peak == 2
+        assert len(events) == len(files) + 1 and "outputs" not in events[-1]
+
+    asyncio.run(scenario())
+
+
+def test_batch_job_cancel_stops_before_next_frame():
+    """取消后正在处理的帧照常完成，之后的帧不再处理"""
+    async def scenario():
+        manager = BatchJobManager()
+        job = manager.create([f"f{i}" for i in range(10)])
+
+        async def process(filename):
+            if filename == "f1":
+                manager.cancel(job.id)
+            await asyncio.sleep(0)
+            return {"filename": filename}
+
+        manager.start(job, process, concurrency=1)
+        await job._task
+        assert job.state == "cancelled"
+        assert job.completed == 2
+
+    asyncio.run(scenario())
+
+
+def test_batch_job_counts_unexpected_errors_and_always_finishes():
+    """任何异常都只计为该帧失败；进度回调出错时任务也会结束，不会停在 running"""
+    async def scenario():
+        manager = BatchJobManager()
+
+        async def process(filename):
+            if filename == "f1":
+                raise ZeroDivisionError("division by zero")
+            return {"filename": filename}
+
+        job = manager.create(["f1", "f2"])
+        manager.start(job, process, concurrency=2)
+        await job._task
+        assert job.state == "done"
+        assert (job.completed, job.failed) == (1, 1) and "f1" in job.errors
+
+        def broken_progress(_job):
+            raise KeyError("progress")
+
+        job = manager.create(["f1"])
+        manager.start(job, process, concurrency=1, on_progress=broken_progress)
+        await asyncio.gather(job._task, return_exceptions=True)
+        assert job.state == "failed" and job.finished
+
+    asyncio.run(scenario())
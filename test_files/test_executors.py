@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试有界执行器
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from executors import BoundedExecutor, ExecutorBusy
+
+
+def test_executor_rejects_when_queue_is_full():
+    """运行和排队名额占满后立即拒绝，任务结束后名额释放"""
+    executor = BoundedExecutor("test", workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(lambda: 42))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorBusy):
+            await executor.run(lambda: 0)
+        assert executor.stats()["in_flight"] == 2
+
+        release.set()
+        assert await running is True
+        assert await queued == 42
+        assert await executor.run(lambda: 7) == 7
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+    stats = executor.stats()
+    assert stats["rejected"] == 1 and stats["completed"] == 3 and stats["in_flight"] == 0
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件列表增量变更接口
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+
+
+def test_changes_report_added_and_moved_files(api, add_source_image):
+    """新增文件带文件信息，裁剪后以 moved 报告 source -> processed，令牌推进后不再重复返回"""
+    main, client = api
+    token = client.get("/api/files/changes").json()["token"]
+
+    add_source_image("delta.jpg")
+    add_source_image("steady.jpg", width=320)
+    response = client.post("/api/crop/delta.jpg", json={"points": [[50, 50], [350, 50], [350, 250], [50, 250]]})
+    assert response.json()["success"] is True
+
+    body = client.get("/api/files/changes", params={"since": token}).json()
+    assert body["reset"] is False and body["has_more"] is False
+    changes = {(change["filename"], change["change_type"]): change for change in body["changes"]}
+    assert changes[("steady.jpg", "added")]["file"]["width"] == 320
+    # 已移出 source 的文件不再附带文件信息
+    assert changes[("delta.jpg", "added")]["file"] is None
+    moved = changes[("delta.jpg", "moved")]
+    assert (moved["directory"], moved["to_directory"], moved["to_filename"]) == ("source", "processed", "delta.jpg")
+    assert moved["seq"] > changes[("delta.jpg", "added")]["seq"]
+
+    body = client.get("/api/files/changes", params={"since": body["token"]}).json()
+    assert body["changes"] == [] and body["reset"] is False
+
+
+def test_changes_reset_for_unknown_or_invalid_tokens(api):
+    """令牌超出当前日志范围（例如数据库被重建）时要求全量刷新；格式错误返回 400"""
+    main, client = api
+    latest = int(client.get("/api/files/changes").json()["token"])
+
+    body = client.get("/api/files/changes", params={"since": str(latest + 1000)}).json()
+    assert body["reset"] is True and body["changes"] == []
+    assert int(body["token"]) == latest
+    assert client.get("/api/files/changes", params={"since": "abc"}).status_code == 400
+
+
+def test_changes_reset_for_tokens_past_the_log(tmp_path):
+    """令牌超出当前日志范围（例如数据库被重建）时要求全量刷新，令牌回到最新序号"""
+    directories = {"source": str(tmp_path / "source")}
+    os.makedirs(directories["source"])
+    index = FileIndex(str(tmp_path / "index.db"), directories)
+    assert cv2.imwrite(os.path.join(directories["source"], "a.jpg"), np.zeros((30, 40, 3), dtype=np.uint8))
+    index.reconcile("source")
+
+    assert index.get_changes(index.current_token() + 1000) == ([], 1, True)
+    rows, token, reset = index.get_changes(index.current_token())
+    assert (rows, token, reset) == ([], 1, False)
+
+
+def test_changes_reset_when_log_was_trimmed(tmp_path):
+    """令牌早于日志保留范围时返回重置，期间的移动记录可以正常读取"""
+    directories = {"source": str(tmp_path / "source"), "processed": str(tmp_path / "processed")}
+    for path in directories.values():
+        os.makedirs(path)
+    index = FileIndex(str(tmp_path / "index.db"), directories)
+    for i in range(3):
+        assert cv2.imwrite(os.path.join(directories["source"], f"img{i}.jpg"), np.zeros((30, 40, 3), dtype=np.uint8))
+    index.reconcile("source")
+    os.rename(os.path.join(directories["source"], "img0.jpg"), os.path.join(directories["processed"], "img0.jpg"))
+    index.move_file("source", "img0.jpg", "processed")
+
+    rows, token, reset = index.get_changes(3)
+    assert not reset and token == 4
+    assert [(row["change_type"], row["to_directory"]) for row in rows] == [("moved", "processed")]
+
+    # 模拟旧日志被裁剪：持有过旧令牌的客户端需要全量刷新
+    index._conn.execute("DELETE FROM changes WHERE seq <= 2")
+    index._conn.commit()
+    assert index.get_changes(0) == ([], 4, True)
+    assert index.get_changes(2)[2] is False
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 SQLite 文件元数据索引的增量同步
+"""
+
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import file_index
+from file_index import FileIndex
+
+
+def _make_index(tmp_path):
+    directories = {}
+    for name in ("source", "processed", "output"):
+        path = tmp_path / name
+        path.mkdir()
+        directories[name] = str(path)
+    return FileIndex(str(tmp_path / "index.db"), directories), directories
+
+
+def _write_image(path, width=40, height=30):
+    assert cv2.imwrite(str(path), np.zeros((height, width, 3), dtype=np.uint8))
+
+
+def test_reconcile_is_incremental(tmp_path):
+    """首次同步探测全部文件，目录未变化时跳过，新增和删除文件被增量识别"""
+    index, directories = _make_index(tmp_path)
+    _write_image(os.path.join(directories["source"], "a.jpg"))
+    _write_image(os.path.join(directories["source"], "b.png"), width=20)
+    open(os.path.join(directories["source"], "notes.txt"), "w").close()
+
+    stats = index.reconcile("source")
+    assert stats["added"] == 2
+    assert index.reconcile("source")["skipped"] == 1
+
+    record = index.get_file("source", "b.png")
+    assert (record["width"], record["height"], record["probe_method"]) == (20, 30, "header")
+
+    os.remove(os.path.join(directories["source"], "a.jpg"))
+    _write_image(os.path.join(directories["source"], "c.jpg"))
+    stats = index.reconcile("source", force=True)
+    assert (stats["added"], stats["removed"]) == (1, 1)
+    assert index.list_filenames("source") == ["b.png", "c.jpg"]
+
+
+def test_reconcile_probes_outside_index_lock(tmp_path, monkeypatch):
+    """探测文件时不持有索引锁；探测期间被其他线程写入的记录以对方为准，不重复记录变更"""
+    index, directories = _make_index(tmp_path)
+    for name in ("a.jpg", "b.jpg"):
+        _write_image(os.path.join(directories["source"], name))
+
+    probe = file_index.probe_image
+    concurrent = []
+
+    def probe_with_concurrent_upload(path):
+        if not concurrent:
+            def upload():
+                concurrent.append(index.count("source"))
+                index.upsert_file("source", os.path.basename(path))
+            worker = threading.Thread(target=upload)
+            worker.start()
+            worker.join(timeout=5)
+            assert not worker.is_alive()
+        return probe(path)
+
+    monkeypatch.setattr(file_index, "probe_image", probe_with_concurrent_upload)
+    stats = index.reconcile("source")
+
+    assert concurrent == [0]
+    assert stats["added"] == 1
+    rows, _, _ = index.get_changes(0)
+    assert sorted(row["filename"] for row in rows if row["change_type"] == "added") == ["a.jpg", "b.jpg"]
+    assert index.list_filenames("source") == ["a.jpg", "b.jpg"]
+
+
+def test_changed_file_clears_cached_detection(tmp_path):
+    """文件内容变化后缓存的检测结果应失效"""
+    index, directories = _make_index(tmp_path)
+    path = os.path.join(directories["source"], "a.jpg")
+    _write_image(path)
+    index.reconcile("source")
+    index.set_detection("source", "a.jpg", [[0, 0], [1, 0], [1, 1], [0, 1]], 0.9)
+    assert FileIndex.get_detection(index.get_file("source", "a.jpg"))[1] == 0.9
+
+    _write_image(path, width=80)
+    os.utime(path, ns=(0, 1))
+    record = index.get_file("source", "a.jpg", refresh=True)
+    assert record["width"] == 80
+    assert FileIndex.get_detection(record) == (None, None)
+
+
+def test_move_file_between_directories(tmp_path):
+    """move_file 将记录从 source 转移到 processed"""
+    index, directories = _make_index(tmp_path)
+    _write_image(os.path.join(directories["source"], "a.jpg"))
+    index.reconcile("source")
+
+    os.rename(os.path.join(directories["source"], "a.jpg"), os.path.join(directories["processed"], "a.jpg"))
+    index.move_file("source", "a.jpg", "processed")
+
+    assert index.count("source") == 0
+    assert index.get_file("processed", "a.jpg")["status"] == "processed"
+
+
+def test_cursor_pagination_is_stable_under_inserts(tmp_path):
+    """游标分页在翻页过程中新增文件时不会重复或遗漏已有文件"""
+    index, directories = _make_index(tmp_path)
+    for i in range(5):
+        path = os.path.join(directories["source"], f"img{i}.jpg")
+        _write_image(path)
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    index.reconcile("source")
+
+    first_page, cursor = index.list_files_after("source", None, 2)
+    # 翻页过程中上传一个更新的文件，它应出现在第一页之前而不是挤进后续页
+    time.sleep(0.01)
+    _write_image(os.path.join(directories["source"], "new.jpg"))
+    index.upsert_file("source", "new.jpg")
+
+    seen = [row["filename"] for row in first_page]
+    while cursor:
+        rows, cursor = index.list_files_after("source", cursor, 2)
+        seen += [row["filename"] for row in rows]
+
+    assert "new.jpg" not in seen
+    assert sorted(seen) == [f"img{i}.jpg" for i in range(5)]
+    assert len(seen) == len(set(seen))
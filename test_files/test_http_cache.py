@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 HTTP 条件请求（ETag / Last-Modified）
+"""
+
+import os
+import sys
+from email.utils import formatdate
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_cache import conditional_file_response, conditional_json_response
+
+
+class Listing(BaseModel):
+    files: list
+
+
+def _make_client(path, listing):
+    app = FastAPI()
+
+    @app.get("/file")
+    async def get_file(request: Request):
+        return conditional_file_response(request, path, "image/jpeg", {"Cache-Control": "no-cache"})
+
+    @app.get("/listing")
+    async def get_listing(request: Request):
+        return conditional_json_response(request, Listing(files=listing))
+
+    return TestClient(app)
+
+
+def test_if_none_match(tmp_path):
+    """ETag 匹配（含弱比较、列表和 *）时返回 304，并保留 ETag 和缓存头；不匹配时返回内容"""
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"image-bytes")
+    client = _make_client(str(path), [])
+
+    response = client.get("/file")
+    assert response.status_code == 200 and response.content == b"image-bytes"
+    etag = response.headers["etag"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get("/file", headers={"If-None-Match": header})
+        assert response.status_code == 304 and response.content == b""
+        assert response.headers["etag"] == etag and response.headers["cache-control"] == "no-cache"
+
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    # 文件被修改后旧 ETag 不再匹配
+    path.write_bytes(b"changed-bytes")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    response = client.get("/file", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+def test_if_modified_since(tmp_path):
+    """没有 If-None-Match 时按秒比较 If-Modified-Since；If-None-Match 存在时优先"""
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"image-bytes")
+    mtime = os.stat(path).st_mtime
+    client = _make_client(str(path), [])
+
+    last_modified = client.get("/file").headers["last-modified"]
+    assert last_modified == formatdate(mtime, usegmt=True)
+    assert client.get("/file", headers={"If-Modified-Since": last_modified}).status_code == 304
+    later = formatdate(mtime + 60, usegmt=True)
+    assert client.get("/file", headers={"If-Modified-Since": later}).status_code == 304
+
+    earlier = formatdate(mtime - 60, usegmt=True)
+    assert client.get("/file", headers={"If-Modified-Since": earlier}).status_code == 200
+    assert client.get("/file", headers={"If-Modified-Since": "not a date"}).status_code == 200
+    response = client.get("/file", headers={"If-Modified-Since": last_modified, "If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_json_listing_etag_follows_content(tmp_path):
+    """列表内容不变时返回 304，内容变化后 ETag 随之变化"""
+    listing = ["a.jpg"]
+    client = _make_client(str(tmp_path / "unused"), listing)
+
+    response = client.get("/listing")
+    assert response.status_code == 200 and response.json() == {"files": ["a.jpg"]}
+    etag = response.headers["etag"]
+    assert client.get("/listing", headers={"If-None-Match": etag}).status_code == 304
+
+    listing.append("b.jpg")
+    response = client.get("/listing", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试解码图像 LRU 缓存
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_cache import DecodedImageCache, DecodedImageSpool, PreviewCache, quantize_points
+from image_processor import four_point_transform
+
+
+def test_cache_hits_and_invalidates_on_change(tmp_path):
+    """同一文件只解码一次，文件修改或显式清除后重新解码"""
+    path = str(tmp_path / "a.png")
+    assert cv2.imwrite(path, np.full((300, 400, 3), 50, dtype=np.uint8))
+    cache = DecodedImageCache()
+
+    first = cache.get(path)
+    assert cache.get(path) is first
+    assert not first.flags.writeable
+    # 只读数组可以直接用于透视变换
+    assert four_point_transform(first, np.array([[0, 0], [399, 0], [399, 299], [0, 299]], dtype="float32")).shape[:2] == (299, 399)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    assert cv2.imwrite(path, np.full((100, 100, 3), 50, dtype=np.uint8))
+    mtime = os.stat(path).st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime, mtime))
+    assert cache.get(path).shape[:2] == (100, 100)
+
+    assert cache.invalidate(path) == 2
+    assert cache.peek(path) is None
+    assert cache.stats()["bytes"] == 0
+    assert cache.get(str(tmp_path / "missing.png")) is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """超出字节预算时淘汰最久未使用的图像"""
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"{i}.png")
+        assert cv2.imwrite(path, np.full((100, 100, 3), i, dtype=np.uint8))
+        paths.append(path)
+    cache = DecodedImageCache(max_bytes=100 * 100 * 3 * 2)
+
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+
+    assert cache.peek(paths[0]) is not None
+    assert cache.peek(paths[1]) is None
+    assert cache.peek(paths[2]) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_spool_shares_decodes_between_workers(tmp_path):
+    """一个 worker 解码后，其他 worker 通过落盘缓存直接映射，超出容量时按访问时间淘汰"""
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"{i}.png")
+        assert cv2.imwrite(path, np.full((100, 100, 3), i, dtype=np.uint8))
+        paths.append(path)
+    db_path, spool_dir = str(tmp_path / "index.db"), str(tmp_path / "spool")
+    # 两个缓存实例模拟两个 worker 进程，各自持有数据库连接
+    worker_a = DecodedImageCache(spool=DecodedImageSpool(db_path, spool_dir, max_bytes=100 * 100 * 3))
+    worker_b = DecodedImageCache(spool=DecodedImageSpool(db_path, spool_dir, max_bytes=100 * 100 * 3))
+
+    image = worker_a.get(paths[0])
+    assert isinstance(image, np.memmap) and not image.flags.writeable
+    shared = worker_b.get(paths[0])
+    assert worker_b.stats()["spool_hits"] == 1 and worker_b.stats()["misses"] == 0
+    assert np.array_equal(shared, image)
+
+    worker_b.get(paths[1])
+    assert worker_b.spool.stats()["entries"] == 1
+    assert len(os.listdir(spool_dir)) == 1
+
+    worker_a.invalidate(paths[1])
+    assert worker_a.spool.stats()["entries"] == 0
+    assert os.listdir(spool_dir) == []
+
+
+def test_prune_stale_releases_moved_and_invalidated_entries(tmp_path):
+    """其他进程清除落盘条目或原图被移动后，各 worker 在下个任务前释放自己持有的映射"""
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"{i}.png")
+        assert cv2.imwrite(path, np.full((100, 100, 3), i, dtype=np.uint8))
+        paths.append(path)
+    db_path, spool_dir = str(tmp_path / "index.db"), str(tmp_path / "spool")
+    server = DecodedImageSpool(db_path, spool_dir)
+    worker = DecodedImageCache(spool=DecodedImageSpool(db_path, spool_dir))
+    for path in paths:
+        worker.get(path)
+    assert worker.prune_stale() == 0
+
+    # 服务进程裁剪后清除落盘条目，worker 的缓存键仍与文件一致，但映射的页面已被删除
+    server.invalidate(paths[0])
+    assert worker.prune_stale() == 1
+    assert worker.peek(paths[0]) is None and worker.peek(paths[1]) is not None
+
+    os.rename(paths[1], str(tmp_path / "moved.png"))
+    assert worker.prune_stale() == 1
+    assert worker.stats(include_spool=False)["entries"] == 0
+    assert worker.stats(include_spool=False)["bytes"] == 0
+
+
+def test_preview_cache_quantizes_points_and_evicts():
+    """亚像素抖动的角点落在同一个缓存键上，超出容量时淘汰最久未使用的预览"""
+    assert quantize_points([[10.01, 20.0]]) == quantize_points([[9.99, 20.04]])
+    assert quantize_points([[10.0, 20.0]]) != quantize_points([[10.25, 20.0]])
+
+    cache = PreviewCache(max_bytes=10)
+    cache.put(("v1", 1), b"12345")
+    cache.put(("v1", 2), b"12345")
+    assert cache.get(("v1", 1)) == b"12345"
+    cache.put(("v1", 3), b"12345")
+    assert cache.get(("v1", 2)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 2
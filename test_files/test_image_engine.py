@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试进程池图像处理引擎
+"""
+
+import asyncio
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_engine import ImageEngine
+
+
+def test_engine_tasks_and_recycling(tmp_path):
+    """引擎进程执行变换、多区域裁剪、检测和编码；内存超限时整个进程池被替换，后续任务不受影响"""
+    path = str(tmp_path / "a.png")
+    image = np.zeros((300, 400, 3), dtype=np.uint8)
+    cv2.rectangle(image, (50, 50), (350, 250), (255, 255, 255), -1)
+    assert cv2.imwrite(path, image)
+    output_path = str(tmp_path / "out.jpg")
+    points = [[50, 50], [350, 50], [350, 250], [50, 250]]
+    region_paths = [str(tmp_path / "r1.jpg"), str(tmp_path / "r2.jpg")]
+
+    # 内存上限设为 1 字节：每个任务结束后都会替换进程池
+    engine = ImageEngine(workers=1, max_rss=1)
+
+    async def scenario():
+        assert await engine.warp(path, points, output_path=output_path) == (300, 200, "roi")
+        preview = await engine.warp(path, points, max_size=100, image_format="jpeg")
+        assert cv2.imdecode(np.frombuffer(preview, np.uint8), cv2.IMREAD_COLOR).shape[:2] == (66, 100)
+        corners, confidence = await engine.detect(path)
+        assert len(corners) == 4
+        decoded = await engine.decode(path)
+        assert decoded.shape == (300, 400, 3)
+        assert await engine.warp(str(tmp_path / "missing.png"), points) is None
+        # 多个区域共用一次解码，分别写入各自的输出文件
+        regions = [[[0, 0], [200, 0], [200, 300], [0, 300]], [[200, 0], [400, 10], [400, 300], [200, 300]]]
+        written = await engine.warp_regions(path, regions, region_paths, output_sizes=[None, (100, 150)])
+        assert written == [(200, 300, "roi"), (100, 150, "warp")]
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        engine.stop()
+
+    assert cv2.imread(output_path).shape[:2] == (200, 300)
+    stats = engine.stats()
+    assert cv2.imread(region_paths[1]).shape[:2] == (150, 100)
+    assert stats["completed"] == 6 and stats["in_flight"] == 0
+    assert stats["recycled"] >= 1
+
+
+def test_engine_reports_worker_cache_stats(tmp_path):
+    """各进程的解码缓存命中和未命中随任务结果带回，汇总在引擎统计中"""
+    path = str(tmp_path / "a.png")
+    assert cv2.imwrite(path, np.full((300, 400, 3), 128, dtype=np.uint8))
+    points = [[50, 50], [350, 50], [350, 250], [50, 250]]
+    engine = ImageEngine(workers=1)
+
+    async def scenario():
+        for _ in range(3):
+            await engine.warp(path, points, max_size=100, image_format="jpeg")
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        engine.stop()
+
+    cache = engine.stats()["decoded_cache"]
+    assert (cache["misses"], cache["hits"]) == (1, 2)
+    assert cache["entries"] == 1 and cache["bytes"] == 300 * 400 * 3
+
+
+def test_engine_drops_results_of_cancelled_calls(tmp_path, caplog):
+    """调用方取消等待后，任务完成时丢弃结果，回调中不抛出 InvalidStateError"""
+    path = str(tmp_path / "a.png")
+    assert cv2.imwrite(path, np.full((300, 400, 3), 128, dtype=np.uint8))
+    points = [[50, 50], [350, 50], [350, 250], [50, 250]]
+    engine = ImageEngine(workers=1)
+
+    async def scenario():
+        pending = asyncio.ensure_future(engine.warp(path, points, max_size=100, image_format="jpeg"))
+        await asyncio.sleep(0)
+        pending.cancel()
+        preview = await engine.warp(path, points, max_size=100, image_format="jpeg")
+        assert preview[:2] == b"\xff\xd8"
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        engine.stop()
+
+    assert "exception calling callback" not in caplog.text
+    assert engine.stats()["in_flight"] == 0
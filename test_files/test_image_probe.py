@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试图片文件头探测与完整解码回退
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_probe import probe_image, probe_image_header
+
+
+def _write_test_image(path, width=64, height=48):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, : width // 2] = (0, 128, 255)
+    assert cv2.imwrite(str(path), image)
+
+
+def test_header_probe_matches_decode(tmp_path):
+    """JPEG / PNG / BMP 文件头解析结果应与 cv2.imread 一致"""
+    for ext in ("jpg", "png", "bmp"):
+        path = tmp_path / f"sample.{ext}"
+        _write_test_image(path)
+
+        metadata = probe_image(str(path))
+        decoded = cv2.imread(str(path))
+
+        assert metadata.probe_method == "header"
+        assert (metadata.height, metadata.width) == decoded.shape[:2]
+
+
+def test_exif_orientation_swaps_dimensions(tmp_path):
+    """EXIF 方向为 6 时应返回旋转后的显示尺寸"""
+    path = tmp_path / "rotated.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new("RGB", (64, 48)).save(path, exif=exif)
+
+    metadata = probe_image(str(path))
+    decoded = cv2.imread(str(path))
+
+    assert metadata.orientation == 6
+    assert (metadata.width, metadata.height) == (48, 64)
+    assert (metadata.height, metadata.width) == decoded.shape[:2]
+
+
+def test_unrecognized_header_falls_back_to_decode(tmp_path):
+    """文件头无法识别时回退到完整解码，并报告走的是 decode 路径"""
+    webp_path = tmp_path / "sample.webp"
+    _write_test_image(webp_path)
+    path = tmp_path / "mislabeled.jpg"
+    webp_path.rename(path)
+
+    assert probe_image_header(str(path)) is None
+    metadata = probe_image(str(path))
+    assert metadata.probe_method == "decode"
+    assert (metadata.width, metadata.height) == (64, 48)
+
+
+def test_truncated_file_returns_none(tmp_path):
+    """截断的文件既无法解析文件头也无法解码"""
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"\xff\xd8\xff\xe0\x00")
+
+    assert probe_image(str(path)) is None
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多分辨率图像金字塔
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+from image_pyramid import ImagePyramid, choose_level
+
+
+def test_choose_level_covers_requested_size():
+    """max_side 取能覆盖的最小级别，超过最大级别时返回原图"""
+    assert choose_level(150) == "thumb"
+    assert choose_level(800) == "preview"
+    assert choose_level(1000) == "editor"
+    assert choose_level(4000) == "full"
+
+
+def test_levels_are_built_once_and_invalidated(tmp_path):
+    """级别按需生成后直接复用，原图变化后重新生成"""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    path = str(source_dir / "a.jpg")
+    assert cv2.imwrite(path, np.full((2400, 3600, 3), 120, dtype=np.uint8))
+
+    index = FileIndex(str(tmp_path / "index.db"), {"source": str(source_dir)})
+    index.reconcile("source")
+    pyramid = ImagePyramid(index, str(tmp_path / "proxies"), str(tmp_path / "thumbs"))
+
+    editor_path = pyramid.get_level("source", "a.jpg", "editor")
+    assert cv2.imread(editor_path).shape[:2] == (1067, 1600)
+    preview_path = pyramid.get_level("source", "a.jpg", "preview")
+    assert cv2.imread(preview_path).shape[:2] == (534, 800)
+    # 一次解码生成全部级别，再次请求不会重写文件
+    mtime = os.stat(preview_path).st_mtime_ns
+    assert pyramid.get_level("source", "a.jpg", "preview") == preview_path
+    assert os.stat(preview_path).st_mtime_ns == mtime
+    assert pyramid.get_level("source", "a.jpg", "full") == path
+
+    assert cv2.imwrite(path, np.full((1000, 3000, 3), 120, dtype=np.uint8))
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+    assert cv2.imread(pyramid.get_level("source", "a.jpg", "editor")).shape[:2] == (533, 1600)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 Deep Zoom 瓦片缓存
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+from image_pyramid import ImagePyramid
+from image_tiles import TileCache, estimate_level_bytes, get_level_size, get_max_level
+
+
+def test_level_geometry_matches_dzi():
+    """最高级别为原图分辨率，每低一级尺寸减半并向上取整"""
+    assert get_max_level(4500, 3000) == 13
+    assert get_level_size(4500, 3000, 13) == (4500, 3000)
+    assert get_level_size(4500, 3000, 12) == (2250, 1500)
+    assert get_level_size(4500, 3000, 0) == (1, 1)
+
+
+def test_level_memory_estimate_follows_the_raster_source():
+    """高级别按原图解码加级别栅格估算，不超过代理图尺寸的级别按 editor 代理图估算"""
+    assert estimate_level_bytes(4500, 3000, 13) == 4500 * 3000 * 3
+    assert estimate_level_bytes(4500, 3000, 12) == (4500 * 3000 + 2250 * 1500) * 3
+    assert estimate_level_bytes(4500, 3000, 0) < estimate_level_bytes(4500, 3000, 12)
+
+
+def test_tiles_are_built_per_level_and_invalidated(tmp_path):
+    """请求瓦片时生成所在级别，越界返回 None，原图变化后旧版本瓦片被清理"""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    path = str(source_dir / "scan.png")
+    image = np.zeros((1000, 1300, 3), dtype=np.uint8)
+    image[:, 256:512] = 255
+    assert cv2.imwrite(path, image)
+
+    index = FileIndex(str(tmp_path / "index.db"), {"source": str(source_dir)})
+    index.reconcile("source")
+    tiles = TileCache(index, ImagePyramid(index, str(tmp_path / "proxies"), str(tmp_path / "thumbs")),
+                      str(tmp_path / "tiles"))
+
+    info = tiles.info("source", "scan.png")
+    top = info["max_level"]
+    tile = cv2.imread(tiles.get_tile("source", "scan.png", top, 1, 0))
+    assert tile.shape == (256, 256, 3) and tile.mean() > 250
+    assert cv2.imread(tiles.get_tile("source", "scan.png", top, 5, 3)).shape == (1000 - 768, 1300 - 1280, 3)
+    assert tiles.get_tile("source", "scan.png", top, 6, 0) is None
+    assert tiles.get_tile("source", "scan.png", top + 1, 0, 0) is None
+    assert cv2.imread(tiles.get_tile("source", "scan.png", top - 3, 0, 0)).shape == (125, 163, 3)
+
+    assert cv2.imwrite(path, image[:500])
+    os.utime(path, ns=(1, 1))
+    assert tiles.get_tile("source", "scan.png", top, 0, 1) is not None
+    assert os.listdir(tmp_path / "tiles" / "scan.png") == [tiles.info("source", "scan.png")["version"]]
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试单次解码导入流程
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+from ingest import ingest_indexed_file, EDITOR_PROXY_SIZE, THUMBNAIL_SIZE
+
+
+def test_ingest_writes_all_derivatives(tmp_path):
+    """一次导入生成缩略图、代理图和检测结果，并写回索引"""
+    directories = {"source": str(tmp_path / "source")}
+    os.makedirs(directories["source"])
+    image = np.full((1800, 2400, 3), 40, dtype=np.uint8)
+    cv2.rectangle(image, (300, 200), (2100, 1600), (230, 230, 230), -1)
+    assert cv2.imwrite(os.path.join(directories["source"], "a.jpg"), image)
+
+    index = FileIndex(str(tmp_path / "index.db"), directories)
+    index.reconcile("source")
+    result = ingest_indexed_file(index, "source", "a.jpg", str(tmp_path / "thumbs"), str(tmp_path / "proxies"))
+
+    assert (result.width, result.height) == (2400, 1800)
+    assert max(cv2.imread(result.proxy_path).shape[:2]) == EDITOR_PROXY_SIZE
+    assert max(cv2.imread(result.thumbnail_path).shape[:2]) == THUMBNAIL_SIZE
+
+    record = index.get_file("source", "a.jpg")
+    assert (record["thumbnail_state"], record["ingest_state"]) == ("ready", "ready")
+    corners, confidence = FileIndex.get_detection(record)
+    assert corners == result.corners and confidence == result.confidence
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按预览尺寸直接生成的透视变换
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_processor
+from image_processor import (
+    four_point_transform,
+    get_target_size,
+    resize_image_for_preview,
+    set_jpeg_dpi,
+    transform_quad,
+)
+
+
+def test_scaled_transform_matches_full_resolution_warp():
+    """从缩小的金字塔级别直接采样到预览尺寸，与全分辨率变换再缩小的结果一致"""
+    y, x = np.mgrid[0:3000, 0:4000]
+    image = np.dstack([x % 256, y % 256, (x // 16 + y // 16) % 256]).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 8)
+    points = [[300, 200], [3700, 350], [3600, 2800], [250, 2700]]
+
+    expected = resize_image_for_preview(four_point_transform(image, points))
+    level = cv2.resize(image, (1600, 1200), interpolation=cv2.INTER_AREA)
+    warped = four_point_transform(level, points, max_size=800, source_size=(4000, 3000))
+
+    assert warped.shape == expected.shape
+    assert max(warped.shape[:2]) == 800
+    assert np.abs(warped.astype(int) - expected.astype(int)).mean() < 3
+
+
+def test_transform_without_max_size_keeps_full_resolution():
+    """不限制尺寸时输出全分辨率（裁剪路径）"""
+    image = np.zeros((400, 600, 3), dtype=np.uint8)
+    warped = four_point_transform(image, [[0, 0], [500, 0], [500, 300], [0, 300]], max_size=800)
+    assert warped.shape[:2] == (300, 500)
+
+
+def test_tiled_transform_matches_single_warp(monkeypatch):
+    """按条带并行变换的结果与整图变换一致（定点插值允许 1 的误差），条带完全落在图外时同样复制边缘"""
+    image = cv2.GaussianBlur((np.random.default_rng(0).random((900, 1200, 3)) * 255).astype(np.uint8), (0, 0), 2)
+    points = [[40, 30], [1150, 10], [1100, 880], [5, 850]]
+    expected = four_point_transform(image, points)
+
+    monkeypatch.setattr(image_processor, "TILED_WARP_MIN_PIXELS", 0)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        tiled = four_point_transform(image, points, executor=executor)
+        shift = np.array([[1, 0, -5000], [0, 1, 0], [0, 0, 1]], dtype="float64")
+        outside = image_processor.warp_perspective_tiled(image, shift, (100, 600), executor)
+
+    assert tiled.shape == expected.shape
+    assert np.abs(tiled.astype(int) - expected.astype(int)).max() <= 1
+    assert np.array_equal(outside, cv2.warpPerspective(image, shift, (100, 600), borderMode=cv2.BORDER_REPLICATE))
+
+
+def test_tiled_transform_runs_strips_with_single_opencv_thread():
+    """条带并行期间 OpenCV 内部为单线程，避免与条带线程相乘，结束后恢复原设置"""
+    observed = []
+
+    class RecordingExecutor:
+        def map(self, fn, items):
+            def run(item):
+                observed.append(cv2.getNumThreads())
+                return fn(item)
+            return map(run, items)
+
+    before = cv2.getNumThreads()
+    cv2.setNumThreads(4)
+    try:
+        image = np.zeros((600, 800, 3), dtype=np.uint8)
+        image_processor.warp_perspective_tiled(image, np.eye(3), (800, 600), RecordingExecutor(), strip_height=100)
+        assert observed == [1] * 6
+        assert cv2.getNumThreads() == 4
+    finally:
+        cv2.setNumThreads(before)
+
+
+def test_target_size_and_single_pass_downscale(tmp_path):
+    """输出尺寸按请求计算；大倍数缩小先经金字塔预缩小，细密纹理不产生混叠"""
+    assert get_target_size(4000, 3000) == (4000, 3000)
+    assert get_target_size(4000, 3000, output_width=1920, output_height=1080) == (1920, 1080)
+    assert get_target_size(4000, 3000, output_width=2000) == (2000, 1500)
+    assert get_target_size(4000, 3000, scale=0.5, max_side=1000) == (1000, 750)
+    assert get_target_size(400, 300, max_side=1000) == (400, 300)
+    with pytest.raises(ValueError):
+        get_target_size(0, 300, output_width=100)
+
+    # 1 像素棋盘格缩小 8 倍后应接近均匀的灰色
+    y, x = np.mgrid[0:2400, 0:3200]
+    image = np.dstack([((x + y) % 2 * 255).astype(np.uint8)] * 3)
+    points = [[0, 0], [3199, 0], [3199, 2399], [0, 2399]]
+    warped = four_point_transform(image, points, output_size=(400, 300))
+    assert warped.shape[:2] == (300, 400)
+    assert abs(warped.mean() - 127.5) < 2 and warped.std() < 2
+
+    path = str(tmp_path / "out.jpg")
+    assert cv2.imwrite(path, warped)
+    assert set_jpeg_dpi(path, 150)
+    from PIL import Image
+    with Image.open(path) as img:
+        assert tuple(round(v) for v in img.info["dpi"]) == (150, 150)
+
+
+def test_axis_aligned_quad_is_sliced_without_interpolation():
+    """轴对齐（含顺序旋转后的）矩形直接返回原图切片，与原图像素完全一致；需要缩放或倾斜时仍做透视变换"""
+    image = (np.random.default_rng(1).random((300, 400, 3)) * 255).astype(np.uint8)
+    image.flags.writeable = False
+
+    # 角点顺序对应旋转 90 度的标注，亚像素偏差在容差内
+    warped, method = transform_quad(image, [[350.2, 40], [350, 250.3], [20, 250], [20.1, 40.2]])
+    assert method == "roi"
+    assert np.shares_memory(warped, image)
+    assert np.array_equal(warped, image[40:250, 20:350])
+
+    assert transform_quad(image, [[20, 40], [350, 40], [350, 250], [20, 250]], max_size=200)[1] == "warp"
+    assert transform_quad(image, [[20, 40], [350, 45], [350, 250], [20, 250]])[1] == "warp"
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试处理进度计数的增量维护
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+from progress_events import ProgressBroker
+
+
+def _make_index(tmp_path, pending=2, processed=1):
+    directories = {name: str(tmp_path / name) for name in ("source", "processed", "output")}
+    for path in directories.values():
+        os.makedirs(path)
+    for i in range(pending):
+        _write_image(directories["source"], f"p{i}.jpg")
+    for i in range(processed):
+        _write_image(directories["processed"], f"d{i}.jpg")
+    index = FileIndex(str(tmp_path / "index.db"), directories)
+    index.reconcile_all()
+    return index, directories
+
+
+def _write_image(directory, filename):
+    assert cv2.imwrite(os.path.join(directory, filename), np.zeros((30, 40, 3), dtype=np.uint8))
+
+
+def _move(index, directories, filename, src, dst):
+    os.rename(os.path.join(directories[src], filename), os.path.join(directories[dst], filename))
+    index.move_file(src, filename, dst)
+
+
+def test_counts_follow_the_change_log(tmp_path):
+    """新增、移动和删除按变更日志增量更新计数，并广播对应的文件状态"""
+    index, directories = _make_index(tmp_path)
+    broker = ProgressBroker(index)
+    broker._recount()
+    assert (broker.pending_count, broker.processed_count) == (2, 1)
+    events = asyncio.Queue()
+    broker._subscribers.add(events)
+
+    _write_image(directories["source"], "new.jpg")
+    index.reconcile("source")
+    _move(index, directories, "p0.jpg", "source", "processed")
+    os.remove(os.path.join(directories["processed"], "d0.jpg"))
+    index.reconcile("processed")
+    # 移到不计数的目录只减少待处理数
+    _move(index, directories, "p1.jpg", "source", "output")
+
+    assert broker._drain_changes() is True
+    assert (broker.pending_count, broker.processed_count) == (1, 1)
+    assert broker._drain_changes() is False
+
+    published = []
+    while not events.empty():
+        published.append(events.get_nowait())
+    assert ("file", {"filename": "new.jpg", "state": "pending"}) in published
+    assert ("file", {"filename": "p0.jpg", "state": "processed", "processed_filename": "p0.jpg"}) in published
+
+
+def test_apply_change_handles_moves_in_both_directions(tmp_path):
+    """moved 记录从来源目录减一、向目标目录加一，撤回到 source 时待处理数恢复"""
+    index, _ = _make_index(tmp_path)
+    broker = ProgressBroker(index)
+    broker._recount()
+
+    def moved(src, dst):
+        broker._apply_change({"change_type": "moved", "directory": src, "filename": "x.jpg",
+                              "to_directory": dst, "to_filename": "x.jpg"})
+        return broker.pending_count, broker.processed_count
+
+    assert moved("source", "processed") == (1, 2)
+    assert moved("processed", "source") == (2, 1)
+    assert moved("output", "processed") == (2, 2)
+    broker._apply_change({"change_type": "modified", "directory": "source", "filename": "p0.jpg",
+                          "to_directory": None, "to_filename": None})
+    assert (broker.pending_count, broker.processed_count) == (2, 2)
+
+
+def test_recount_when_token_is_reset(tmp_path):
+    """跟踪的序号失效（日志被裁剪或数据库重建）时重新统计"""
+    index, _ = _make_index(tmp_path)
+    broker = ProgressBroker(index)
+    broker._recount()
+    broker.pending_count, broker._last_seq = 99, index.current_token() + 100
+
+    assert broker._drain_changes() is True
+    assert (broker.pending_count, broker.processed_count) == (2, 1)
+    assert broker._last_seq == index.current_token()
+
+
+def test_stream_publishes_progress_after_external_change(tmp_path):
+    """变更监听唤醒跟踪任务，订阅者收到更新后的进度快照"""
+    index, directories = _make_index(tmp_path)
+    broker = ProgressBroker(index)
+    index.add_listener(broker.notify)
+
+    async def scenario():
+        await broker.start()
+        stream = broker.stream()
+        try:
+            assert "\"pending_count\": 2" in await stream.__anext__()
+            _write_image(directories["source"], "late.jpg")
+            await asyncio.to_thread(index.reconcile, "source", True)
+            while True:
+                message = await asyncio.wait_for(stream.__anext__(), timeout=5)
+                if message.startswith("event: progress"):
+                    break
+            data = json.loads(message.split("data: ", 1)[1])
+            assert (data["pending_count"], data["processed_count"]) == (3, 1)
+        finally:
+            await stream.aclose()
+            await broker.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 JPEG 缩小解码
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processor import auto_detect_corners, get_reduction_factor, read_image_reduced
+
+
+def test_reduction_factor_still_covers_target():
+    """选择的缩小倍数解码后最大边不小于目标尺寸"""
+    assert get_reduction_factor(6000, 4000, 400) == 8
+    assert get_reduction_factor(3000, 2000, 400) == 4
+    assert get_reduction_factor(6000, 4000, 1600) == 2
+    assert get_reduction_factor(1000, 800, 1600) == 1
+
+
+def test_reduced_decode_maps_corners_to_original(tmp_path):
+    """JPEG 按检测尺寸缩小解码，PNG 保持完整解码；检测角点换算回原图坐标"""
+    image = np.full((2000, 3200, 3), 30, dtype=np.uint8)
+    cv2.rectangle(image, (400, 300), (2800, 1700), (230, 230, 230), -1)
+    jpeg_path = str(tmp_path / "a.jpg")
+    png_path = str(tmp_path / "a.png")
+    assert cv2.imwrite(jpeg_path, image) and cv2.imwrite(png_path, image)
+
+    reduced, size = read_image_reduced(jpeg_path, 400)
+    assert reduced.shape[:2] == (250, 400) and size == (3200, 2000)
+    assert read_image_reduced(png_path, 400)[0].shape[:2] == (2000, 3200)
+
+    corners, confidence = auto_detect_corners(jpeg_path)
+    assert confidence > 0.3
+    expected = [[400, 300], [2800, 300], [2800, 1700], [400, 1700]]
+    assert np.abs(np.array(corners) - expected).max() < 20
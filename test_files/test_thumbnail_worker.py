@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试后台缩略图线程池
+"""
+
+import asyncio
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+from thumbnail_worker import ThumbnailWorkerPool, PRIORITY_INTERACTIVE
+
+
+def test_pool_generates_thumbnails_for_new_files(tmp_path):
+    """新增文件经变更监听自动入队，重复提交合并为同一个任务，完成后回调通知"""
+    directories = {"source": str(tmp_path / "source"), "processed": str(tmp_path / "processed")}
+    for path in directories.values():
+        os.makedirs(path)
+    for i in range(3):
+        assert cv2.imwrite(os.path.join(directories["source"], f"img{i}.jpg"),
+                           np.full((300, 400, 3), 60 * i, dtype=np.uint8))
+
+    index = FileIndex(str(tmp_path / "index.db"), directories)
+    ready = []
+    pool = ThumbnailWorkerPool(index, str(tmp_path / "thumbs"), str(tmp_path / "proxies"), workers=2,
+                               on_ready=lambda directory, filename: ready.append(filename))
+    index.add_listener(pool.handle_change)
+    index.reconcile("source")
+    assert pool.pending_count() == 3
+
+    # 交互请求提升已排队任务的优先级，但不会产生第二个任务
+    futures = [pool.submit("source", f"img{i}.jpg") for i in range(3)]
+    assert pool.submit("source", "img2.jpg", PRIORITY_INTERACTIVE) is futures[2]
+
+    pool.start()
+    try:
+        assert futures[2].result(timeout=10).endswith("img2_thumb.jpg")
+        for future in futures:
+            future.result(timeout=10)
+    finally:
+        pool.stop()
+
+    assert sorted(ready) == ["img0.jpg", "img1.jpg", "img2.jpg"]
+    assert index.list_missing_thumbnails("source") == []
+    assert index.get_file("source", "img0.jpg")["ingest_state"] == "ready"
+
+
+def test_timed_out_wait_does_not_cancel_shared_future(tmp_path):
+    """等待超时只结束本次等待；已被取消的排队任务在下次提交时换成新的 Future"""
+    directories = {"source": str(tmp_path / "source")}
+    os.makedirs(directories["source"])
+    assert cv2.imwrite(os.path.join(directories["source"], "img.jpg"), np.zeros((300, 400, 3), dtype=np.uint8))
+    index = FileIndex(str(tmp_path / "index.db"), directories)
+    index.reconcile("source")
+    pool = ThumbnailWorkerPool(index, str(tmp_path / "thumbs"), str(tmp_path / "proxies"), workers=1)
+
+    async def wait(future, shield):
+        waiter = asyncio.wrap_future(future)
+        await asyncio.wait_for(asyncio.shield(waiter) if shield else waiter, 0.01)
+
+    shared = pool.submit("source", "img.jpg", PRIORITY_INTERACTIVE)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(wait(shared, shield=True))
+    assert not shared.cancelled()
+    assert pool.submit("source", "img.jpg") is shared
+
+    # 不经 shield 的等待超时会取消共享的 Future，后来的请求应得到新的任务
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(wait(shared, shield=False))
+    assert shared.cancelled()
+    replacement = pool.submit("source", "img.jpg", PRIORITY_INTERACTIVE)
+    assert replacement is not shared
+
+    pool.start()
+    try:
+        assert replacement.result(timeout=10).endswith("img_thumb.jpg")
+    finally:
+        pool.stop()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多操作员租约队列的分配、续租与过期
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_index import FileIndex
+from work_queue import LeaseQueue
+
+
+def _make_queue(tmp_path, count=3):
+    source = tmp_path / "source"
+    source.mkdir()
+    for i in range(count):
+        assert cv2.imwrite(str(source / f"img{i}.jpg"), np.zeros((10, 10, 3), dtype=np.uint8))
+    db_path = str(tmp_path / "index.db")
+    FileIndex(db_path, {"source": str(source)}).reconcile("source")
+    return LeaseQueue(db_path, "source")
+
+
+def test_operators_never_receive_the_same_file(tmp_path):
+    """不同操作员领取到的文件互不重复，重复领取是幂等的"""
+    queue = _make_queue(tmp_path)
+
+    alice, _ = queue.claim("alice")
+    bob, _ = queue.claim("bob")
+    assert alice != bob
+    assert queue.claim("alice")[0] == alice
+
+    carol, _ = queue.claim("carol")
+    assert carol not in (alice, bob)
+    assert queue.claim("dave") == (None, None)
+
+
+def test_renew_conflict_and_release(tmp_path):
+    """其他操作员持有租约时不能续租，释放后可以被再次领取"""
+    queue = _make_queue(tmp_path, count=1)
+
+    filename, _ = queue.claim("alice")
+    assert queue.renew(filename, "alice")
+    assert not queue.renew(filename, "bob")
+    assert queue.holder(filename) == "alice"
+
+    assert queue.release(filename, "alice")
+    assert queue.claim("bob")[0] == filename
+
+
+def test_expired_lease_is_reassigned(tmp_path):
+    """租约过期后文件重新进入队列"""
+    queue = _make_queue(tmp_path, count=1)
+
+    filename, _ = queue.claim("alice", ttl=-1)
+    assert queue.holder(filename) is None
+    assert queue.claim("bob")[0] == filename
@@ -0,0 +1,185 @@
+"""
+后台缩略图生成模块
+由固定数量的后台线程生成缩略图（待处理文件同时完成导入），请求处理函数只负责入队，
+列表接口立即返回 pending 状态，生成完成后通过回调通知前端
+"""
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from file_index import FileIndex
+from image_processor import generate_thumbnail, get_thumbnail_path
+from ingest import ingest_indexed_file
+
+
+# 默认后台线程数；OpenCV 解码和缩放会释放 GIL，少量线程即可占满几个核
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# 优先级：数值越小越先处理
+PRIORITY_INTERACTIVE = 0  # 用户正在查看的页面或直接请求的缩略图
+PRIORITY_BACKGROUND = 1   # 上传和目录同步产生的预生成任务
+
+
+class ThumbnailWorkerPool:
+    """
+    有界的缩略图后台线程池
+
+    同一文件在队列中只保留一个任务；交互请求会把已排队的后台任务提升为高优先级，
+    因此新放入 2000 张图片的文件夹时，首页缩略图不会排在整批预生成任务之后。
+    """
+
+    def __init__(self, index: FileIndex, thumbnail_dir: str, proxy_dir: str,
+                 workers: int = DEFAULT_WORKERS,
+                 on_ready: Optional[Callable[[str, str], None]] = None,
+                 engine=None):
+        """
+        Args:
+            index: 文件索引
+            thumbnail_dir: 缩略图目录
+            proxy_dir: 代理图目录
+            workers: 后台线程数
+            on_ready: 缩略图生成后的回调 (directory, filename)，在后台线程中调用
+            engine: ImageEngine 实例，传入时单独的缩略图生成在引擎进程中执行
+        """
+        self.index = index
+        self.thumbnail_dir = thumbnail_dir
+        self.proxy_dir = proxy_dir
+        self.workers = workers
+        self.on_ready = on_ready
+        self.engine = engine
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # (directory, filename) -> (priority, future)
+        self._pending: Dict[Tuple[str, str], Tuple[int, Future]] = {}
+        self._threads = []
+
+    def start(self):
+        """启动后台线程"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"thumbnail-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止后台线程（已排队但未开始的任务被丢弃）"""
+        for _ in self._threads:
+            self._queue.put((-1, next(self._counter), None))
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def submit(self, directory: str, filename: str, priority: int = PRIORITY_BACKGROUND) -> Future:
+        """
+        将文件加入缩略图生成队列
+
+        Returns:
+            Future: 完成时结果为缩略图路径，无法生成时为 None
+        """
+        key = (directory, filename)
+        with self._lock:
+            queued = self._pending.get(key)
+            if queued is not None and queued[1].cancelled():
+                # 调用方取消了排队中的任务：换成新的 Future 重新入队，不把已取消的结果交给后来的请求
+                queued = None
+            if queued is not None:
+                queued_priority, future = queued
+                if priority < queued_priority:
+                    # 重新以更高优先级入队，旧条目出队时发现已被处理会直接跳过
+                    self._pending[key] = (priority, future)
+                    self._queue.put((priority, next(self._counter), key))
+                return future
+            future = Future()
+            self._pending[key] = (priority, future)
+        self._queue.put((priority, next(self._counter), key))
+        return future
+
+    def backfill(self, directory: str) -> int:
+        """
+        将索引中尚未生成缩略图的文件全部加入后台队列（服务启动时调用）
+
+        Returns:
+            int: 入队的文件数
+        """
+        filenames = self.index.list_missing_thumbnails(directory)
+        for filename in filenames:
+            self.submit(directory, filename)
+        return len(filenames)
+
+    def pending_count(self) -> int:
+        """排队中的任务数"""
+        with self._lock:
+            return len(self._pending)
+
+    def handle_change(self, change: dict):
+        """
+        FileIndex 变更监听器：新增或修改的文件自动加入后台队列
+
+        监听器在持有索引锁的线程中调用，这里只做入队。
+        """
+        if change["change_type"] in ("added", "modified") and change["directory"] in ("source", "processed"):
+            self.submit(change["directory"], change["filename"])
+
+    def _worker(self):
+        while True:
+            _, _, key = self._queue.get()
+            if key is None:
+                return
+
+            with self._lock:
+                queued = self._pending.get(key)
+                if queued is None or queued[1].running():
+                    # 被提升优先级后留下的旧条目，任务已处理或正在处理
+                    continue
+                future = queued[1]
+                if not future.set_running_or_notify_cancel():
+                    self._pending.pop(key, None)
+                    continue
+
+            directory, filename = key
+            try:
+                result = self._generate(directory, filename)
+            except Exception as e:
+                print(f"缩略图生成失败 {filename}: {e}")
+                result = None
+
+            if result is not None and self.on_ready is not None:
+                try:
+                    self.on_ready(directory, filename)
+                except Exception as e:
+                    print(f"缩略图完成回调失败: {e}")
+
+            with self._lock:
+                self._pending.pop(key, None)
+            future.set_result(result)
+
+    def _generate(self, directory: str, filename: str) -> Optional[str]:
+        """生成单个文件的缩略图，返回缩略图路径"""
+        record = self.index.get_file(directory, filename, refresh=True)
+        if record is None:
+            return None
+
+        # 待处理文件走单次解码的导入流程，同时生成代理图和检测结果
+        if directory == "source" and record["ingest_state"] == "none":
+            result = ingest_indexed_file(self.index, directory, filename, self.thumbnail_dir, self.proxy_dir)
+            return result.thumbnail_path if result is not None else None
+
+        thumbnail_path = get_thumbnail_path(filename, self.thumbnail_dir)
+        if record["thumbnail_state"] == "ready" and os.path.exists(thumbnail_path):
+            return thumbnail_path
+
+        image_path = os.path.join(self.index.directories[directory], filename)
+        if self.engine is not None:
+            generated = self.engine.call("thumbnail", image_path, thumbnail_path)
+        else:
+            generated = generate_thumbnail(image_path, thumbnail_path)
+        if generated:
+            self.index.set_thumbnail_state(directory, filename, "ready")
+            return thumbnail_path
+        self.index.set_thumbnail_state(directory, filename, "failed")
+        return None
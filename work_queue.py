@@ -0,0 +1,177 @@
+"""
+待处理文件租约队列模块
+多名操作员同时工作时，/api/next-file 原子地分配一个未被领取的文件并加上有效期租约，
+预览/自动检测时续租，裁剪完成或超时后释放，避免两人处理同一张图片
+"""
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+# 默认租约有效期（秒）
+DEFAULT_LEASE_TTL = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    filename TEXT PRIMARY KEY,
+    operator TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_expires ON leases (expires_at);
+"""
+
+
+class LeaseQueue:
+    """
+    基于 SQLite 的租约工作队列
+
+    与 FileIndex 共用同一个数据库文件：待处理文件按 (directory, filename) 主键的 B 树顺序选取，
+    领取在 BEGIN IMMEDIATE 事务中完成，因此多个 worker 进程之间也是原子的。
+    """
+
+    def __init__(self, db_path: str, directory: str = "source"):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径（与 FileIndex 相同）
+            directory: 分配文件所在的索引目录角色
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def claim(self, operator: str, ttl: float = DEFAULT_LEASE_TTL,
+              exclude: Optional[str] = None) -> Tuple[Optional[str], Optional[float]]:
+        """
+        为操作员领取下一个未被占用的文件
+
+        操作员已持有有效租约时直接返回该文件（重复调用是幂等的）；
+        否则按文件名顺序选取第一个没有有效租约的文件。
+
+        Args:
+            operator: 操作员标识
+            ttl: 租约有效期（秒）
+            exclude: 需要跳过的文件（例如刚处理完的当前文件）
+
+        Returns:
+            tuple: (文件名, 租约到期时间戳)，没有可分配的文件时返回 (None, None)
+        """
+        now = time.time()
+        expires_at = now + ttl
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 清理过期租约
+                self._conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+
+                held = self._conn.execute(
+                    """
+                    SELECT l.filename FROM leases l
+                    JOIN files f ON f.directory = ? AND f.filename = l.filename
+                    WHERE l.operator = ? AND l.filename != ?
+                    ORDER BY l.filename LIMIT 1
+                    """,
+                    (self.directory, operator, exclude or ""),
+                ).fetchone()
+
+                if held is not None:
+                    filename = held["filename"]
+                else:
+                    # 沿主键索引顺序查找，只需跳过正在被占用的少量文件
+                    row = self._conn.execute(
+                        """
+                        SELECT f.filename FROM files f
+                        WHERE f.directory = ? AND f.filename != ?
+                          AND NOT EXISTS (SELECT 1 FROM leases l WHERE l.filename = f.filename)
+                        ORDER BY f.filename LIMIT 1
+                        """,
+                        (self.directory, exclude or ""),
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None, None
+                    filename = row["filename"]
+
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (filename, operator, expires_at) VALUES (?, ?, ?)",
+                    (filename, operator, expires_at),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return filename, expires_at
+
+    def renew(self, filename: str, operator: str, ttl: float = DEFAULT_LEASE_TTL) -> bool:
+        """
+        续租；文件当前无人领取时由该操作员领取
+
+        Returns:
+            bool: 续租成功返回 True，文件被其他操作员持有有效租约时返回 False
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT operator, expires_at FROM leases WHERE filename = ?", (filename,)
+                ).fetchone()
+                if row is not None and row["operator"] != operator and row["expires_at"] > now:
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (filename, operator, expires_at) VALUES (?, ?, ?)",
+                    (filename, operator, now + ttl),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def release(self, filename: str, operator: Optional[str] = None) -> bool:
+        """
+        释放租约
+
+        Args:
+            filename: 文件名
+            operator: 指定时只释放该操作员持有的租约
+
+        Returns:
+            bool: 是否有租约被释放
+        """
+        with self._lock:
+            if operator is None:
+                cursor = self._conn.execute("DELETE FROM leases WHERE filename = ?", (filename,))
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM leases WHERE filename = ? AND operator = ?", (filename, operator)
+                )
+        return cursor.rowcount > 0
+
+    def holder(self, filename: str) -> Optional[str]:
+        """返回持有该文件有效租约的操作员，没有时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT operator FROM leases WHERE filename = ? AND expires_at > ?", (filename, time.time())
+            ).fetchone()
+        return row["operator"] if row else None
+
+    def active_count(self, exclude_operator: Optional[str] = None) -> int:
+        """统计有效租约数量（可排除指定操作员持有的租约）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM leases WHERE expires_at > ? AND operator != ?",
+                (time.time(), exclude_operator or ""),
+            ).fetchone()
+        return row[0]